@@ -0,0 +1,46 @@
+"""
+Benchmarks the vectorized text cleaning path against the per-cell `clean_text` apply
+and checks that both produce identical output.
+
+Usage:
+    python benchmarks/bench_clean_text.py [--rows 200000] [--workers 1]
+"""
+import argparse
+import time
+import numpy as np
+import pandas as pd
+from telcoresq.app.services.data_processing import clean_text, clean_series
+
+SAMPLE_CSV = "telcoresq/data/sample/sample_telecom_resilience_survey.csv"
+
+def make_column(rows, seed=0):
+    """Builds a survey-like text column from the sample responses, with some non-string cells."""
+    base = pd.read_csv(SAMPLE_CSV)["overall_feedback"].tolist()
+    base += ["Tower TWR-0042 went down!!", "  ÉTÉ: coverage — patchy…  ", "ΣΊΣΥΦΟΣ", "", None, 42, float("nan")]
+    rng = np.random.default_rng(seed)
+    return pd.Series([base[i] for i in rng.integers(0, len(base), rows)], dtype=object)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rows", type=int, default=200000)
+    parser.add_argument("--workers", type=int, default=1)
+    args = parser.parse_args()
+
+    column = make_column(args.rows)
+
+    start = time.perf_counter()
+    expected = column.apply(clean_text)
+    apply_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    cleaned = clean_series(column, workers=args.workers)
+    vectorized_seconds = time.perf_counter() - start
+
+    assert cleaned.tolist() == expected.tolist(), "clean_series output differs from clean_text"
+    print(f"rows:            {args.rows}")
+    print(f"apply(clean_text): {apply_seconds:.3f}s")
+    print(f"clean_series:      {vectorized_seconds:.3f}s ({apply_seconds / vectorized_seconds:.1f}x faster)")
+    print("outputs identical")
+
+if __name__ == "__main__":
+    main()
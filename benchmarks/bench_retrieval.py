@@ -0,0 +1,111 @@
+"""
+Benchmarks dense, BM25 and hybrid (reciprocal rank fusion) retrieval on a synthetic
+survey corpus in which some responses mention a tower id, and reports recall@k and
+query latency. Each query asks about one tower id; the relevant response is the one
+that mentions it.
+
+Vectors come from a deterministic hashed bag-of-words embedder, so the benchmark runs
+offline. Like a real embedding model, it captures the topic of a response but gives a
+rare token such as an id little weight.
+
+Usage:
+    python benchmarks/bench_retrieval.py [--rows 20000] [--queries 200] [--k 1 3 10]
+"""
+import argparse
+import hashlib
+import tempfile
+import time
+import numpy as np
+import pandas as pd
+from telcoresq.app.services import database
+from telcoresq.app.services.data_processing import clean_series
+from telcoresq.app.services.lexical_index import tokenize
+from telcoresq.app.services.vector_store import SurveyVectorStore
+
+SAMPLE_CSV = "telcoresq/data/sample/sample_telecom_resilience_survey.csv"
+DIMENSION = 64
+
+def _word_vector(word):
+    seed = int.from_bytes(hashlib.blake2b(word.encode("utf-8"), digest_size=8).digest(), "little")
+    return np.random.default_rng(seed).standard_normal(DIMENSION).astype(np.float32)
+
+def embed(texts):
+    """Averages per-word random vectors: a stand-in for a real embedding model."""
+    vectors = []
+    for text in texts:
+        words = tokenize(text)
+        vectors.append(np.mean([_word_vector(word) for word in words], axis=0).tolist() if words else None)
+    return vectors
+
+def make_corpus(rows, seed=0):
+    """Builds survey-like responses; every fifth one mentions a unique tower id."""
+    base = pd.read_csv(SAMPLE_CSV)["overall_feedback"].dropna().tolist()
+    rng = np.random.default_rng(seed)
+    texts, towers = [], {}
+    for row, choice in enumerate(rng.integers(0, len(base), rows)):
+        text = base[choice]
+        if row % 5 == 0:
+            tower = f"TWR-{row:06d}"
+            text = f"{text} The outage was at tower {tower}."
+            towers[tower] = row
+        texts.append(text)
+    return clean_series(pd.Series(texts, dtype=object)).tolist(), towers
+
+def run(store, queries, targets, k_values, search):
+    """Returns recall@k for each k and latency percentiles in milliseconds."""
+    found = {k: 0 for k in k_values}
+    latencies = []
+    for query, target in zip(queries, targets):
+        started = time.perf_counter()
+        hits = search(query, max(k_values))
+        latencies.append((time.perf_counter() - started) * 1000)
+        ranked = [hit["response_id"] for hit in hits]
+        for k in k_values:
+            found[k] += target in ranked[:k]
+    recall = {k: found[k] / len(queries) for k in k_values}
+    return recall, np.percentile(latencies, 50), np.percentile(latencies, 95)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rows", type=int, default=20000)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, nargs="+", default=[1, 3, 10])
+    parser.add_argument("--reranker", default="", help="Optional cross-encoder model for the hybrid run.")
+    args = parser.parse_args()
+
+    texts, towers = make_corpus(args.rows)
+    ids = list(range(args.rows))
+    with tempfile.TemporaryDirectory() as directory:
+        engine = database.get_engine(f"sqlite:///{directory}/bench.db")
+        store = SurveyVectorStore(engine, index_path=f"{directory}/index")
+
+        started = time.perf_counter()
+        store.sync(ids, texts, embed)
+        print(f"Indexed {args.rows} responses in {time.perf_counter() - started:.2f}s")
+
+        # Incremental update: 1% of the responses change.
+        changed = texts[:]
+        for row in range(0, args.rows, 100):
+            changed[row] = f"{changed[row]} updated"
+        started = time.perf_counter()
+        stats = store.sync(ids, changed, embed)
+        print(f"Incremental sync ({stats['updated']} updated): {time.perf_counter() - started:.2f}s")
+
+        rng = np.random.default_rng(1)
+        sample = rng.choice(sorted(towers), size=min(args.queries, len(towers)), replace=False)
+        queries = [f"What happened at tower {tower}?" for tower in sample]
+        targets = [towers[tower] for tower in sample]
+        query_vectors = dict(zip(queries, embed(queries)))
+
+        searches = {
+            "dense": lambda query, k: store.search(query_vectors[query], k=k),
+            "bm25": lambda query, k: store.lexical_search(query, k=k),
+            "hybrid": lambda query, k: store.hybrid_search(query, query_vectors[query], k=k, reranker=args.reranker),
+        }
+        print(f"\n{'mode':<8}" + "".join(f"{f'recall@{k}':>11}" for k in args.k) + f"{'p50 ms':>9}{'p95 ms':>9}")
+        for name, search in searches.items():
+            recall, p50, p95 = run(store, queries, targets, args.k, search)
+            print(f"{name:<8}" + "".join(f"{recall[k]:>11.3f}" for k in args.k) + f"{p50:>9.2f}{p95:>9.2f}")
+
+if __name__ == "__main__":
+    main()
@@ -1,68 +1,232 @@
-import pandas as pd
+"""
+Converts a fixed-width CPS .dat file to Parquet using a record layout file.
+
+The file is memory-mapped and viewed as a (records x record length) byte matrix, so
+every column is sliced and parsed with vectorized NumPy operations instead of being
+split line by line. Row ranges are converted in parallel worker processes and written
+as Parquet row groups with compact types: integers of the smallest width that fits the
+field, and coded answers as categoricals. Parquet is columnar, so the app reads only
+the columns it needs.
+
+Usage:
+    python convert_dat.py [dat_file] [--layout telcoresq/data/layouts/cps_nov2023.csv]
+                          [--output telcoresq/data/sample/ntia_survey_nov2023.parquet]
+                          [--columns HEFAMINC PRTAGE PESEX] [--chunk-rows 50000] [--workers 4]
+
+The layout is either a CSV file with `name,start,end[,type]` rows (1-based, inclusive
+positions, as in the Census technical documentation) or the Census data dictionary
+text file itself, which covers all 400+ variables.
+"""
+import argparse
+import functools
+import json
 import os
+import re
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+
+DEFAULT_DAT_PATH = os.path.expanduser('~/Downloads/nov23-cps-raw/nov23-dataset.dat')
+DEFAULT_LAYOUT_PATH = 'telcoresq/data/layouts/cps_nov2023.csv'
+DEFAULT_OUTPUT_PATH = 'telcoresq/data/sample/ntia_survey_nov2023.parquet'
+COLUMN_TYPES = ("int", "category", "str")
+# Schema metadata listing the columns to load as categoricals (Parquet keeps their integer codes)
+CATEGORICAL_METADATA_KEY = b"telcoresq:categorical"
+
+# A variable line of the Census data dictionary: NAME  SIZE  DESCRIPTION  START - END
+_DICTIONARY_LINE = re.compile(r'^\s*([A-Z][A-Z0-9_]*)\s+(\d+)\s+(.*?)\s+(\d+)\s*-\s*(\d+)\s*$')
 
-def convert_dat_to_csv():
+def load_layout(path):
     """
-    Converts the November 2023 CPS .dat file to a .csv file
-    using the layout from the official technical documentation.
+    Reads a record layout as a list of (name, start, end, type) with 0-based, end-exclusive
+    byte offsets. CSV layouts have `name,start,end` and an optional `type` column ("int"
+    by default); any other file is parsed as a Census data dictionary, whose variables
+    are all read as integers.
     """
-    # Path to the raw .dat file in the user's Downloads folder
-    dat_file_path = os.path.expanduser('~/Downloads/nov23-cps-raw/nov23-dataset.dat')
-    
-    # Path for the output CSV file within our project structure
-    csv_file_path = 'telcoresq/data/sample/ntia_survey_nov2023.csv'
-
-    # Data layout for the November 2023 CPS survey.
-    # This is based on the official PDF documentation.
-    # Format: { 'column_name': (start_position - 1, end_position) }
-    # Pandas uses 0-based indexing for start/end positions.
-    layout = {
-        'HRHHID': (0, 15),
-        'HRMONTH': (15, 17),
-        'HRYEAR4': (17, 21),
-        # ... many more columns will go here
-    }
-
-    # For this script, we'll only extract a few key columns to start.
-    # A full conversion would require defining all 400+ columns.
-    # We will focus on columns relevant to demographics and internet use.
-
-    # Let's find some relevant columns from the documentation (this is a simulated step)
-    # Example: Let's assume we found a 'feedback' or 'opinion' column for our app.
-    # For now, we'll just use some basic demographic data.
-    
-    final_layout = [
-        ('HRHHID', (0, 15)),
-        ('HRMONTH', (15, 17)),
-        ('HRYEAR4', (17, 21)),
-        ('HEHOUSUT', (54, 56)),  # Household type
-        ('HEFAMINC', (61, 63)),  # Family income
-        ('PRTAGE', (120, 122)), # Age
-        ('PESEX', (149, 151)),   # Sex
-        # This is where we would add internet-related questions if we had the full dictionary.
-        # For the purpose of getting a usable CSV, we'll stop here.
-    ]
-    
-    col_specs = [(start, end) for name, (start, end) in final_layout]
-    col_names = [name for name, (start, end) in final_layout]
+    if path.endswith('.csv'):
+        df = pd.read_csv(path, comment='#', skipinitialspace=True)
+        if 'type' not in df.columns:
+            df['type'] = 'int'
+        rows = [(row.name, int(row.start), int(row.end), row.type) for row in df.itertuples(index=False)]
+    else:
+        rows = []
+        with open(path, encoding='latin-1') as f:
+            for line in f:
+                match = _DICTIONARY_LINE.match(line)
+                # The size check skips description lines that happen to end in a range.
+                if match and int(match.group(5)) - int(match.group(4)) + 1 == int(match.group(2)):
+                    rows.append((match.group(1), int(match.group(4)), int(match.group(5)), 'int'))
+
+    layout, seen = [], set()
+    for name, start, end, kind in rows:
+        if kind not in COLUMN_TYPES:
+            raise ValueError(f"Column '{name}' has unknown type '{kind}' (expected one of {', '.join(COLUMN_TYPES)}).")
+        if start < 1 or end < start:
+            raise ValueError(f"Column '{name}' has an invalid position {start}-{end}.")
+        if name in seen:
+            # Dictionaries list some variables twice (e.g. in an appendix); keep the first.
+            continue
+        seen.add(name)
+        layout.append((name, start - 1, end, kind))
+    if not layout:
+        raise ValueError(f"No columns found in the layout file {path}.")
+    return layout
+
+def _integer_type(width):
+    """The smallest Arrow integer type that holds any `width`-character field."""
+    if width <= 2:
+        return pa.int8()
+    if width <= 4:
+        return pa.int16()
+    if width <= 9:
+        return pa.int32()
+    return pa.int64()
+
+def layout_schema(layout):
+    """
+    The Parquet schema of a converted layout. Its pandas metadata makes integer columns
+    load as nullable pandas integers of the same width, and the names of the categorical
+    columns are listed under `CATEGORICAL_METADATA_KEY`.
+    """
+    types = [pa.string() if kind == "str" or end - start > 18 else _integer_type(end - start)
+             for _, start, end, kind in layout]
+    empty = pd.DataFrame({
+        name: pd.Series(dtype=object if pa.types.is_string(value_type) else f"Int{value_type.bit_width}")
+        for (name, _, _, _), value_type in zip(layout, types)
+    })
+    schema = pa.Table.from_pandas(
+        empty, schema=pa.schema(list(zip([name for name, _, _, _ in layout], types))), preserve_index=False
+    ).schema
+    categorical = [name for name, _, _, kind in layout if kind == "category"]
+    return schema.with_metadata({**schema.metadata, CATEGORICAL_METADATA_KEY: json.dumps(categorical).encode()})
+
+def _record_format(data):
+    """Returns the record length (including the line terminator) and the terminator bytes."""
+    newlines = np.flatnonzero(data[:1 << 20] == 10)
+    if not len(newlines):
+        raise ValueError("No line break found: the file does not look like a fixed-width text file.")
+    length = int(newlines[0]) + 1
+    terminator = b"\r\n" if length > 1 and data[length - 2] == 13 else b"\n"
+    return length, terminator
+
+def _parse_integers(fields):
+    """
+    Parses a (records x width) matrix of ASCII bytes as right- or left-aligned integers.
+    Returns the values, a mask of fields that hold a number and the number of fields
+    with characters other than digits, spaces and a minus sign (which are treated as missing).
+    """
+    is_digit = (fields >= 48) & (fields <= 57)
+    is_minus = fields == 45
+    values = np.zeros(len(fields), dtype=np.int64)
+    for position in range(fields.shape[1]):
+        values = np.where(is_digit[:, position], values * 10 + (fields[:, position] - 48), values)
+    values[is_minus.any(axis=1)] *= -1
+    invalid = ~(is_digit | is_minus | (fields == 32)).all(axis=1)
+    return values, is_digit.any(axis=1) & ~invalid, int(invalid.sum())
+
+def _convert_rows(dat_path, layout, record_length, terminator, start_row, stop_row):
+    """Converts records [start_row, stop_row) to an Arrow table; runs in a worker process."""
+    data = np.memmap(dat_path, dtype=np.uint8, mode='r')
+    chunk = data[start_row * record_length:stop_row * record_length]
+    missing = (stop_row - start_row) * record_length - len(chunk)
+    if missing:
+        # The last record may lack its line terminator.
+        if missing > len(terminator):
+            raise ValueError(f"Record {stop_row} is shorter than the record length of {record_length} bytes.")
+        chunk = np.concatenate([chunk, np.frombuffer(terminator[-missing:], dtype=np.uint8)])
+    records = chunk.reshape(stop_row - start_row, record_length)
+    broken = np.flatnonzero(records[:, -1] != 10)
+    if len(broken):
+        raise ValueError(
+            f"Record {start_row + int(broken[0]) + 1} does not end at byte {record_length}: "
+            "the file is not fixed-width or has mixed line lengths."
+        )
+
+    schema = layout_schema(layout)
+    arrays, invalid = [], {}
+    for (name, start, end, kind), field in zip(layout, schema):
+        fields = records[:, start:end]
+        value_type = field.type
+        if pa.types.is_string(value_type):
+            raw = pa.array(np.ascontiguousarray(fields).view(f"S{end - start}").ravel(), type=pa.binary(end - start))
+            text = pc.utf8_trim_whitespace(raw.cast(pa.string()))
+            array = pc.if_else(pc.equal(text, ""), pa.scalar(None, pa.string()), text)
+        else:
+            values, present, invalid_count = _parse_integers(fields)
+            array = pa.array(values.astype(value_type.to_pandas_dtype()), mask=~present, type=value_type)
+            if invalid_count:
+                invalid[name] = invalid_count
+        arrays.append(array)
+    return pa.Table.from_arrays(arrays, schema=schema), invalid
+
+def convert_dat(dat_path, layout, output_path, columns=None, chunk_rows=50000, workers=None):
+    """
+    Converts the fixed-width file at `dat_path` to Parquet at `output_path` using `layout`
+    (see `load_layout`), optionally keeping only `columns`. Row ranges of `chunk_rows`
+    records are converted by up to `workers` processes (default: one per CPU) and written
+    in order, one row group each. Returns the number of records and the per-column count
+    of fields that could not be parsed as numbers.
+    """
+    if columns:
+        unknown = set(columns) - {name for name, _, _, _ in layout}
+        if unknown:
+            raise ValueError(f"Columns not in the layout: {', '.join(sorted(unknown))}")
+        layout = [column for column in layout if column[0] in set(columns)]
+
+    data = np.memmap(dat_path, dtype=np.uint8, mode='r')
+    record_length, terminator = _record_format(data)
+    too_long = [name for name, _, end, _ in layout if end > record_length - len(terminator)]
+    if too_long:
+        raise ValueError(f"Columns extend past the {record_length - len(terminator)}-byte record: {', '.join(too_long)}")
+    rows = -(-len(data) // record_length)
+    del data
+
+    os.makedirs(os.path.dirname(output_path) or '.', exist_ok=True)
+    convert = functools.partial(_convert_rows, dat_path, layout, record_length, terminator)
+    starts = range(0, rows, chunk_rows)
+    invalid = {}
+    # Written to a temporary file first, so a failed conversion never leaves a partial output.
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        with pq.ParquetWriter(f"{output_path}.tmp", layout_schema(layout), compression='zstd') as writer:
+            for table, chunk_invalid in executor.map(convert, starts, [min(start + chunk_rows, rows) for start in starts]):
+                writer.write_table(table)
+                for name, count in chunk_invalid.items():
+                    invalid[name] = invalid.get(name, 0) + count
+    os.replace(f"{output_path}.tmp", output_path)
+    return rows, invalid
+
+def main():
+    parser = argparse.ArgumentParser(description="Convert a fixed-width CPS .dat file to Parquet.")
+    parser.add_argument('dat_file', nargs='?', default=DEFAULT_DAT_PATH)
+    parser.add_argument('--layout', default=DEFAULT_LAYOUT_PATH, help="Layout CSV or Census data dictionary.")
+    parser.add_argument('--output', default=DEFAULT_OUTPUT_PATH)
+    parser.add_argument('--columns', nargs='+', help="Only convert these columns.")
+    parser.add_argument('--chunk-rows', type=int, default=50000)
+    parser.add_argument('--workers', type=int, help="Worker processes (default: one per CPU).")
+    args = parser.parse_args()
 
     print("Starting conversion...")
     try:
-        # Read the fixed-width file using the specified layout
-        df = pd.read_fwf(dat_file_path, colspecs=col_specs, names=col_names, header=None)
-
-        # Save the DataFrame to a CSV file
-        os.makedirs(os.path.dirname(csv_file_path), exist_ok=True)
-        df.to_csv(csv_file_path, index=False)
-        
-        print(f"Successfully converted a subset of the data to {csv_file_path}")
-        print("You can now upload this file to the TelcoResQ application.")
-
-    except FileNotFoundError:
-        print(f"ERROR: The file was not found at {dat_file_path}")
-        print("Please ensure the 'nov23-cps-raw' directory is in your Downloads folder.")
+        layout = load_layout(args.layout)
+        rows, invalid = convert_dat(
+            args.dat_file, layout, args.output, columns=args.columns,
+            chunk_rows=args.chunk_rows, workers=args.workers
+        )
+    except FileNotFoundError as e:
+        print(f"ERROR: The file was not found: {e.filename}")
+        print("Please ensure the 'nov23-cps-raw' directory is in your Downloads folder, or pass the .dat path.")
+        return
     except Exception as e:
         print(f"An error occurred during conversion: {e}")
+        return
+
+    for name, count in invalid.items():
+        print(f"Warning: {count} values of {name} are not numbers and were stored as missing.")
+    print(f"Successfully converted {rows} records ({len(args.columns or layout)} columns) to {args.output}")
+    print("You can now upload this file to the TelcoResQ application.")
 
 if __name__ == '__main__':
-    convert_dat_to_csv() 
\ No newline at end of file
+    main()
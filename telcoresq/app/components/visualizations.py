@@ -1,15 +1,18 @@
 import plotly.express as px
 import pandas as pd
-import re
 
-def create_sentiment_pie_chart(df, sentiment_col='sentiment_label'):
+def create_sentiment_pie_chart(df, sentiment_col='sentiment_label', count_col=None):
     """
     Creates a pie chart of sentiment distribution.
+    `df` holds one row per response, or pre-aggregated counts in `count_col`.
     """
     if sentiment_col not in df.columns:
         return None
     
-    sentiment_counts = df[sentiment_col].value_counts()
+    if count_col:
+        sentiment_counts = df.groupby(sentiment_col)[count_col].sum()
+    else:
+        sentiment_counts = df[sentiment_col].value_counts()
     fig = px.pie(
         values=sentiment_counts.values, 
         names=sentiment_counts.index, 
@@ -18,28 +21,18 @@ def create_sentiment_pie_chart(df, sentiment_col='sentiment_label'):
     )
     return fig 
 
-def parse_themes_to_df(themes_text):
+def parse_themes_to_df(themes):
     """
-    Parses the raw text output of theme extraction into a DataFrame.
-    Assumes themes are listed line by line, potentially with descriptions.
-    e.g., "Theme 1: Description" or "- Theme 1"
+    Converts the theme list returned by `extract_themes` into a DataFrame of themes and
+    their frequencies (the number of responses assigned to each theme).
     """
-    if not themes_text:
+    if not themes:
         return pd.DataFrame(columns=['theme', 'count'])
 
-    # A simple regex to capture theme names, trying to be flexible
-    theme_lines = re.findall(r'^(?:-|\*|\d+\.)\s*(.*?)(?::|$)', themes_text, re.MULTILINE)
-    
-    if not theme_lines:
-        # Fallback for simple line splits
-        theme_lines = themes_text.strip().split('\n')
-
-    # For this visualization, we assume each mention is a "frequency" of 1
-    # A more advanced implementation would count actual occurrences
-    theme_counts = pd.Series(theme_lines).value_counts().reset_index()
-    theme_counts.columns = ['theme', 'count']
-    return theme_counts
-
+    return pd.DataFrame(
+        [(theme['name'], theme['frequency']) for theme in themes],
+        columns=['theme', 'count']
+    )
 
 def create_theme_frequency_bar_chart(themes_df):
     """
@@ -57,4 +50,23 @@ def create_theme_frequency_bar_chart(themes_df):
         labels={'count': 'Frequency', 'theme': 'Theme'}
     )
     fig.update_layout(yaxis={'categoryorder':'total ascending'})
-    return fig 
\ No newline at end of file
+    return fig 
+
+def create_dimension_sentiment_bar_chart(df, dimension, sentiment_col='sentiment_label', count_col='responses'):
+    """
+    Creates a stacked bar chart of the sentiment of responses by `dimension`
+    (e.g. a demographic attribute), from pre-aggregated counts in `count_col`.
+    """
+    if df.empty or dimension not in df.columns:
+        return None
+
+    fig = px.bar(
+        df,
+        x=dimension,
+        y=count_col,
+        color=sentiment_col,
+        title=f'Sentiment by {dimension}',
+        labels={count_col: 'Responses', sentiment_col: 'Sentiment'}
+    )
+    fig.update_layout(barmode='stack', xaxis={'type': 'category'})
+    return fig
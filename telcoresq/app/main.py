@@ -1,29 +1,93 @@
 import streamlit as st
-from telcoresq.app.services.data_processing import parse_file, preprocess_dataframe
+from telcoresq.app.services.data_processing import (
+    parse_file, iter_file_chunks, preprocess_dataframe, make_response_ids, clean_series,
+    ARROW_STRING, compact_dataframe, dataset_hash, text_columns
+)
+from telcoresq.app.services import database
+from telcoresq.app.services.pipeline import ingest_stream, list_jobs
 from telcoresq.app.services.ai_services import (
-    get_embeddings, get_sentiment, get_themes, get_summary, 
-    search_similar_responses, get_answer_from_context
+    get_embeddings, analyze_sentiments_grouped, extract_themes, get_summary, 
+    stream_answer_query, answer_queries
 )
-from telcoresq.app.services.vector_store import create_faiss_index, save_faiss_index, load_faiss_index
+from telcoresq.app.services.embedding_cache import get_embedding_cache
+from telcoresq.app.services.query_cache import get_query_cache
+from telcoresq.app.services.reports import build_report, sentiment_theme_counts
+from telcoresq.app.services.aggregates import build_aggregates, dimension_columns, filter_mask, load_aggregates, rollup
+from telcoresq.app.services.vector_store import SurveyVectorStore, describe_index, index_version
 from telcoresq.app.components.visualizations import (
     create_sentiment_pie_chart, 
     create_theme_frequency_bar_chart,
+    create_dimension_sentiment_bar_chart,
     parse_themes_to_df
 )
+from telcoresq.app.utils import metrics
+from telcoresq.app.utils.memory import format_bytes, memory_usage, session_memory
 from telcoresq.config import settings
+import time
 import pandas as pd
+import pyarrow.parquet as pq
+
+@st.cache_resource(show_spinner=False, max_entries=settings.DATASET_CACHE_ENTRIES)
+def load_dataset(content_hash, columns, _uploaded_file):
+    """
+    Parses an upload into a memory-compact DataFrame (see `compact_dataframe`) once per
+    content hash and column selection. The frame is shared by every rerun and session,
+    so it must not be modified.
+    """
+    _uploaded_file.seek(0)
+    return compact_dataframe(parse_file(_uploaded_file, columns=list(columns) if columns else None))
+
+@st.cache_resource(show_spinner=False, max_entries=settings.DATASET_CACHE_ENTRIES * 2)
+def clean_dataset(content_hash, columns, text_column, _df):
+    """
+    Cleans only the selected text column of a shared dataset. The result shares every
+    other column with `_df`, so the dataset is held in memory once.
+    """
+    df_clean = _df.copy(deep=False)
+    df_clean[text_column] = clean_series(_df[text_column]).astype(ARROW_STRING)
+    return df_clean
+
+@st.cache_resource(max_entries=1)
+def load_cube(built_at):
+    """
+    Loads the precomputed aggregates once per build and shares them across reruns and
+    sessions. Pass the `built_at` time of the "aggregates" artifact so a rebuild is picked up.
+    """
+    return load_aggregates(load_vector_store(index_version()))
+
+def upload_hash(uploaded_file):
+    """Content hash of an upload, computed once per uploaded file in a session."""
+    key = (uploaded_file.name, uploaded_file.size, getattr(uploaded_file, "file_id", None))
+    if st.session_state.dataset_key != key:
+        st.session_state.dataset_key = key
+        st.session_state.dataset_hash = dataset_hash(uploaded_file)
+    return st.session_state.dataset_hash
+
+@st.cache_resource(max_entries=1)
+def load_vector_store(version):
+    """
+    Loads the vector store once per index version and shares it across reruns and
+    sessions. Pass `index_version()` so a rewritten index is picked up on the next run.
+    """
+    return SurveyVectorStore()
 
 def main():
     st.set_page_config(page_title="TelcoResQ", page_icon="📡")
     st.title("TelcoResQ: AI-Powered Survey Insight Engine")
 
-    # Initialize session state
-    if 'df_clean' not in st.session_state:
-        st.session_state.df_clean = None
+    # Initialize session state. Uploaded data is not kept here: it is cached once per
+    # content hash (see `load_dataset`) and shared by all sessions.
+    if 'dataset_key' not in st.session_state:
+        st.session_state.dataset_key = None
+        st.session_state.dataset_hash = None
     if 'text_column_to_embed' not in st.session_state:
         st.session_state.text_column_to_embed = ""
     if 'openai_api_key' not in st.session_state:
         st.session_state.openai_api_key = None
+    if 'response_ids' not in st.session_state:
+        st.session_state.response_ids = None
+    if 'query_metrics' not in st.session_state:
+        st.session_state.query_metrics = [] # Per-query latencies on the Query page
 
 
     st.sidebar.title("Configuration")
@@ -36,163 +100,526 @@ def main():
     )
 
     st.sidebar.title("Navigation")
-    page = st.sidebar.radio("Go to", ["Dashboard", "Query", "Reports"])
+    page = st.sidebar.radio("Go to", ["Dashboard", "Explore", "Query", "Reports", "Diagnostics"])
+    shared_dataset_bytes = 0
 
     if page == "Dashboard":
         st.header("Dashboard")
         st.write("Welcome to the TelcoResQ Dashboard.")
         # File uploader
         st.subheader("Upload Survey Data")
-        uploaded_file = st.file_uploader("Choose a CSV or JSON file", type=["csv", "json"])
+        uploaded_file = st.file_uploader(
+            "Choose a CSV, JSON, JSON Lines or Parquet file", type=["csv", "json", "jsonl", "parquet"]
+        )
+        streaming = st.checkbox(
+            "Stream the file in chunks",
+            help="Recommended for large files: the file is cleaned, embedded and stored chunk by chunk "
+                 "instead of being loaded into memory at once. Only the first rows are previewed.",
+            key="streaming_mode"
+        )
         if uploaded_file is not None:
             if not st.session_state.openai_api_key:
                 st.warning("Please enter your OpenAI API Key in the sidebar to proceed.")
                 st.stop()
             try:
-                df = parse_file(uploaded_file)
+                columns = None
+                if uploaded_file.name.endswith('.parquet'):
+                    # Parquet is columnar: read only the selected columns (e.g. a few of the 400+ CPS variables).
+                    available_columns = pq.read_schema(uploaded_file).names
+                    uploaded_file.seek(0)
+                    columns = st.multiselect(
+                        "Columns to load:", available_columns, default=available_columns, key="parquet_columns"
+                    ) or None
+                if streaming:
+                    # Preview the first chunk only; the full file is read when processing.
+                    df = compact_dataframe(next(iter_file_chunks(uploaded_file, chunksize=1000, columns=columns), pd.DataFrame()))
+                    uploaded_file.seek(0)
+                else:
+                    df = load_dataset(upload_hash(uploaded_file), tuple(columns or ()), uploaded_file)
                 st.success("File uploaded and parsed successfully!")
 
                 st.subheader("Raw Data Preview")
                 st.dataframe(df.head())
 
-                # For now, assume all object columns are text columns that need cleaning
-                text_columns = df.select_dtypes(include=['object']).columns.tolist()
+                # For now, assume all string columns are text columns that need cleaning
+                candidate_columns = text_columns(df)
                 
-                if text_columns:
+                if candidate_columns:
                     # Allow user to select the main text column for analysis
                     st.session_state.text_column_to_embed = st.selectbox(
                         "Select column to embed:", 
-                        text_columns,
+                        candidate_columns,
                         key="column_selector"
                     )
 
-                    df_clean = preprocess_dataframe(df.copy(), text_columns)
-                    st.session_state.df_clean = df_clean # Save to session state
+                    id_column = st.selectbox(
+                        "Response ID column (optional):",
+                        [""] + df.columns.tolist(),
+                        format_func=lambda column: column or "(derive from response text)",
+                        key="id_column_selector"
+                    )
+
+                    if streaming:
+                        df_clean = preprocess_dataframe(df.copy(deep=False), [st.session_state.text_column_to_embed])
+                    else:
+                        df_clean = clean_dataset(
+                            st.session_state.dataset_hash, tuple(columns or ()), st.session_state.text_column_to_embed, df
+                        )
+                        shared_dataset_bytes = memory_usage(df) + memory_usage(df_clean[st.session_state.text_column_to_embed])
 
                     st.subheader("Processed Data Preview")
                     st.dataframe(df_clean.head())
 
-                    if st.button("Process and Generate Embeddings"):
+                    if streaming and st.button("Process and Generate Embeddings"):
                         try:
-                            with st.spinner("Processing data, generating embeddings, and building vector store..."):
-                                # 1. Get embeddings
-                                texts_to_embed = df_clean[st.session_state.text_column_to_embed].tolist()
-                                embeddings = get_embeddings(tuple(texts_to_embed), api_key=st.session_state.openai_api_key)
+                            store = SurveyVectorStore()
+                            embedding_progress = st.progress(0.0)
+                            with metrics.stage("ingest"):
+                                response_ids, sync_stats = ingest_stream(
+                                    uploaded_file,
+                                    st.session_state.text_column_to_embed,
+                                    store,
+                                    embed_fn=lambda texts: get_embeddings(texts, api_key=st.session_state.openai_api_key),
+                                    id_column=id_column or None,
+                                    columns=columns,
+                                    progress_callback=lambda rows, fraction: embedding_progress.progress(
+                                        fraction, text=f"{rows} rows processed"
+                                    ),
+                                )
+                            st.session_state.response_ids = response_ids
+                            st.write(
+                                f"Vector store updated: {sync_stats['added']} added, {sync_stats['updated']} updated, "
+                                f"{sync_stats['removed']} removed, {sync_stats['unchanged']} unchanged."
+                            )
+                            if store.index is not None:
+                                st.caption(f"Vector index: {describe_index(store.index)}")
+                            st.success("Successfully processed data and created vector store!")
+                        except Exception as e:
+                            st.error(f"An error occurred during processing: {e}")
 
-                                if not embeddings:
+                    if not streaming and st.button("Process and Generate Embeddings"):
+                        try:
+                            with st.spinner("Processing data, generating embeddings, and building vector store..."), metrics.stage("ingest"):
+                                # 1-3. Embed new or changed rows and update the saved FAISS index in place
+                                # A zero-copy view of the shared column rather than a list of its values
+                                texts_to_embed = df_clean[st.session_state.text_column_to_embed].array
+                                response_ids = make_response_ids(
+                                    df_clean, st.session_state.text_column_to_embed, id_column or None
+                                )
+                                cache_stats_before = get_embedding_cache().stats()
+                                embedding_progress = st.progress(0.0)
+                                store = SurveyVectorStore()
+                                attribute_columns = [c for c in df_clean.columns if c != st.session_state.text_column_to_embed]
+                                sync_stats = store.sync(
+                                    response_ids,
+                                    texts_to_embed,
+                                    embed_fn=lambda texts: get_embeddings(
+                                        texts,
+                                        api_key=st.session_state.openai_api_key,
+                                        progress_callback=lambda done, total: embedding_progress.progress(done / total),
+                                    ),
+                                    attributes=df_clean[attribute_columns].to_dict('records'),
+                                )
+                                index = store.index
+                                cache_stats = get_embedding_cache().stats()
+
+                                if index is None:
                                     st.error("Could not generate embeddings. The operation returned no data.")
                                     st.stop()
+                                st.session_state.response_ids = response_ids
 
-                                st.write(f"Generated {len(embeddings)} embeddings.")
-                                
-                                # 2. Create FAISS index
-                                index = create_faiss_index(embeddings)
-                                
-                                # 3. Save FAISS index
-                                save_faiss_index(index)
+                                st.write(
+                                    f"Vector store updated: {sync_stats['added']} added, {sync_stats['updated']} updated, "
+                                    f"{sync_stats['removed']} removed, {sync_stats['unchanged']} unchanged."
+                                )
+                                hits = cache_stats['hits'] - cache_stats_before['hits']
+                                misses = cache_stats['misses'] - cache_stats_before['misses']
+                                if hits + misses:
+                                    st.caption(
+                                        f"Embedding cache: {hits} hits, {misses} misses "
+                                        f"({hits / (hits + misses):.0%} hit rate, {cache_stats['entries']} cached texts)."
+                                    )
+                                st.caption(f"Vector index: {describe_index(index)}")
                                 st.success("Successfully processed data and created vector store!")
 
                                 # 4. Perform Sentiment Analysis
                                 st.subheader("Sentiment Analysis")
-                                sentiments = df_clean[st.session_state.text_column_to_embed].apply(
-                                     lambda x: get_sentiment(x, api_key=st.session_state.openai_api_key)
-                                 )
-                                df_clean['sentiment_label'] = sentiments.apply(lambda x: x.split('\\n')[0].replace('Sentiment:', '').strip() if x else 'N/A')
-                                df_clean['sentiment_justification'] = sentiments.apply(lambda x: x.split('Justification:')[1].strip() if x and 'Justification:' in x else 'N/A')
-                                st.session_state.df_clean = df_clean # Update session state
-                                st.dataframe(df_clean[[st.session_state.text_column_to_embed, 'sentiment_label', 'sentiment_justification']].head())
+                                progress_bar = st.progress(0.0)
+                                with metrics.stage("sentiment"):
+                                    # Duplicates share one LLM call, also with responses labelled in earlier runs.
+                                    sentiment_groups = store.load_sentiment_groups()
+                                    sentiments, dedup_stats = analyze_sentiments_grouped(
+                                        texts_to_embed,
+                                        groups=sentiment_groups,
+                                        api_key=st.session_state.openai_api_key,
+                                        progress_callback=lambda done, total: progress_bar.progress(done / total),
+                                    )
+                                    store.save_sentiment_groups(sentiment_groups)
+                                st.caption(
+                                    f"{dedup_stats['texts']} responses in {dedup_stats['groups']} groups of duplicates: "
+                                    f"{dedup_stats['labelled']} labelled by the model, {dedup_stats['reused']} reused from earlier runs."
+                                )
+                                # The cached dataset is shared, so results go into a separate frame.
+                                sentiment_df = pd.DataFrame({
+                                    st.session_state.text_column_to_embed: texts_to_embed,
+                                    'sentiment_label': pd.Categorical([s['label'] if s else 'N/A' for s in sentiments]),
+                                    'sentiment_score': pd.array([s['score'] if s else None for s in sentiments], dtype="Float32"),
+                                    'sentiment_justification': pd.array(
+                                        [s['justification'] if s else 'N/A' for s in sentiments], dtype=ARROW_STRING
+                                    ),
+                                }, index=df_clean.index)
+                                store.update_sentiments(
+                                    response_ids,
+                                    [s['label'] if s else None for s in sentiments],
+                                    scores=[s['score'] if s else None for s in sentiments],
+                                    justifications=[s['justification'] if s else None for s in sentiments],
+                                )
+                                get_query_cache().clear() # Cached query hits carry the old sentiment labels
+                                build_aggregates(store)
+                                st.dataframe(sentiment_df.head())
                                 st.success("Sentiment analysis complete.")
                                  
-                                fig = create_sentiment_pie_chart(df_clean)
+                                fig = create_sentiment_pie_chart(sentiment_df)
                                 if fig:
                                     st.plotly_chart(fig)
 
-                            # 5. Perform Theme Extraction
-                            st.subheader("Theme Extraction")
-                            if st.button("Extract Themes"):
-                                with st.spinner("Extracting themes..."):
-                                    themes_text = get_themes(
-                                        df_clean[st.session_state.text_column_to_embed].tolist(),
-                                        api_key=st.session_state.openai_api_key
-                                    )
-                                    if themes_text:
-                                        st.markdown(themes_text)
-                                        st.success("Theme extraction complete.")
-                                        themes_df = parse_themes_to_df(themes_text)
-                                        fig_themes = create_theme_frequency_bar_chart(themes_df)
-                                        if fig_themes:
-                                            st.plotly_chart(fig_themes)
-                                    else:
-                                        st.error("Could not extract themes.")
-                            
-                            # 6. Generate Summary
-                            st.subheader("Generate Summary")
-                            if st.button("Generate Executive Summary"):
-                                with st.spinner("Generating summary..."):
-                                    summary = get_summary(
-                                        df_clean[st.session_state.text_column_to_embed].tolist(),
-                                        api_key=st.session_state.openai_api_key
-                                    )
-                                    if summary:
-                                        with st.expander("View Summary", expanded=True):
-                                            st.write(summary)
-                                        st.success("Summary generation complete.")
-                                    else:
-                                        st.error("Could not generate summary.")
                         except Exception as e:
                             st.error(f"An error occurred during processing: {e}")
+
+                    if st.session_state.response_ids is not None:
+                        # 5. Perform Theme Extraction
+                        st.subheader("Theme Extraction")
+                        if st.button("Extract Themes"):
+                            with st.spinner("Clustering responses and extracting themes..."), metrics.stage("themes"):
+                                store = SurveyVectorStore()
+                                corpus_ids, corpus_texts, corpus_vectors = store.load_corpus()
+                                themes, assignments = extract_themes(
+                                    corpus_texts,
+                                    corpus_vectors,
+                                    api_key=st.session_state.openai_api_key
+                                )
+                                if themes:
+                                    store.update_themes(themes, corpus_ids, assignments)
+                                    build_aggregates(store)
+                                    for theme in themes:
+                                        st.markdown(f"**{theme['name']}** ({theme['frequency']} responses): {theme['description']}")
+                                    st.success("Theme extraction complete.")
+                                    themes_df = parse_themes_to_df(themes)
+                                    fig_themes = create_theme_frequency_bar_chart(themes_df)
+                                    if fig_themes:
+                                        st.plotly_chart(fig_themes)
+                                else:
+                                    st.error("Could not extract themes.")
+                        
+                        # 6. Generate Summary
+                        st.subheader("Generate Summary")
+                        if st.button("Generate Executive Summary"):
+                            with st.spinner("Generating summary..."), metrics.stage("summary"):
+                                store = SurveyVectorStore()
+                                summary = get_summary(store.load_texts(), api_key=st.session_state.openai_api_key)
+                                if summary:
+                                    store.save_artifact("summary", summary)
+                                    with st.expander("View Summary", expanded=True):
+                                        st.write(summary)
+                                    st.success("Summary generation complete.")
+                                else:
+                                    st.error("Could not generate summary.")
                 else:
                     st.warning("No text columns found to process.")
 
             except Exception as e:
                 st.error(f"An error occurred: {e}")
+        else:
+            # Attach to the results of a batch job run with `python -m telcoresq.cli run ...`
+            finished_jobs = list_jobs(database.get_engine(settings.DATABASE_URL), status="finished")
+            if finished_jobs:
+                st.subheader("Load Batch Job Results")
+                job = st.selectbox(
+                    "Finished job:",
+                    finished_jobs,
+                    format_func=lambda job: f"{job['source_path']} ({job['updated_at']:%Y-%m-%d %H:%M}, {job['job_id'][:8]})",
+                    key="job_selector"
+                )
+                if st.button("Load Results"):
+                    store = load_vector_store(index_version())
+                    st.session_state.response_ids = store.stored_ids()
+                    counts = sentiment_theme_counts(store)
+                    st.write(f"{int(counts['count'].sum())} responses processed.")
+
+                    st.subheader("Sentiment Analysis")
+                    fig = create_sentiment_pie_chart(counts, count_col='count')
+                    if fig:
+                        st.plotly_chart(fig)
+
+                    themes = store.load_themes()
+                    if themes:
+                        st.subheader("Themes")
+                        for theme in themes:
+                            st.markdown(f"**{theme['name']}** ({theme['frequency']} responses): {theme['description']}")
+                        fig_themes = create_theme_frequency_bar_chart(parse_themes_to_df(themes))
+                        if fig_themes:
+                            st.plotly_chart(fig_themes)
+
+                    summary = (job['results'] or {}).get('summary')
+                    if summary:
+                        with st.expander("View Summary", expanded=True):
+                            st.write(summary)
+
+    elif page == "Explore":
+        st.header("Explore")
+        st.write("Filter sentiment and themes by demographics. Charts are served from aggregates precomputed when the data is processed.")
+        store = load_vector_store(index_version())
+        if st.button("Rebuild Aggregates"):
+            with st.spinner("Aggregating responses..."):
+                cells_built = build_aggregates(store)
+            st.success(f"Aggregated the responses into {cells_built} cells.")
+        aggregates_info = store.load_artifact("aggregates")
+        cells = load_cube(aggregates_info['built_at']) if aggregates_info else None
+        if cells is None:
+            st.info("No aggregates yet. Process data on the Dashboard, run a batch job, or rebuild them here.")
+        else:
+            dimensions = dimension_columns(cells)
+            filter_columns = st.columns(3)
+            filters = {
+                dimension: filter_columns[position % 3].multiselect(
+                    dimension.replace('_', ' ').title() if dimension in ("sentiment_label", "theme") else dimension,
+                    list(cells[dimension].cat.categories),
+                    key=f"explore_{dimension}"
+                )
+                for position, dimension in enumerate(dimensions)
+            }
+
+            # Cross-filtering: each chart applies every filter except the one on its own dimension.
+            started = time.perf_counter()
+            breakdowns = {
+                dimension: rollup(
+                    cells,
+                    [dimension] if dimension in ("sentiment_label", "theme") else [dimension, "sentiment_label"],
+                    mask=filter_mask(cells, {other: values for other, values in filters.items() if other != dimension})
+                )
+                for dimension in dimensions
+            }
+            selected = cells[filter_mask(cells, filters)]
+            total = int(selected['responses'].sum())
+            elapsed_ms = (time.perf_counter() - started) * 1000
+            st.caption(
+                f"{total} of {int(cells['responses'].sum())} responses match, "
+                f"computed in {elapsed_ms:.1f} ms from {len(cells)} precomputed cells."
+            )
+            if total and selected['scored'].sum():
+                st.metric("Mean Sentiment Score", f"{selected['score_sum'].sum() / selected['scored'].sum():+.2f}")
+
+            col1, col2 = st.columns(2)
+            fig = create_sentiment_pie_chart(breakdowns["sentiment_label"], count_col='responses')
+            if fig:
+                col1.plotly_chart(fig, use_container_width=True)
+            fig_themes = create_theme_frequency_bar_chart(
+                breakdowns["theme"].rename(columns={'responses': 'count'})[['theme', 'count']]
+            )
+            if fig_themes:
+                col2.plotly_chart(fig_themes, use_container_width=True)
+            for dimension in dimensions:
+                if dimension in ("sentiment_label", "theme"):
+                    continue
+                fig_dimension = create_dimension_sentiment_bar_chart(breakdowns[dimension], dimension)
+                if fig_dimension:
+                    st.plotly_chart(fig_dimension, use_container_width=True)
 
     elif page == "Query":
         st.header("Natural Language Query")
         st.write("Ask questions about your survey data.")
 
-        if st.session_state.df_clean is not None and st.session_state.text_column_to_embed:
+        store = load_vector_store(index_version())
+        if store.index is not None:
             if not st.session_state.openai_api_key:
                 st.warning("Please enter your OpenAI API Key in the sidebar to run a query.")
                 st.stop()
             query = st.text_input("Enter your query:", key="query_input")
+            search_mode = st.radio(
+                "Search mode",
+                ["hybrid", "dense"],
+                index=0 if settings.SEARCH_MODE == "hybrid" else 1,
+                format_func=lambda mode: {"hybrid": "Keywords + meaning", "dense": "Meaning only"}[mode],
+                horizontal=True,
+                help="Keyword matching finds exact terms such as tower ids, carrier names and outage codes.",
+                key="search_mode"
+            )
+
+            with st.expander("Filter responses"):
+                filters = {}
+                sentiment_filter = st.multiselect("Sentiment", store.distinct_values("sentiment_label"))
+                if sentiment_filter:
+                    filters["sentiment_label"] = sentiment_filter
+                attribute = st.text_input("Attribute (e.g. PESEX):", key="filter_attribute")
+                if attribute:
+                    attribute_filter = st.multiselect("Values", store.distinct_values(attribute))
+                    if attribute_filter:
+                        filters[attribute] = attribute_filter
+
             if st.button("Submit Query"):
-                with st.spinner("Searching for relevant responses..."):
-                    index = load_faiss_index()
-                    if index:
-                        documents = st.session_state.df_clean[st.session_state.text_column_to_embed].tolist()
-                        results, distances = search_similar_responses(query, index, documents)
-                        
-                        if results:
-                            # Generate a direct answer from the context
-                            with st.spinner("Generating an answer..."):
-                                answer = get_answer_from_context(
-                                    query, 
-                                    results, 
-                                    api_key=st.session_state.openai_api_key
-                                )
-                                st.subheader("Answer:")
-                                st.write(answer)
-
-                            # Display the source documents
-                            with st.expander("Show relevant responses used for the answer"):
-                                st.subheader("Most Relevant Responses:")
-                                for i, (res, dist) in enumerate(zip(results, distances)):
-                                    st.write(f"**Response {i+1} (Distance: {dist:.4f}):**")
-                                    st.write(res)
-                        else:
-                            st.warning("No relevant responses found.")
-                    else:
-                        st.error("Vector index not found. Please process a file on the Dashboard page first.")
+                with st.spinner("Searching for relevant responses..."), metrics.stage("query"):
+                    result, answer_chunks = stream_answer_query(
+                        query, store, filters=filters, api_key=st.session_state.openai_api_key,
+                        search_mode=search_mode
+                    )
+                hits = result['hits']
+
+                if hits:
+                    st.subheader("Answer:")
+                    # Render the answer as it is generated
+                    answer_placeholder = st.empty()
+                    answer = ""
+                    with metrics.stage("query"):
+                        for chunk in answer_chunks:
+                            answer += chunk
+                            answer_placeholder.markdown(answer + "▌")
+                    answer_placeholder.markdown(answer)
+                    if result['match'] == "semantic":
+                        st.caption(f"Answered from cache (similar question: \"{result['cached_query']}\").")
+                    elif result['match'] == "exact":
+                        st.caption("Answered from cache.")
+
+                    # Display the source documents
+                    with st.expander("Show relevant responses used for the answer"):
+                        st.subheader("Most Relevant Responses:")
+                        for i, hit in enumerate(hits):
+                            match = f"Distance: {hit['distance']:.4f}" if hit['distance'] is not None else "Keyword match"
+                            st.write(f"**Response {i+1} ({match}, Sentiment: {hit['sentiment_label'] or 'N/A'}):**")
+                            st.write(hit['text'])
+                else:
+                    for _ in answer_chunks:
+                        pass
+                    st.warning("No relevant responses found.")
+
+                st.caption(
+                    f"Retrieval {result['retrieval_seconds']:.2f}s, first token {result['first_token_seconds'] or 0:.2f}s, "
+                    f"total {result['seconds']:.2f}s."
+                )
+                st.session_state.query_metrics.append({
+                    "query": query,
+                    "cache": result['match'] or "miss",
+                    "retrieval_s": round(result['retrieval_seconds'], 3),
+                    "first_token_s": round(result['first_token_seconds'] or 0, 3),
+                    "total_s": round(result['seconds'], 3),
+                })
+                cache_stats = get_query_cache().stats()
+                st.caption(
+                    f"Query cache: {cache_stats['exact_hits']} exact and {cache_stats['semantic_hits']} similar-question hits, "
+                    f"{cache_stats['misses']} misses ({cache_stats['hit_rate']:.0%} hit rate), "
+                    f"{cache_stats['saved_seconds']:.1f}s saved."
+                )
+
+            if st.session_state.query_metrics:
+                with st.expander("Query latency"):
+                    st.dataframe(pd.DataFrame(st.session_state.query_metrics))
         else:
             st.warning("Please upload and process a file on the Dashboard page first.")
 
     elif page == "Reports":
         st.header("Export Reports")
-        st.write("Generate and export insights reports.")
-        if st.button("Export Report"):
-            st.success("Report exported successfully!")
-            # Add report generation logic here
+        report_mode = st.radio("Report type", ["Question bank", "Insights report"], horizontal=True, key="report_mode")
+
+        if report_mode == "Question bank":
+            st.write("Run a standard set of questions against the current survey data in one batch.")
+            store = load_vector_store(index_version())
+            if store.index is None:
+                st.warning("Please upload and process a file on the Dashboard page first.")
+                st.stop()
+            if not st.session_state.openai_api_key:
+                st.warning("Please enter your OpenAI API Key in the sidebar to run the questions.")
+                st.stop()
+            questions_file = st.file_uploader(
+                "Upload questions (TXT with one question per line, or CSV with the questions in the first column)",
+                type=["txt", "csv"],
+                key="questions_file"
+            )
+            if questions_file is not None:
+                if questions_file.name.endswith('.csv'):
+                    questions = pd.read_csv(questions_file).iloc[:, 0].dropna().astype(str).tolist()
+                else:
+                    questions = questions_file.getvalue().decode("utf-8").splitlines()
+            else:
+                questions = st.text_area("Or enter one question per line:", key="questions_text").splitlines()
+            questions = [question.strip() for question in questions if question.strip()]
+
+            if questions and st.button(f"Answer {len(questions)} Questions"):
+                progress_bar = st.progress(0.0)
+                with metrics.stage("question_bank"):
+                    answers = answer_queries(
+                        questions,
+                        store,
+                        api_key=st.session_state.openai_api_key,
+                        progress_callback=lambda done, total: progress_bar.progress(done / total),
+                    )
+                progress_bar.progress(1.0)
+                st.dataframe(answers)
+                st.download_button(
+                    "Download Answers (CSV)",
+                    answers.to_csv(index=False).encode("utf-8"),
+                    file_name="question_bank_answers.csv",
+                    mime="text/csv"
+                )
+                cached = int((answers['cache'] != "miss").sum())
+                st.caption(f"{cached} of {len(answers)} questions answered from the query cache.")
+        else:
+            st.write("Generate and export insights reports from the processed results (no AI calls are made).")
+            formats = st.multiselect(
+                "Formats", ["markdown", "csv", "parquet"], default=["markdown", "csv", "parquet"], key="report_formats"
+            )
+            if formats and st.button("Export Report"):
+                with st.spinner("Building report..."):
+                    report = build_report(SurveyVectorStore(), formats=formats)
+                if report['reused']:
+                    st.success(f"The results have not changed since the last export; reusing the report in {report['directory']}.")
+                else:
+                    st.success(f"Report exported to {report['directory']}.")
+                if "report.md" in report['files']:
+                    with open(report['files']["report.md"]) as f:
+                        with st.expander("Report preview", expanded=True):
+                            st.markdown(f.read())
+                for name, path in report['files'].items():
+                    with open(path, "rb") as f:
+                        st.download_button(f"Download {name}", f, file_name=name, key=f"download_{name}")
+
+    elif page == "Diagnostics":
+        st.header("Diagnostics")
+        st.write("Latency, token usage, retries, errors, cache hits and estimated cost of the AI calls made by this process, per pipeline stage.")
+        recorder = metrics.get_metrics()
+        summary = recorder.summary()
+        if summary.empty:
+            st.info("No AI calls have been recorded yet.")
+        else:
+            lookups = summary['cache_hits'].sum() + summary['cache_misses'].sum()
+            col1, col2, col3, col4, col5 = st.columns(5)
+            col1.metric("Calls", int(summary['calls'].sum()))
+            col2.metric("Errors", int(summary['errors'].sum()), f"{int(summary['retries'].sum())} retries", delta_color="off")
+            col3.metric("Tokens", int(summary['input_tokens'].sum() + summary['output_tokens'].sum()))
+            col4.metric("Estimated Cost", f"${summary['cost_usd'].sum():.4f}")
+            col5.metric("Cache Hit Rate", f"{summary['cache_hits'].sum() / lookups:.0%}" if lookups else "N/A")
+            st.dataframe(summary)
+            st.download_button(
+                "Download Metrics (CSV)",
+                summary.to_csv(index=False).encode("utf-8"),
+                file_name="ai_call_metrics.csv",
+                mime="text/csv"
+            )
+        col1, col2 = st.columns(2)
+        if col1.button("Export Call Log"):
+            recorder.flush()
+            st.success(f"Call events appended to {recorder.path}.")
+        if col2.button("Reset Metrics"):
+            recorder.reset()
+            st.rerun()
+
+        st.subheader("Memory")
+        usage = session_memory(st.session_state)
+        st.dataframe(pd.DataFrame({"key": list(usage), "bytes": list(usage.values())}))
+
+    # Uploaded datasets are shared between sessions, so they are reported separately.
+    st.sidebar.caption(
+        f"Session memory: {format_bytes(sum(session_memory(st.session_state).values()))}"
+        + (f" · shared dataset: {format_bytes(shared_dataset_bytes)}" if shared_dataset_bytes else "")
+    )
 
 if __name__ == "__main__":
     main()
@@ -1,193 +1,739 @@
-from openai import OpenAI
 from telcoresq.config import settings
 import functools
+import hashlib
+import time
+import numpy as np
+import pandas as pd
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from langchain_openai import ChatOpenAI
-from langchain.prompts import PromptTemplate
-from langchain.chains import LLMChain
 from telcoresq.config import prompts
-import numpy as np
-from langchain.vectorstores import FAISS
-from langchain.chains import RetrievalQA
-from langchain_openai import OpenAIEmbeddings
+from telcoresq.app.services.embedding_backends import get_embedding_backend
+from telcoresq.app.services.embedding_cache import get_embedding_cache, normalize_text
+from telcoresq.app.services.llm_cache import get_llm_cache, make_cache_key
+from telcoresq.app.services.query_cache import get_query_cache
+from telcoresq.app.services.dedup import SentimentGroups
+from telcoresq.app.services import structured_output
+from telcoresq.app.utils.metrics import get_metrics, model_name, run_in_context, tracked_call
+from telcoresq.app.utils.tokens import count_tokens, pack_by_tokens, truncate_to_tokens
+
+def _resolve_api_key(api_key):
+    """Returns the explicit API key, falling back to the one from settings."""
+    final_api_key = api_key or settings.OPENAI_API_KEY
+    if not final_api_key:
+        raise ValueError("OpenAI API key is not set.")
+    return final_api_key
 
-@functools.lru_cache(maxsize=None)
-def get_embeddings(texts, model=settings.EMBEDDING_MODEL, api_key=None):
+@functools.lru_cache(maxsize=8)
+def _get_chat_model(model, api_key, temperature):
     """
-    Generates embeddings for a list of texts using OpenAI.
-    The `texts` parameter is a tuple to be hashable for caching.
+    Returns a shared chat model client for the given configuration.
+    Retries are handled by `call_with_retry` (via `tracked_call`), so the client's own retries are disabled.
+    """
+    return ChatOpenAI(temperature=temperature, model_name=model, api_key=api_key, max_retries=0)
+
+def _run_concurrently(fn, items, max_concurrency, progress_callback=None):
+    """
+    Applies `fn` to every item on a thread pool and returns the results in input order.
+    Items whose call raised are returned as the exception instance.
+    """
+    results = [None] * len(items)
+    with ThreadPoolExecutor(max_workers=max(1, max_concurrency)) as executor:
+        futures = {run_in_context(executor, fn, item): position for position, item in enumerate(items)}
+        for done, future in enumerate(as_completed(futures), 1):
+            try:
+                results[futures[future]] = future.result()
+            except Exception as e:
+                results[futures[future]] = e
+            if progress_callback:
+                progress_callback(done, len(items))
+    return results
+
+def iter_embeddings(texts, model=settings.EMBEDDING_MODEL, api_key=None, cache=None, backend=None):
+    """
+    Streams embeddings for `texts` as `(positions, vectors)` pairs, where `positions`
+    are indexes into `texts`. Cached embeddings are yielded first; the remaining texts
+    are split into batches by the embedding backend for `model` (token-budgeted API
+    requests for OpenAI, length-sorted chunks for local models) and up to the
+    backend's `max_concurrency` batches run at once, in whatever order they finish.
+
+    Every finished batch is written to the embedding cache straight away, so a run
+    that fails part-way resumes from the last finished batch when it is retried.
+    Empty texts are skipped and never appear in `positions`.
+    """
+    cache = cache if cache is not None else get_embedding_cache()
+
+    # Map each distinct normalized text to the positions it occurs at.
+    positions_by_text = {}
+    for position, text in enumerate(texts):
+        processed = normalize_text(text) if text else ""
+        if processed:
+            positions_by_text.setdefault(processed, []).append(position)
+    if not positions_by_text:
+        return
+
+    cached = cache.get_many(model, list(positions_by_text))
+    get_metrics().record_cache("embedding", model, hits=len(cached), misses=len(positions_by_text) - len(cached))
+    if cached:
+        positions, vectors = [], []
+        for text, vector in cached.items():
+            for position in positions_by_text[text]:
+                positions.append(position)
+                vectors.append(vector)
+        yield positions, vectors
+
+    missing = [text for text in positions_by_text if text not in cached]
+    if not missing:
+        return
+
+    backend = backend or get_embedding_backend(model, api_key=api_key)
+    inputs, batches = backend.plan_batches(missing)
+
+    def embed_batch(batch):
+        vectors = backend.embed_batch([inputs[i] for i in batch])
+        # The cache stays keyed on the full text, even if the backend truncated it.
+        cache.put_many(model, [missing[i] for i in batch], vectors)
+        return vectors
+
+    first_error = None
+    with ThreadPoolExecutor(max_workers=max(1, backend.max_concurrency)) as executor:
+        futures = {run_in_context(executor, embed_batch, batch): batch for batch in batches}
+        for future in as_completed(futures):
+            try:
+                batch_vectors = future.result()
+            except Exception as e:
+                # Let the other in-flight batches finish so they are checkpointed.
+                first_error = first_error or e
+                continue
+            positions, vectors = [], []
+            for i, vector in zip(futures[future], batch_vectors):
+                for position in positions_by_text[missing[i]]:
+                    positions.append(position)
+                    vectors.append(vector)
+            yield positions, vectors
+    if first_error is not None:
+        raise first_error
+
+def get_embeddings(texts, model=settings.EMBEDDING_MODEL, api_key=None, cache=None, progress_callback=None):
+    """
+    Generates embeddings for a list of texts with the backend selected by `model`
+    (OpenAI by default, or a local sentence-transformers model, see `get_embedding_backend`).
+    Returns one embedding per input text, in input order; empty texts get None so
+    positions always line up with the input rows.
+    Only texts missing from the embedding cache are sent to the API, see `iter_embeddings`.
     """
     if not texts:
         return []
 
-    # Use the key from the function argument if provided, otherwise from settings
-    final_api_key = api_key or settings.OPENAI_API_KEY
-    if not final_api_key:
-        raise ValueError("OpenAI API key is not set. Please provide it in the sidebar.")
+    texts = list(texts)
+    embeddings = [None] * len(texts)
+    done = 0
+    for positions, vectors in iter_embeddings(texts, model=model, api_key=api_key, cache=cache):
+        for position, vector in zip(positions, vectors):
+            embeddings[position] = vector
+        done += len(positions)
+        if progress_callback:
+            progress_callback(done, len(texts))
+    return embeddings
 
-    # Note: The underlying `openai` library automatically uses the OPENAI_API_KEY
-    # environment variable if the api_key argument is not provided.
-    # We are being explicit here to allow for UI-based key entry.
-    client = OpenAI(api_key=final_api_key)
-    
-    # Replace newlines with spaces as recommended by OpenAI for embedding models.
-    processed_texts = [str(text).replace("\\n", " ") for text in texts if text]
+def _parse_batch_sentiments(output, batch_length):
+    """
+    Validates a `{"results": [...]}` sentiment reply item by item (see `SentimentItem`).
+    Returns a dict keyed by response number; items that fail validation and numbers
+    outside the batch are left out, so only those rows need to be asked again.
+    """
+    parsed = {}
+    items = output.get("results") if isinstance(output, dict) else None
+    for item in items if isinstance(items, list) else []:
+        result = structured_output.validate(structured_output.SentimentItem, item)
+        if result is not None and 1 <= result.number <= batch_length and result.number not in parsed:
+            parsed[result.number] = {
+                "label": result.sentiment.capitalize(),
+                "score": result.score,
+                "justification": result.justification,
+            }
+    return parsed
 
-    if not processed_texts:
-        return []
+def analyze_sentiments(texts, model=settings.LLM_MODEL, api_key=None,
+                       batch_size=None, max_concurrency=None, llm=None, progress_callback=None):
+    """
+    Analyzes the sentiment of many texts by packing `batch_size` responses into each
+    prompt and running up to `max_concurrency` prompts at once.
 
-    response = client.embeddings.create(input=processed_texts, model=model)
-    return [item.embedding for item in response.data]
+    Replies are requested as structured output and validated per response. Responses
+    whose result is missing or invalid are collected and sent again, packed into new
+    batches, for up to `STRUCTURED_OUTPUT_RETRIES` rounds.
+    Returns one `{'label', 'score', 'justification'}` dict per input text, in input order;
+    `score` ranges from -1 (very negative) to 1 (very positive). Empty texts and
+    responses that never got a valid result are returned as None.
+    `texts` can be a list or a pandas Series/array; it is indexed in place, not copied.
+    `llm` can be any LangChain chat model; by default a shared ChatOpenAI client is used.
+    """
+    batch_size = batch_size or settings.SENTIMENT_BATCH_SIZE
+    max_concurrency = max_concurrency or settings.LLM_MAX_CONCURRENCY
+    if isinstance(texts, pd.Series):
+        texts = texts.array # Positional, zero-copy view of the column
+    elif not hasattr(texts, "__getitem__"):
+        texts = list(texts)
+    results = [None] * len(texts)
 
-def get_sentiment(text, model=settings.LLM_MODEL, api_key=None):
+    pending = [i for i, text in enumerate(texts) if isinstance(text, str) and text.strip()]
+    if not pending:
+        return results
+
+    if llm is None:
+        llm = _get_chat_model(model, _resolve_api_key(api_key), 0)
+
+    def classify_batch(batch):
+        numbered = "\n".join(
+            f"{number}. {' '.join(texts[position].split())}"
+            for number, position in enumerate(batch, 1)
+        )
+        prompt = prompts.BATCH_SENTIMENT_ANALYSIS_PROMPT.format(responses=numbered)
+        output = structured_output.request_json(llm, prompt, structured_output.SentimentBatch)
+        return _parse_batch_sentiments(output, len(batch))
+
+    total = len(pending)
+    for attempt in range(settings.STRUCTURED_OUTPUT_RETRIES + 1):
+        batches = [pending[i:i + batch_size] for i in range(0, len(pending), batch_size)]
+        # Progress counts batches of the first round only; retries are usually few.
+        callback = progress_callback if attempt == 0 else None
+        batch_results = _run_concurrently(classify_batch, batches, max_concurrency, callback)
+        for batch, parsed in zip(batches, batch_results):
+            if isinstance(parsed, Exception):
+                print(f"An error occurred during sentiment analysis: {parsed}")
+                continue
+            for number, position in enumerate(batch, 1):
+                results[position] = parsed.get(number)
+        pending = [position for position in pending if results[position] is None]
+        if not pending:
+            break
+        if attempt < settings.STRUCTURED_OUTPUT_RETRIES:
+            print(f"Retrying {len(pending)} of {total} responses without a valid sentiment result.")
+    return results
+
+def analyze_sentiments_grouped(texts, groups=None, progress_callback=None, **kwargs):
     """
-    Analyzes the sentiment of a single text string using an LLM.
+    `analyze_sentiments` with a deduplication pre-pass: texts are assigned to
+    `SentimentGroups` (exact and near duplicates), only one representative per group
+    without a result is sent to the LLM, and each result is fanned back out to every
+    text of its group. Pass groups loaded with `SurveyVectorStore.load_sentiment_groups`
+    to reuse the results of earlier runs; new groups and results are added to `groups`.
+    Returns the per-text results (as `analyze_sentiments`) and counts of the texts,
+    groups, groups labelled by the LLM and groups reused from earlier results.
     """
-    if not text:
-        return None
-    
-    final_api_key = api_key or settings.OPENAI_API_KEY
-    if not final_api_key:
-        raise ValueError("OpenAI API key is not set.")
+    groups = groups if groups is not None else SentimentGroups()
+    keys = groups.assign(texts)
+    distinct = [key for key in dict.fromkeys(keys) if key is not None]
+    todo = [key for key in distinct if groups.result(key) is None]
+    if todo:
+        sentiments = analyze_sentiments(
+            [groups.groups[key]["text"] for key in todo], progress_callback=progress_callback, **kwargs
+        )
+        for key, sentiment in zip(todo, sentiments):
+            if sentiment is not None:
+                groups.set_result(key, sentiment)
+    elif progress_callback:
+        progress_callback(1, 1)
+    stats = {"texts": len(keys), "groups": len(distinct), "labelled": len(todo), "reused": len(distinct) - len(todo)}
+    return [groups.result(key) for key in keys], stats
 
+def _merge_cluster_themes(cluster_themes, cluster_sizes, llm):
+    """
+    Asks the LLM to merge the per-cluster themes into a final list.
+    Returns a list of (name, description, cluster numbers). Clusters the reply leaves
+    out, or all clusters if the reply cannot be parsed, keep their own theme.
+    """
+    candidates = "\n".join(
+        f"{cluster} ({cluster_sizes[cluster]} responses): {name} - {description}"
+        for cluster, (name, description) in cluster_themes.items()
+    )
+    merged, assigned = [], set()
     try:
-        llm = ChatOpenAI(temperature=0, model_name=model, api_key=final_api_key)
-        prompt = PromptTemplate(
-            input_variables=["response"],
-            template=prompts.SENTIMENT_ANALYSIS_PROMPT,
+        output = structured_output.request_json(
+            llm, prompts.THEME_MERGE_PROMPT.format(themes=candidates), structured_output.ThemeMerge
         )
-        chain = LLMChain(llm=llm, prompt=prompt)
-        result = chain.run(response=text)
-        return result
+        themes = output.get("themes") if isinstance(output.get("themes"), list) else []
+        for item in themes:
+            theme = structured_output.validate(structured_output.MergedTheme, item)
+            if theme is None:
+                continue
+            clusters = [c for c in dict.fromkeys(theme.clusters) if c in cluster_themes and c not in assigned]
+            if clusters:
+                merged.append((theme.name.strip(), theme.description, clusters))
+                assigned.update(clusters)
     except Exception as e:
-        print(f"An error occurred during sentiment analysis: {e}")
-        return None
+        print(f"An error occurred while merging themes: {e}")
+    for cluster, (name, description) in cluster_themes.items():
+        if cluster not in assigned:
+            merged.append((name, description, [cluster]))
+    return merged
 
-def get_themes(responses, model=settings.LLM_MODEL, api_key=None):
+def extract_themes(texts, embeddings, n_clusters=None, samples_per_cluster=None, model=settings.LLM_MODEL,
+                   api_key=None, llm=None, max_concurrency=None):
     """
-    Extracts themes from a list of survey responses.
+    Extracts themes from the full set of responses with a map-reduce pipeline:
+    the embeddings are clustered with MiniBatchKMeans, the responses closest to each
+    cluster centre are sent to the LLM in parallel to name the cluster's theme, and
+    the cluster themes are then merged into a final list.
+
+    `embeddings` holds one vector (or None) per text. Returns `(themes, assignments)`:
+    a list of `{'theme_id', 'name', 'description', 'frequency', 'examples'}` dicts
+    sorted by frequency, and the theme id of every input row (None for rows without
+    an embedding).
     """
-    if not responses:
-        return None
-    
-    final_api_key = api_key or settings.OPENAI_API_KEY
-    if not final_api_key:
-        raise ValueError("OpenAI API key is not set.")
+    from sklearn.cluster import MiniBatchKMeans
 
-    # Simple batching to handle large number of responses
-    # In a real app, this would be more sophisticated
-    batched_responses = "\n".join(responses[:50]) # Limit to 50 for now
+    n_clusters = n_clusters or settings.THEME_CLUSTERS
+    samples_per_cluster = samples_per_cluster or settings.THEME_SAMPLES_PER_CLUSTER
+    max_concurrency = max_concurrency or settings.LLM_MAX_CONCURRENCY
+    assignments = [None] * len(texts)
 
-    try:
-        llm = ChatOpenAI(temperature=0.7, model_name=model, api_key=final_api_key)
-        prompt = PromptTemplate(
-            input_variables=["responses"],
-            template=prompts.THEME_EXTRACTION_PROMPT,
+    rows = [row for row, vector in enumerate(embeddings) if vector is not None and texts[row]]
+    if not rows:
+        return [], assignments
+    if llm is None:
+        llm = _get_chat_model(model, _resolve_api_key(api_key), 0.7)
+
+    vectors = np.asarray([embeddings[row] for row in rows], dtype='float32')
+    kmeans = MiniBatchKMeans(
+        n_clusters=min(n_clusters, len(rows)), random_state=0, batch_size=4096, n_init=3
+    ).fit(vectors)
+    labels = kmeans.labels_
+    distances = np.linalg.norm(vectors - kmeans.cluster_centers_[labels], axis=1)
+
+    # Map: name each cluster from the responses nearest its centre.
+    clusters = sorted(set(labels.tolist()))
+    representatives = {}
+    for cluster in clusters:
+        members = np.flatnonzero(labels == cluster)
+        nearest = members[np.argsort(distances[members])[:samples_per_cluster]]
+        representatives[cluster] = [texts[rows[member]] for member in nearest]
+
+    def name_cluster(cluster):
+        samples = "\n".join(f"- {' '.join(text.split())}" for text in representatives[cluster])
+        output = structured_output.request_json(
+            llm, prompts.CLUSTER_THEME_PROMPT.format(responses=samples), structured_output.ClusterTheme
         )
-        chain = LLMChain(llm=llm, prompt=prompt)
-        result = chain.run(responses=batched_responses)
-        return result
-    except Exception as e:
-        print(f"An error occurred during theme extraction: {e}")
-        return None
+        theme = structured_output.validate(structured_output.ClusterTheme, output)
+        return (theme.theme.strip(), theme.description) if theme else None
+
+    # Clusters whose reply fails validation are asked again, together, before falling back.
+    cluster_themes, pending = {}, clusters
+    for attempt in range(settings.STRUCTURED_OUTPUT_RETRIES + 1):
+        for cluster, result in zip(pending, _run_concurrently(name_cluster, pending, max_concurrency)):
+            if not isinstance(result, Exception) and result is not None:
+                cluster_themes[cluster + 1] = result
+        pending = [cluster for cluster in pending if cluster + 1 not in cluster_themes]
+        if not pending:
+            break
+    for cluster in pending:
+        print(f"Could not name theme cluster {cluster}.")
+        cluster_themes[cluster + 1] = (f"Cluster {cluster + 1}", "")
+    cluster_themes = dict(sorted(cluster_themes.items()))
+
+    # Reduce: merge similar cluster themes into the final list.
+    cluster_sizes = np.bincount(labels, minlength=max(clusters) + 1)
+    sizes = {cluster + 1: int(cluster_sizes[cluster]) for cluster in clusters}
+    merged = {}
+    for name, description, theme_clusters in _merge_cluster_themes(cluster_themes, sizes, llm):
+        # Fold themes the model gave the same name into one.
+        existing = merged.setdefault(name.lower(), (name, description, []))
+        existing[2].extend(theme_clusters)
+    merged = list(merged.values())
+    merged.sort(key=lambda theme: -sum(sizes[cluster] for cluster in theme[2]))
+
+    themes, theme_of_cluster = [], {}
+    for theme_id, (name, description, theme_clusters) in enumerate(merged, 1):
+        largest = max(theme_clusters, key=lambda cluster: sizes[cluster])
+        themes.append({
+            "theme_id": theme_id,
+            "name": name,
+            "description": description,
+            "frequency": sum(sizes[cluster] for cluster in theme_clusters),
+            "examples": representatives[largest - 1][:3],
+        })
+        for cluster in theme_clusters:
+            theme_of_cluster[cluster - 1] = theme_id
+    for row, label in zip(rows, labels):
+        assignments[row] = theme_of_cluster[int(label)]
+    return themes, assignments
 
 def get_summary(responses, model=settings.LLM_MODEL, api_key=None):
     """
     Generates a summary from a list of survey responses.
+    All responses are used; see `summarize_responses`.
     """
     if not responses:
         return None
 
-    final_api_key = api_key or settings.OPENAI_API_KEY
-    if not final_api_key:
-        raise ValueError("OpenAI API key is not set.")
-
-    batched_responses = "\n".join(responses[:50])
+    final_api_key = _resolve_api_key(api_key)
 
     try:
-        llm = ChatOpenAI(temperature=0.7, model_name=model, api_key=final_api_key)
-        prompt = PromptTemplate(
-            input_variables=["responses"],
-            template=prompts.SUMMARY_GENERATION_PROMPT,
-        )
-        chain = LLMChain(llm=llm, prompt=prompt)
-        result = chain.run(responses=batched_responses)
-        return result
+        return summarize_responses(responses, model=model, api_key=final_api_key)
     except Exception as e:
         print(f"An error occurred during summary generation: {e}")
         return None
 
-def search_similar_responses(query, index, documents, k=3):
+def _is_chunk_boundary(text):
+    """Content-defined chunk boundary: true for roughly one response in eight."""
+    return hashlib.blake2b(text.encode("utf-8"), digest_size=4).digest()[0] % 8 == 0
+
+def _chunk_by_content(texts, max_tokens, model):
     """
-    Searches for the most similar responses to a query using a FAISS index.
+    Splits texts into chunks of at most `max_tokens` tokens. Once a chunk is half full it
+    is cut after a response that satisfies `_is_chunk_boundary`, so boundaries depend on
+    the responses themselves: adding or removing rows only changes the chunks around them.
     """
-    if index is None:
-        return None, None
-
-    query_embedding = get_embeddings([query])[0]
-    distances, indices = index.search(np.array([query_embedding]).astype('float32'), k)
+    chunks, chunk, chunk_tokens = [], [], 0
+    for text in texts:
+        tokens = count_tokens(text, model)
+        if chunk and chunk_tokens + tokens > max_tokens:
+            chunks.append(chunk)
+            chunk, chunk_tokens = [], 0
+        chunk.append(text)
+        chunk_tokens += tokens
+        if chunk_tokens >= max_tokens // 2 and _is_chunk_boundary(text):
+            chunks.append(chunk)
+            chunk, chunk_tokens = [], 0
+    if chunk:
+        chunks.append(chunk)
+    return chunks
 
-    results = [documents[i] for i in indices[0]]
-    return results, distances[0] 
-
-def get_rag_chain(index, documents):
+def summarize_responses(responses, model=settings.LLM_MODEL, api_key=None, llm=None,
+                        max_chunk_tokens=None, max_concurrency=None, cache=None):
     """
-    Creates a Retrieval-Augmented Generation (RAG) chain.
+    Summarizes the full set of responses with a hierarchical map-reduce:
+    responses are split into token-budgeted chunks that are summarized concurrently,
+    and the chunk summaries are combined over as many levels as needed until they fit
+    into a single final prompt. Summaries too long to be combined with any other are
+    truncated, so no prompt exceeds `max_chunk_tokens`.
+
+    Every LLM output is cached by (model, prompt, input), so re-running, or running
+    after rows were added, only recomputes the chunks that changed.
     """
-    if index is None or not documents:
+    max_chunk_tokens = max_chunk_tokens or settings.SUMMARY_CHUNK_TOKENS
+    max_concurrency = max_concurrency or settings.LLM_MAX_CONCURRENCY
+    cache = cache if cache is not None else get_llm_cache()
+
+    texts = [" ".join(str(text).split()) for text in responses if text and str(text).strip()]
+    if not texts:
         return None
+    if llm is None:
+        llm = _get_chat_model(model, _resolve_api_key(api_key), 0.7)
 
-    # This is a hack. LangChain's FAISS wrapper needs a way to map
-    # the index back to the text. We create a temporary mapping.
-    # A real implementation would use a more robust VectorStore that stores metadata.
-    doc_mapping = {i: doc for i, doc in enumerate(documents)}
-    
-    # We need to re-create the index with the document mapping for LangChain
-    # This is inefficient but necessary for this simplified setup.
-    # The embeddings function should be compatible with LangChain's expectations.
-    embeddings_func = OpenAIEmbeddings(api_key=settings.OPENAI_API_KEY)
-
-    # To use LangChain's FAISS, we need to provide it with texts and an embedding function.
-    # Since we already have the index, this is not ideal. We will wrap the raw FAISS index.
-    # This requires a bit of a workaround since LangChain wants to build it from texts.
-    # A proper solution would use a LangChain-compatible vector store from the beginning.
-    
-    # Let's try to wrap the existing index. This part is tricky.
-    # The FAISS wrapper in LangChain expects to be created with `from_texts`.
-    # Let's see if we can manually construct it.
-    
-    # For simplicity, we'll stick to a simpler RAG implementation for now without the full chain.
-    # We will get the results from our search and then feed them to a separate LLM call.
-    return None # Placeholder for now
-
-def get_answer_from_context(query, context_documents, model=settings.LLM_MODEL, api_key=None):
+    def complete(prompt_name, prompt, structured=False):
+        key = make_cache_key(model, prompt_name, prompt)
+        cached = cache.get(key)
+        get_metrics().record_cache("llm", model, hits=cached is not None, misses=cached is None)
+        if cached is not None:
+            return cached
+        if structured:
+            # Final summaries are requested as structured output and validated.
+            summary = None
+            for attempt in range(settings.STRUCTURED_OUTPUT_RETRIES + 1):
+                try:
+                    output = structured_output.request_json(llm, prompt, structured_output.Summary)
+                    summary = structured_output.validate(structured_output.Summary, output)
+                except ValueError as e:
+                    print(f"Invalid summary reply: {e}")
+                if summary is not None:
+                    break
+            if summary is None:
+                raise ValueError("The model did not return a valid summary.")
+            result = summary.summary.strip()
+        else:
+            result = tracked_call("chat", model_name(llm), llm.invoke, prompt).content
+        cache.put(key, result)
+        return result
+
+    def run_level(prompt_name, prompt_inputs):
+        results = _run_concurrently(lambda prompt: complete(prompt_name, prompt), prompt_inputs, max_concurrency)
+        for result in results:
+            if isinstance(result, Exception):
+                raise result
+        return results
+
+    chunks = _chunk_by_content(texts, max_chunk_tokens, model)
+    if len(chunks) == 1:
+        prompt = prompts.SUMMARY_GENERATION_PROMPT.format(responses="\n".join(chunks[0]))
+        return complete("SUMMARY_GENERATION_PROMPT", prompt, structured=True)
+
+    # Map: summarize every chunk.
+    summaries = run_level("CHUNK_SUMMARY_PROMPT", [
+        prompts.CHUNK_SUMMARY_PROMPT.format(responses="\n".join(chunk)) for chunk in chunks
+    ])
+
+    # Reduce: combine summaries level by level until they fit into one prompt.
+    separator_tokens = count_tokens("\n---\n", model)
+    while True:
+        token_counts = [count_tokens(summary, model) for summary in summaries]
+        groups = pack_by_tokens([tokens + separator_tokens for tokens in token_counts], max_chunk_tokens)
+        if len(groups) == 1 and sum(token_counts) <= max_chunk_tokens:
+            break
+        if len(groups) == len(summaries):
+            if len(summaries) == 1:
+                summaries = [truncate_to_tokens(summaries[0], max_chunk_tokens, model)]
+                break
+            # No two summaries fit together: cut each to half the budget and combine them in pairs.
+            limit = max_chunk_tokens // 2 - separator_tokens
+            summaries = [truncate_to_tokens(summary, limit, model) for summary in summaries]
+            groups = [list(range(start, min(start + 2, len(summaries)))) for start in range(0, len(summaries), 2)]
+        summaries = run_level("SUMMARY_COMBINE_PROMPT", [
+            prompts.SUMMARY_COMBINE_PROMPT.format(summaries="\n---\n".join(summaries[i] for i in group))
+            for group in groups
+        ])
+    prompt = prompts.SUMMARY_REDUCE_PROMPT.format(summaries="\n---\n".join(summaries))
+    return complete("SUMMARY_REDUCE_PROMPT", prompt, structured=True)
+
+def _retrieve(query, query_vector, store, k, filters, search_mode, reranker):
+    if query_vector is None:
+        return []
+    if search_mode == "hybrid":
+        return store.hybrid_search(query, query_vector, k=k, filters=filters, reranker=reranker)
+    return store.search(query_vector, k=k, filters=filters)
+
+def _retrieve_batch(queries, query_vectors, store, k, filters, search_mode, reranker):
+    positions = [position for position, vector in enumerate(query_vectors) if vector is not None]
+    results = [[] for _ in queries]
+    if not positions:
+        return results
+    vectors = [query_vectors[position] for position in positions]
+    if search_mode == "hybrid":
+        hits = store.hybrid_search_batch(
+            [queries[position] for position in positions], vectors, k=k, filters=filters, reranker=reranker
+        )
+    else:
+        hits = store.search_batch(vectors, k=k, filters=filters)
+    for position, position_hits in zip(positions, hits):
+        results[position] = position_hits
+    return results
+
+def search_similar_responses(query, store, k=3, filters=None, api_key=None, search_mode=None, reranker=None):
     """
-    Generates an answer to a query based on a list of context documents.
+    Searches for the most similar responses to a query in a `SurveyVectorStore`.
+    `filters` restricts the search to responses with matching metadata.
+    `search_mode` is "hybrid" (BM25 and vector search fused, optionally reranked with the
+    `reranker` cross-encoder) or "dense"; both default to the settings.
+    Returns a list of hit dicts (response id, text, distance, sentiment and attributes).
     """
-    if not context_documents:
-        return "Could not find any relevant information."
+    if store is None or store.index is None:
+        return []
 
-    final_api_key = api_key or settings.OPENAI_API_KEY
-    if not final_api_key:
-        raise ValueError("OpenAI API key is not set.")
+    query_embedding = get_embeddings([query], api_key=api_key)[0]
+    return _retrieve(
+        query, query_embedding, store, k, filters,
+        search_mode or settings.SEARCH_MODE, reranker if reranker is not None else settings.RERANKER_MODEL
+    )
 
-    context = "\n---\n".join(context_documents)
-    
-    template = f"""
-    Answer the following query based on the provided context of survey responses.
-    If the context does not contain the answer, say so.
+def _filters_key(filters):
+    return tuple(sorted(
+        (field, tuple(sorted(map(str, value))) if isinstance(value, (list, tuple, set)) else str(value))
+        for field, value in (filters or {}).items()
+    ))
 
-    Query: {query}
+_ANSWER_ERROR = "There was an error generating the answer."
+_NO_CONTEXT_ANSWER = "Could not find any relevant information."
 
-    Context:
-    {context}
+def pack_context(documents, max_tokens=None, model=settings.LLM_MODEL):
+    """
+    Joins the documents (most relevant first) into a context that fits in `max_tokens`.
+    Documents are added whole while they fit; the first document that does not fit is
+    truncated to the remaining budget, and the rest are dropped.
+    Returns the context and the number of documents it includes.
+    """
+    max_tokens = max_tokens or settings.QUERY_CONTEXT_MAX_TOKENS
+    separator_tokens = count_tokens("\n---\n", model)
+    parts, used = [], 0
+    for document in documents:
+        tokens = count_tokens(document, model) + (separator_tokens if parts else 0)
+        if used + tokens > max_tokens:
+            remaining = max_tokens - used - (separator_tokens if parts else 0)
+            if remaining > 0:
+                parts.append(truncate_to_tokens(document, remaining, model))
+            break
+        parts.append(document)
+        used += tokens
+    return "\n---\n".join(parts), len(parts)
 
-    Answer:
+def stream_answer_from_context(query, context_documents, model=settings.LLM_MODEL, api_key=None, llm=None,
+                               max_context_tokens=None, status=None):
+    """
+    Generates an answer to a query from a list of context documents, yielding the text
+    as the model produces it. The documents are packed to `max_context_tokens`
+    (see `pack_context`). `llm` can be any LangChain chat model that supports `.stream()`.
+    If generation fails, an error message is yielded after the text produced so far and,
+    when a `status` dict is given, its "error" is set to the exception.
     """
+    if not context_documents:
+        yield _NO_CONTEXT_ANSWER
+        return
 
+    llm = llm or _get_chat_model(model, _resolve_api_key(api_key), 0)
+    context, _ = pack_context(context_documents, max_context_tokens, model)
+    prompt = prompts.QUERY_ANSWER_PROMPT.format(query=query, context=context)
+    started, parts, error = time.perf_counter(), [], None
     try:
-        llm = ChatOpenAI(temperature=0, model_name=model, api_key=final_api_key)
-        response = llm.invoke(template)
-        return response.content
+        for chunk in llm.stream(prompt):
+            if chunk.content:
+                parts.append(chunk.content)
+                yield chunk.content
     except Exception as e:
+        error = e
+        if status is not None:
+            status["error"] = e
         print(f"An error occurred during answer generation: {e}")
-        return "There was an error generating the answer." 
\ No newline at end of file
+        yield _ANSWER_ERROR
+    finally:
+        # Streamed replies carry no usage data, so tokens are counted locally.
+        get_metrics().record_call(
+            "chat", model_name(llm), time.perf_counter() - started,
+            count_tokens(prompt, model), count_tokens("".join(parts), model), error=error
+        )
+
+def get_answer_from_context(query, context_documents, model=settings.LLM_MODEL, api_key=None, llm=None):
+    """
+    Generates an answer to a query based on a list of context documents.
+    """
+    return "".join(stream_answer_from_context(query, context_documents, model=model, api_key=api_key, llm=llm))
+
+def stream_answer_query(query, store, k=3, filters=None, model=settings.LLM_MODEL, api_key=None, cache=None,
+                        llm=None, search_mode=None, reranker=None):
+    """
+    Answers a question over a `SurveyVectorStore` while streaming the answer: retrieves the
+    `k` most similar responses (see `search_similar_responses` for `search_mode` and
+    `reranker`), then generates an answer from them.
+
+    Returns `(result, chunks)`. `result` is a dict with the `hits`, the cache `match`
+    ("exact", "semantic" or None), the `cached_query` it matched and `retrieval_seconds`;
+    iterating `chunks` yields the answer text, and once it is exhausted `result` also holds
+    the `answer`, `first_token_seconds` and the total `seconds` (all measured from the call),
+    and `error` is the exception if generation failed part-way. Failed answers are not cached.
+
+    Results are memoized in a `SemanticQueryCache` (the process-wide one by default), scoped
+    to the index version, filters, `k`, retrieval settings and model. A repeated or near-duplicate question is
+    answered from the cache; only the query embedding is computed, and that usually comes
+    from the embedding cache.
+    """
+    cache = cache if cache is not None else get_query_cache()
+    search_mode = search_mode or settings.SEARCH_MODE
+    reranker = reranker if reranker is not None else settings.RERANKER_MODEL
+    started = time.perf_counter()
+    result = {"hits": [], "match": None, "cached_query": None, "answer": None,
+              "retrieval_seconds": 0.0, "first_token_seconds": None, "seconds": None, "error": None}
+
+    entry = scope = query_vector = None
+    if store is not None and store.index is not None:
+        query_vector = get_embeddings([query], api_key=api_key)[0]
+        scope = (store.index_path, store.version, _filters_key(filters), k, search_mode, reranker, model)
+        entry, result["match"] = cache.get(query, query_vector, scope=scope)
+        get_metrics().record_cache("query", model, hits=entry is not None, misses=entry is None)
+        if entry is not None:
+            result.update(hits=entry["value"]["hits"], cached_query=entry["query"])
+        else:
+            result["hits"] = _retrieve(query, query_vector, store, k, filters, search_mode, reranker)
+    result["retrieval_seconds"] = time.perf_counter() - started
+
+    def chunks():
+        if entry is not None:
+            parts = iter([entry["value"]["answer"]])
+        else:
+            parts = stream_answer_from_context(
+                query, [hit['text'] for hit in result["hits"]], model=model, api_key=api_key, llm=llm, status=result
+            )
+        answer = []
+        for part in parts:
+            if result["first_token_seconds"] is None:
+                result["first_token_seconds"] = time.perf_counter() - started
+            answer.append(part)
+            yield part
+        result["answer"] = "".join(answer)
+        result["seconds"] = time.perf_counter() - started
+        if entry is None and result["hits"] and result["error"] is None:
+            cache.put(query, {"answer": result["answer"], "hits": result["hits"]}, result["seconds"],
+                      query_vector=query_vector, scope=scope)
+
+    return result, chunks()
+
+def answer_query(query, store, k=3, filters=None, model=settings.LLM_MODEL, api_key=None, cache=None, llm=None,
+                 search_mode=None, reranker=None):
+    """
+    Non-streaming version of `stream_answer_query`. Returns its result dict with the
+    complete `answer`.
+    """
+    result, chunks = stream_answer_query(
+        query, store, k=k, filters=filters, model=model, api_key=api_key, cache=cache, llm=llm,
+        search_mode=search_mode, reranker=reranker
+    )
+    for _ in chunks:
+        pass
+    return result
+
+def answer_queries(questions, store, k=3, filters=None, model=settings.LLM_MODEL, api_key=None, cache=None, llm=None,
+                   search_mode=None, reranker=None, max_concurrency=None, progress_callback=None):
+    """
+    Answers a bank of questions in one pass: every question is embedded in one batched
+    embedding request, retrieval runs as a single matrix search over all query vectors
+    (see `SurveyVectorStore.search_batch`), and answers are generated concurrently on up
+    to `max_concurrency` threads. Questions already in the query cache are not searched
+    or answered again (see `stream_answer_query`).
+    `progress_callback(done, total)` is called as answers finish.
+    Returns a DataFrame with one row per question: the `question`, its `answer`, the ids
+    of the `response_ids` used as context, the `cache` match ("exact", "semantic" or
+    "miss") and the `seconds` spent generating the answer.
+    """
+    cache = cache if cache is not None else get_query_cache()
+    search_mode = search_mode or settings.SEARCH_MODE
+    reranker = reranker if reranker is not None else settings.RERANKER_MODEL
+    questions = [str(question) for question in questions]
+    columns = ["question", "answer", "response_ids", "cache", "seconds"]
+    if not questions:
+        return pd.DataFrame(columns=columns)
+
+    if store is not None and store.index is not None:
+        query_vectors = get_embeddings(questions, api_key=api_key)
+    else:
+        query_vectors = [None] * len(questions)
+    scope = (store.index_path, store.version, _filters_key(filters), k, search_mode, reranker, model) if store else None
+    lookups = [
+        cache.get(question, vector, scope=scope) if vector is not None else (None, None)
+        for question, vector in zip(questions, query_vectors)
+    ]
+    misses = [position for position, (entry, _) in enumerate(lookups) if entry is None]
+    get_metrics().record_cache("query", model, hits=len(questions) - len(misses), misses=len(misses))
+    searched = _retrieve_batch(
+        [questions[position] for position in misses], [query_vectors[position] for position in misses],
+        store, k, filters, search_mode, reranker
+    )
+    hits = {position: position_hits for position, position_hits in zip(misses, searched)}
+
+    def generate(position):
+        started, status = time.perf_counter(), {"error": None}
+        answer = "".join(stream_answer_from_context(
+            questions[position], [hit['text'] for hit in hits[position]], model=model, api_key=api_key, llm=llm,
+            status=status
+        ))
+        return answer, time.perf_counter() - started, status["error"]
+
+    generated = dict(zip(misses, _run_concurrently(
+        generate, misses, max_concurrency or settings.LLM_MAX_CONCURRENCY, progress_callback
+    )))
+
+    rows = []
+    for position, (question, (entry, match)) in enumerate(zip(questions, lookups)):
+        if entry is not None:
+            answer, position_hits, seconds = entry["value"]["answer"], entry["value"]["hits"], 0.0
+        else:
+            result = generated[position]
+            answer, seconds, error = result if not isinstance(result, Exception) else (_ANSWER_ERROR, 0.0, result)
+            position_hits = hits[position]
+            if position_hits and error is None:
+                cache.put(question, {"answer": answer, "hits": position_hits}, seconds,
+                          query_vector=query_vectors[position], scope=scope)
+        rows.append({
+            "question": question,
+            "answer": answer,
+            "response_ids": [hit['response_id'] for hit in position_hits],
+            "cache": match or "miss",
+            "seconds": seconds,
+        })
+    return pd.DataFrame(rows, columns=columns)
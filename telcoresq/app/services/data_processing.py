@@ -1,20 +1,152 @@
 import pandas as pd
+import numpy as np
+import pyarrow.parquet as pq
+import codecs
+import hashlib
 import json
+import os
 import re
+from telcoresq.config import settings
 
-def parse_file(uploaded_file):
+# Parquet schema metadata listing columns stored as integer codes that load as categoricals
+# (written by convert_dat.py)
+_CATEGORICAL_METADATA_KEY = b"telcoresq:categorical"
+
+def _parquet_to_pandas(data, metadata):
+    """Converts an Arrow table or record batch read from Parquet, restoring categorical columns."""
+    df = data.to_pandas()
+    for column in json.loads((metadata or {}).get(_CATEGORICAL_METADATA_KEY, b"[]")):
+        if column in df.columns:
+            df[column] = df[column].astype("category")
+    return df
+
+def parse_file(uploaded_file, columns=None):
     """
-    Parses an uploaded file (CSV or JSON) into a pandas DataFrame.
+    Parses an uploaded file (CSV, JSON, JSON Lines or Parquet) into a pandas DataFrame.
+    For Parquet files only `columns` (default: all) are read from disk.
     """
-    if uploaded_file.name.endswith('.csv'):
+    if uploaded_file.name.endswith('.parquet'):
+        table = pq.read_table(uploaded_file, columns=columns)
+        df = _parquet_to_pandas(table, table.schema.metadata)
+    elif uploaded_file.name.endswith('.csv'):
         df = pd.read_csv(uploaded_file)
+    elif uploaded_file.name.endswith(('.jsonl', '.ndjson')):
+        df = pd.read_json(uploaded_file, lines=True)
     elif uploaded_file.name.endswith('.json'):
         data = json.load(uploaded_file)
         df = pd.json_normalize(data)
     else:
-        raise ValueError("Unsupported file type. Please upload a CSV or JSON file.")
+        raise ValueError("Unsupported file type. Please upload a CSV, JSON, JSON Lines or Parquet file.")
     return df 
 
+def _iter_json_array(fp, block_size=1 << 20):
+    """
+    Yields the items of a top-level JSON array one at a time, reading the file in
+    blocks instead of loading it whole. Raises ValueError if the file is not an array.
+    """
+    decoder = json.JSONDecoder()
+    text_decoder = codecs.getincrementaldecoder("utf-8")()
+    state = {"buffer": "", "position": 0, "eof": False}
+
+    def fill():
+        block = fp.read(block_size)
+        if isinstance(block, bytes):
+            block = text_decoder.decode(block, final=not block)
+        state["eof"] = not block
+        state["buffer"] = state["buffer"][state["position"]:] + block
+        state["position"] = 0
+
+    def skip(separators=""):
+        while True:
+            buffer, position = state["buffer"], state["position"]
+            while position < len(buffer) and (buffer[position].isspace() or buffer[position] in separators):
+                position += 1
+            state["position"] = position
+            if position < len(buffer) or state["eof"]:
+                return
+            fill()
+
+    skip()
+    if state["buffer"][state["position"]:state["position"] + 1] != "[":
+        raise ValueError("The JSON file does not contain a top-level array.")
+    state["position"] += 1
+    while True:
+        skip(",")
+        if state["position"] >= len(state["buffer"]):
+            raise ValueError("Unexpected end of JSON array.")
+        if state["buffer"][state["position"]] == "]":
+            return
+        try:
+            item, end = decoder.raw_decode(state["buffer"], state["position"])
+        except json.JSONDecodeError:
+            if state["eof"]:
+                raise
+            fill()
+            continue
+        if end == len(state["buffer"]) and not state["eof"]:
+            # A value ending exactly at the block edge (e.g. a number) may continue in the next block.
+            fill()
+            continue
+        state["position"] = end
+        yield item
+
+def iter_file_chunks(uploaded_file, chunksize=None, columns=None):
+    """
+    Parses an uploaded file incrementally, yielding DataFrames of at most `chunksize` rows.
+    CSV and JSON Lines are read with pandas chunked readers; JSON arrays are decoded one
+    record at a time. JSON files that are not arrays are loaded whole (a JSON array that
+    turns out to be invalid after chunks were yielded raises instead). Parquet files are
+    read in record batches, and only `columns` (default: all) are read from disk.
+    """
+    chunksize = chunksize or settings.INGEST_CHUNK_ROWS
+    name = uploaded_file.name
+    if name.endswith('.parquet'):
+        parquet_file = pq.ParquetFile(uploaded_file)
+        for batch in parquet_file.iter_batches(batch_size=chunksize, columns=columns):
+            yield _parquet_to_pandas(batch, parquet_file.schema_arrow.metadata)
+    elif name.endswith('.csv'):
+        yield from pd.read_csv(uploaded_file, chunksize=chunksize)
+    elif name.endswith(('.jsonl', '.ndjson')):
+        with pd.read_json(uploaded_file, lines=True, chunksize=chunksize) as reader:
+            yield from reader
+    elif name.endswith('.json'):
+        yielded = False
+        try:
+            records = []
+            for record in _iter_json_array(uploaded_file):
+                records.append(record)
+                if len(records) >= chunksize:
+                    yielded = True
+                    yield pd.json_normalize(records)
+                    records = []
+            if records:
+                yielded = True
+                yield pd.json_normalize(records)
+        except ValueError:
+            if yielded:
+                # Re-reading the file would yield the rows of earlier chunks again.
+                raise
+            uploaded_file.seek(0)
+            df = parse_file(uploaded_file)
+            for start in range(0, len(df), chunksize):
+                yield df.iloc[start:start + chunksize]
+    else:
+        raise ValueError("Unsupported file type. Please upload a CSV, JSON, JSON Lines or Parquet file.")
+
+def read_progress(uploaded_file):
+    """Fraction of an open file that has been read so far."""
+    size = getattr(uploaded_file, "size", None)
+    if size is None:
+        size = os.fstat(uploaded_file.fileno()).st_size
+    return min(1.0, uploaded_file.tell() / size) if size else 1.0
+
+_PUNCTUATION_PATTERN = re.compile(r'[^\w\s]')
+# ASCII characters removed by `_PUNCTUATION_PATTERN`, for the bytes.translate() fast path
+_ASCII_PUNCTUATION = bytes(c for c in range(128) if _PUNCTUATION_PATTERN.match(chr(c)))
+# Joins texts for bulk cleaning. It counts as whitespace for `\s`, so cleaning keeps it.
+_JOIN_SEPARATOR = "\x1f"
+_CLEAN_BLOCK_ROWS = 100000
+
 def clean_text(text):
     """
     Cleans a single text string by converting to lowercase, removing punctuation,
@@ -27,11 +159,137 @@ def clean_text(text):
     text = text.strip()
     return text
 
-def preprocess_dataframe(df, text_columns):
+def _clean_values(values):
+    """
+    Cleans a list of values with the same result as `clean_text`.
+    ASCII texts are joined into blocks and cleaned with one lower() and one
+    bytes.translate() per block; other texts fall back to `clean_text`.
+    """
+    cleaned = [""] * len(values)
+    ascii_rows = []
+    for row, value in enumerate(values):
+        if isinstance(value, str):
+            if value.isascii():
+                ascii_rows.append(row)
+            else:
+                cleaned[row] = clean_text(value)
+
+    for start in range(0, len(ascii_rows), _CLEAN_BLOCK_ROWS):
+        block = ascii_rows[start:start + _CLEAN_BLOCK_ROWS]
+        joined = _JOIN_SEPARATOR.join(values[row] for row in block)
+        if joined.count(_JOIN_SEPARATOR) != len(block) - 1:
+            # A text contains the separator itself; clean this block value by value.
+            for row in block:
+                cleaned[row] = clean_text(values[row])
+            continue
+        joined = joined.encode("ascii").lower().translate(None, _ASCII_PUNCTUATION).decode("ascii")
+        for row, part in zip(block, joined.split(_JOIN_SEPARATOR)):
+            cleaned[row] = part.strip()
+    return cleaned
+
+def clean_series(series, workers=None):
+    """
+    Vectorized `clean_text` for a whole column. Frames larger than
+    CLEAN_TEXT_PARALLEL_MIN_ROWS are split across `workers` processes.
+    """
+    workers = workers or settings.CLEAN_TEXT_WORKERS
+    values = series.tolist()
+    if workers > 1 and len(values) >= settings.CLEAN_TEXT_PARALLEL_MIN_ROWS:
+        from concurrent.futures import ProcessPoolExecutor
+        size = -(-len(values) // workers)
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            parts = executor.map(_clean_values, [values[i:i + size] for i in range(0, len(values), size)])
+            cleaned = [value for part in parts for value in part]
+    else:
+        cleaned = _clean_values(values)
+    return pd.Series(cleaned, index=series.index, dtype=object, name=series.name)
+
+def preprocess_dataframe(df, text_columns, workers=None):
     """
     Applies text cleaning to specified columns of a DataFrame.
     """
     for col in text_columns:
         if col in df.columns:
-            df[col] = df[col].apply(clean_text)
-    return df 
\ No newline at end of file
+            df[col] = clean_series(df[col], workers=workers)
+    return df
+
+# Arrow-backed strings: one contiguous buffer per column instead of a Python object per value
+ARROW_STRING = pd.StringDtype("pyarrow")
+
+def dataset_hash(uploaded_file, block_size=1 << 24):
+    """Content hash of an uploaded file, read in blocks. The file is rewound afterwards."""
+    digest = hashlib.blake2b(digest_size=16)
+    uploaded_file.seek(0)
+    while block := uploaded_file.read(block_size):
+        digest.update(block)
+    uploaded_file.seek(0)
+    return digest.hexdigest()
+
+def _is_text(dtype):
+    return dtype == object or isinstance(dtype, pd.StringDtype)
+
+def text_columns(df):
+    """Names of the columns holding strings, including categoricals of strings."""
+    return [
+        column for column, dtype in df.dtypes.items()
+        if _is_text(dtype) or (isinstance(dtype, pd.CategoricalDtype) and _is_text(dtype.categories.dtype))
+    ]
+
+def compact_dataframe(df, max_unique_ratio=None):
+    """
+    Returns `df` with memory-compact column types:
+    - string columns whose share of distinct values is at most `max_unique_ratio`
+      (codes, labels) become categoricals, other string columns Arrow-backed strings
+    - integer columns are downcast to the smallest integer type that holds them
+    Object columns holding anything other than strings (e.g. lists) are left as they are.
+    """
+    max_unique_ratio = max_unique_ratio if max_unique_ratio is not None else settings.CATEGORY_MAX_UNIQUE_RATIO
+    columns = {}
+    for name, column in df.items():
+        if _is_text(column.dtype) and pd.api.types.infer_dtype(column, skipna=True) in ("string", "empty"):
+            if column.nunique() <= max_unique_ratio * len(column):
+                column = column.astype("category")
+            else:
+                column = column.astype(ARROW_STRING)
+        elif pd.api.types.is_integer_dtype(column.dtype) and isinstance(column.dtype, np.dtype):
+            column = pd.to_numeric(column, downcast="integer")
+        columns[name] = column
+    return pd.DataFrame(columns, index=df.index)
+
+def _hash_to_id(value):
+    """Maps a value to a stable non-negative 63-bit integer."""
+    digest = hashlib.blake2b(str(value).encode("utf-8"), digest_size=8).digest()
+    return int.from_bytes(digest, "big") & 0x7FFFFFFFFFFFFFFF
+
+def content_hash(text):
+    """Returns a short hash of a response text, used to detect changed rows."""
+    return hashlib.blake2b(str(text).encode("utf-8"), digest_size=16).hexdigest()
+
+def make_response_ids(df, text_column, id_column=None, occurrences=None, seen=None):
+    """
+    Returns a stable int64 response ID for every row of the DataFrame.
+
+    With `id_column`, integer IDs are used as-is and other values are hashed.
+    Without it, IDs are derived from the row text and its occurrence number, so
+    re-uploading the same file, or one with extra rows, keeps existing IDs.
+    When a file is processed in chunks, pass the same `occurrences` dict and `seen` set
+    for every chunk, so IDs are also unique across chunks.
+    """
+    if id_column:
+        values = df[id_column]
+        if pd.api.types.is_integer_dtype(values):
+            ids = values.to_numpy(dtype=np.int64)
+        else:
+            ids = np.array([_hash_to_id(value) for value in values], dtype=np.int64)
+    else:
+        occurrences = {} if occurrences is None else occurrences
+        ids = np.empty(len(df), dtype=np.int64)
+        for row, text in enumerate(df[text_column]):
+            occurrence = occurrences.get(text, 0)
+            occurrences[text] = occurrence + 1
+            ids[row] = _hash_to_id(f"{text}\x00{occurrence}")
+    if len(np.unique(ids)) != len(ids) or (seen is not None and not seen.isdisjoint(ids.tolist())):
+        raise ValueError("Response IDs must be unique. Please choose a different ID column.")
+    if seen is not None:
+        seen.update(ids.tolist())
+    return ids
@@ -1,33 +1,237 @@
+import os
+import threading
 import sqlalchemy
-from sqlalchemy import create_engine, Table, Column, Integer, String, MetaData, Float, Text
+import numpy as np
+from sqlalchemy import create_engine, event, select, func, Table, Column, Integer, BigInteger, String, MetaData, Float, Text, JSON, LargeBinary, DateTime
+from telcoresq.config import settings
 
-def get_engine(db_url):
-    """Creates a SQLAlchemy engine."""
-    return create_engine(db_url)
+metadata = MetaData()
 
-def create_tables(engine):
-    """Creates all necessary tables in the database."""
-    metadata = MetaData()
-
-    survey_responses = Table('survey_responses', metadata,
-        Column('response_id', Integer, primary_key=True, autoincrement=True),
-        Column('processed_text', Text, nullable=False),
-        Column('sentiment_score', Float),
-        Column('sentiment_label', String(50))
-    )
+survey_responses = Table('survey_responses', metadata,
+    Column('response_id', BigInteger, primary_key=True, autoincrement=False),
+    Column('processed_text', Text, nullable=False),
+    Column('sentiment_score', Float),
+    Column('sentiment_label', String(50), index=True), # Filtered on, and NULL marks pending responses
+    Column('sentiment_justification', Text),
+    Column('attributes', JSON), # Other columns of the survey row (demographics etc.), as strings
+    Column('theme_id', Integer, sqlalchemy.ForeignKey('themes.theme_id'), index=True)
+)
 
-    embeddings = Table('embeddings', metadata,
-        Column('embedding_id', Integer, primary_key=True, autoincrement=True),
-        Column('response_id', Integer, sqlalchemy.ForeignKey('survey_responses.response_id')),
-        Column('vector', Text, nullable=False) # Storing as text for simplicity, will be JSON/bytes in practice
-    )
+embeddings = Table('embeddings', metadata,
+    Column('embedding_id', Integer, primary_key=True, autoincrement=True),
+    Column('response_id', BigInteger, sqlalchemy.ForeignKey('survey_responses.response_id'), unique=True),
+    Column('dimension', Integer, nullable=False),
+    Column('vector', LargeBinary, nullable=False) # Raw float32 or float16 bytes, see EMBEDDING_STORAGE_DTYPE
+)
+
+themes = Table('themes', metadata,
+    Column('theme_id', Integer, primary_key=True, autoincrement=True),
+    Column('theme_name', String(255), unique=True, nullable=False),
+    Column('description', Text),
+    Column('frequency', Integer, default=1),
+    Column('examples', Text) # Storing as JSON string
+)
+
+jobs = Table('jobs', metadata,
+    Column('job_id', String(32), primary_key=True),
+    Column('source_path', Text, nullable=False),
+    Column('text_column', String(255), nullable=False),
+    Column('id_column', String(255)),
+    Column('status', String(20), nullable=False), # pending, running, failed or finished
+    Column('stage', String(50)), # Last completed stage
+    Column('error', Text),
+    Column('results', JSON), # Per-stage outputs, e.g. ingest counts and the executive summary
+    Column('created_at', DateTime, nullable=False),
+    Column('updated_at', DateTime, nullable=False),
+    sqlalchemy.Index('ix_jobs_status_created_at', 'status', 'created_at')
+)
+
+artifacts = Table('artifacts', metadata,
+    Column('name', String(100), primary_key=True), # e.g. "summary"
+    Column('value', JSON),
+    Column('updated_at', DateTime, nullable=False)
+)
+
+sentiment_groups = Table('sentiment_groups', metadata,
+    Column('text_key', String(32), primary_key=True), # Content hash of the normalized response text
+    Column('group_key', String(32), nullable=False, index=True), # text_key of the group's representative
+    Column('text', Text), # Response text; members keep theirs so their match can be checked again
+    # Set on representative rows only:
+    Column('signature', LargeBinary), # MinHash signature (uint32 values), for near-duplicate matching
+    Column('sentiment_label', String(50)),
+    Column('sentiment_score', Float),
+    Column('sentiment_justification', Text)
+)
+
+aggregates = Table('aggregates', metadata,
+    Column('cell_id', Integer, primary_key=True, autoincrement=True),
+    Column('sentiment_label', String(50), nullable=False),
+    Column('theme', String(255), nullable=False),
+    Column('dimensions', JSON, nullable=False), # {attribute: value} of the demographic dimensions
+    Column('responses', Integer, nullable=False),
+    Column('score_sum', Float, nullable=False),
+    Column('scored', Integer, nullable=False) # Responses with a sentiment score, for mean scores
+)
+
+# Engines shared by every session and worker thread of a process, by (process id, URL)
+_engines = {}
+_engines_lock = threading.Lock()
 
-    themes = Table('themes', metadata,
-        Column('theme_id', Integer, primary_key=True, autoincrement=True),
-        Column('theme_name', String(255), unique=True, nullable=False),
-        Column('frequency', Integer, default=1),
-        Column('examples', Text) # Storing as JSON string
+def _set_sqlite_pragmas(dbapi_connection, connection_record):
+    # WAL lets readers run while one writer commits; busy_timeout makes a second writer
+    # wait for the lock instead of failing with "database is locked".
+    cursor = dbapi_connection.cursor()
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute("PRAGMA synchronous=NORMAL")  # Safe with WAL; syncs at checkpoints instead of every commit
+    cursor.execute(f"PRAGMA busy_timeout={settings.SQLITE_BUSY_TIMEOUT_MS}")
+    cursor.execute(f"PRAGMA cache_size=-{settings.SQLITE_CACHE_SIZE_MB * 1024}")
+    cursor.execute(f"PRAGMA mmap_size={settings.SQLITE_MMAP_SIZE_MB * 1024 * 1024}")
+    cursor.execute("PRAGMA temp_store=MEMORY")
+    cursor.close()
+
+def _create_engine(db_url):
+    url = sqlalchemy.engine.make_url(db_url)
+    if url.get_backend_name() != "sqlite":
+        # Server databases such as PostgreSQL: a bounded pool, with stale connections
+        # (e.g. closed by the server after a restart) replaced transparently.
+        return create_engine(
+            url, pool_size=settings.DB_POOL_SIZE, max_overflow=settings.DB_MAX_OVERFLOW,
+            pool_pre_ping=True, pool_recycle=settings.DB_POOL_RECYCLE_SECONDS,
+        )
+    if url.database in (None, "", ":memory:"):
+        return create_engine(url)
+    engine = create_engine(
+        url, pool_size=settings.DB_POOL_SIZE, max_overflow=settings.DB_MAX_OVERFLOW,
+        connect_args={"check_same_thread": False, "timeout": settings.SQLITE_BUSY_TIMEOUT_MS / 1000},
     )
+    event.listen(engine, "connect", _set_sqlite_pragmas)
+    return engine
+
+def get_engine(db_url=None):
+    """
+    Returns the engine for `db_url` (default `DATABASE_URL`). Engines are created once
+    per process and URL and shared, so all sessions and worker threads draw connections
+    from one pool. SQLite databases use WAL mode, so sessions and batch jobs can read
+    while another one writes; other URLs (e.g. postgresql://) get a pre-pinged pool.
+    """
+    db_url = db_url or settings.DATABASE_URL
+    # Keyed by process too: pooled connections must not be shared with forked workers.
+    key = (os.getpid(), str(db_url))
+    with _engines_lock:
+        engine = _engines.get(key)
+        if engine is None:
+            engine = _engines[key] = _create_engine(db_url)
+    return engine
 
+def create_tables(engine):
+    """
+    Creates all necessary tables in the database, and any indexes missing from
+    tables created by earlier versions.
+    """
     metadata.create_all(engine)
-    print("Tables created successfully.") 
\ No newline at end of file
+    for table in metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(engine, checkfirst=True)
+    print("Tables created successfully.")
+
+def execute_batches(conn, stmt, rows, batch_size=None):
+    """Executes `stmt` for `rows` (a list of parameter dicts) in executemany batches of `batch_size` rows."""
+    batch_size = batch_size or settings.DB_BULK_BATCH_SIZE
+    for start in range(0, len(rows), batch_size):
+        conn.execute(stmt, rows[start:start + batch_size])
+
+def upsert_rows(conn, table, rows, key_columns, batch_size=None):
+    """
+    Inserts `rows` (a list of dicts) into `table`, updating rows whose `key_columns` already exist.
+    Only the columns present in the rows are updated; other columns keep their stored values.
+    Uses the native ON CONFLICT clause on SQLite and PostgreSQL, and writes in
+    executemany batches of `batch_size` rows.
+    """
+    if not rows:
+        return
+    batch_size = batch_size or settings.DB_BULK_BATCH_SIZE
+    if conn.dialect.name == "sqlite":
+        from sqlalchemy.dialects.sqlite import insert
+    elif conn.dialect.name == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert
+    else:
+        key = sqlalchemy.tuple_(*[table.c[column] for column in key_columns])
+        update = table.update().where(sqlalchemy.and_(
+            *[table.c[column] == sqlalchemy.bindparam(f"b_{column}") for column in key_columns]
+        ))
+        for start in range(0, len(rows), batch_size):
+            batch = rows[start:start + batch_size]
+            keys = [tuple(row[column] for column in key_columns) for row in batch]
+            existing = {tuple(row) for row in conn.execute(
+                select(*[table.c[column] for column in key_columns]).where(key.in_(keys))
+            )}
+            updates = [
+                {**{f"b_{column}": row[column] for column in key_columns},
+                 **{column: value for column, value in row.items() if column not in key_columns}}
+                for row, row_key in zip(batch, keys) if row_key in existing
+            ]
+            inserts = [row for row, row_key in zip(batch, keys) if row_key not in existing]
+            if updates and len(updates[0]) > len(key_columns):
+                conn.execute(update, updates)
+            if inserts:
+                conn.execute(table.insert(), inserts)
+        return
+    stmt = insert(table)
+    updates = {column: stmt.excluded[column] for column in rows[0] if column not in key_columns}
+    stmt = stmt.on_conflict_do_update(index_elements=key_columns, set_=updates)
+    execute_batches(conn, stmt, rows, batch_size)
+
+def bulk_upsert_embeddings(conn, ids, vectors, dtype=None, batch_size=None):
+    """
+    Stores one vector per response id as a binary blob of `dtype` (float32 or float16).
+    The vectors are converted to a single array up front, so each row is just a slice of it.
+    """
+    if not len(ids):
+        return
+    matrix = np.ascontiguousarray(vectors, dtype=dtype or settings.EMBEDDING_STORAGE_DTYPE)
+    dimension = matrix.shape[1]
+    rows = [
+        {"response_id": int(response_id), "dimension": dimension, "vector": matrix[row].tobytes()}
+        for row, response_id in enumerate(ids)
+    ]
+    upsert_rows(conn, embeddings, rows, ["response_id"], batch_size=batch_size)
+
+def load_embedding_matrix(engine, batch_size=None):
+    """
+    Loads every stored vector into one contiguous float32 array.
+    Returns `(ids, matrix)`, where `ids[i]` is the response id of `matrix[i]`.
+    Blobs are streamed in batches and decoded straight into the preallocated array; each
+    blob's storage dtype follows from its size and its row's `dimension`. Raises ValueError
+    if the stored vectors have different dimensions (they come from different models).
+    """
+    batch_size = batch_size or settings.DB_BULK_BATCH_SIZE
+    with engine.connect() as conn:
+        count, dimension, smallest = conn.execute(
+            select(func.count(), func.max(embeddings.c.dimension), func.min(embeddings.c.dimension))
+        ).one()
+        if not count:
+            return np.empty(0, dtype=np.int64), np.empty((0, 0), dtype=np.float32)
+        if smallest != dimension:
+            raise ValueError(
+                f"Stored embeddings have dimensions from {smallest} to {dimension}; they must all come from one model."
+            )
+
+        ids = np.empty(count, dtype=np.int64)
+        matrix = np.empty((count, dimension), dtype=np.float32)
+        result = conn.execution_options(stream_results=True, yield_per=batch_size).execute(
+            select(embeddings.c.response_id, embeddings.c.vector).order_by(embeddings.c.response_id)
+        )
+        filled = 0
+        for batch in result.partitions():
+            ids[filled:filled + len(batch)] = [row.response_id for row in batch]
+            sizes = np.fromiter((len(row.vector) for row in batch), dtype=np.int64, count=len(batch))
+            # Blob size per vector tells float16 (2 bytes/value) from float32 (4 bytes/value).
+            for size in np.unique(sizes).tolist():
+                if size not in (dimension * 2, dimension * 4):
+                    raise ValueError(f"A stored embedding of {size} bytes does not match its dimension {dimension}.")
+                rows = np.flatnonzero(sizes == size)
+                blobs = b"".join(batch[row].vector for row in rows.tolist())
+                storage_dtype = np.float16 if size == dimension * 2 else np.float32
+                matrix[filled + rows] = np.frombuffer(blobs, dtype=storage_dtype).reshape(len(rows), dimension)
+            filled += len(batch)
+    return ids[:filled], matrix[:filled]
@@ -0,0 +1,245 @@
+import zlib
+import numpy as np
+from telcoresq.config import settings
+from telcoresq.app.services.data_processing import clean_text, content_hash
+
+DEDUP_MODES = ("off", "exact", "near")
+
+_MERSENNE_PRIME = np.uint64((1 << 61) - 1)
+_MAX_HASH = np.uint64((1 << 32) - 1)
+
+# Words that carry no meaning of their own; they are left out of near-duplicate signatures,
+# so "went down during the storm" matches "went down during storm".
+_STOP_WORDS = frozenset(
+    "a an the this that these those is are was were be been being am it its i me my we our us you your "
+    "they their them he she his her of to in on at for by with from as and or so just also".split()
+)
+# Texts that differ in one of these never share a result ("reliable" / "not reliable").
+NEGATIONS = frozenset(
+    "not no never none nothing nobody nowhere neither nor without cannot cant dont doesnt didnt isnt "
+    "wasnt arent werent wont wouldnt couldnt shouldnt hasnt havent hadnt aint".split()
+)
+# Prefixes that turn a word into its opposite ("stable" / "unstable")
+_NEGATING_PREFIXES = ("un", "in", "im", "ir", "il", "dis", "non")
+
+def normalize(text):
+    """The form in which two responses count as exact duplicates: cleaned, with whitespace collapsed."""
+    return " ".join(clean_text(text).split())
+
+def content_words(normalized):
+    """The words of a normalized text that near-duplicate matching compares: all but stop words."""
+    words = [word for word in normalized.split() if word not in _STOP_WORDS]
+    return words or normalized.split()
+
+def same_polarity(words, other_words):
+    """
+    False if two texts differ in a negation word, or one has a word the other has with a
+    negating prefix. Such texts can look alike and still mean the opposite.
+    """
+    words, other_words = set(words), set(other_words)
+    if words & NEGATIONS != other_words & NEGATIONS:
+        return False
+    for word in words ^ other_words:
+        other = other_words if word in words else words
+        if any(word.startswith(prefix) and word[len(prefix):] in other for prefix in _NEGATING_PREFIXES):
+            return False
+    return True
+
+def _permutations(num_perm):
+    # Fixed seed: signatures must stay comparable with the ones stored by earlier runs.
+    rng = np.random.RandomState(1)
+    a = rng.randint(1, np.iinfo(np.int64).max, num_perm, dtype=np.int64).astype(np.uint64) % _MERSENNE_PRIME
+    b = rng.randint(0, np.iinfo(np.int64).max, num_perm, dtype=np.int64).astype(np.uint64) % _MERSENNE_PRIME
+    return a, b
+
+def minhash_signature(text, num_perm=None, shingle_size=None, permutations=None):
+    """
+    MinHash signature of the character shingles of `text`, as `num_perm` uint32 values.
+    The share of equal values between two signatures estimates the Jaccard similarity
+    of the two shingle sets.
+    """
+    num_perm = num_perm or settings.MINHASH_PERMUTATIONS
+    shingle_size = shingle_size or settings.MINHASH_SHINGLE_SIZE
+    a, b = permutations if permutations is not None else _permutations(num_perm)
+    data = text.encode("utf-8")
+    shingles = {data[i:i + shingle_size] for i in range(max(1, len(data) - shingle_size + 1))}
+    hashes = np.fromiter((zlib.crc32(shingle) for shingle in shingles), dtype=np.uint64, count=len(shingles))
+    with np.errstate(over="ignore"):
+        return ((np.outer(hashes, a) + b) % _MERSENNE_PRIME & _MAX_HASH).min(axis=0).astype(np.uint32)
+
+class SentimentGroups:
+    """
+    Groups of responses that get one shared sentiment result.
+
+    Responses that are identical after `normalize` share a group. In "near" mode, a
+    response also joins an existing group when the MinHash estimate of the similarity
+    of its `content_words` to the group's representative (first response) is at least
+    `threshold` and the two have the same polarity (see `same_polarity`); candidate
+    groups are found with locality-sensitive hashing over `bands` bands of the
+    signature. Responses only join a group through its representative, so groups do
+    not drift through chains of similar responses.
+
+    `memberships` maps the key (content hash of the normalized text) of every response
+    seen to its group key, and `groups` maps each group key to its representative text,
+    signature and sentiment result. Rows changed since the last `mark_saved` are listed
+    by `dirty_rows`, so the mapping can be stored and reused by later runs.
+    """
+
+    def __init__(self, mode=None, threshold=None, num_perm=None, bands=None):
+        self.mode = mode or settings.SENTIMENT_DEDUP
+        if self.mode not in DEDUP_MODES:
+            raise ValueError(f"Unknown deduplication mode '{self.mode}' (expected one of {', '.join(DEDUP_MODES)}).")
+        self.threshold = threshold if threshold is not None else settings.SENTIMENT_DEDUP_THRESHOLD
+        self.num_perm = num_perm or settings.MINHASH_PERMUTATIONS
+        self.bands = bands or settings.MINHASH_BANDS
+        if self.num_perm % self.bands:
+            raise ValueError("The number of MinHash permutations must be a multiple of the number of bands.")
+        self._permutations = _permutations(self.num_perm)
+        self.memberships = {}
+        self.groups = {}
+        # Signatures of the indexed groups, one row each, and their group keys
+        self._signatures = np.empty((0, self.num_perm), dtype=np.uint32)
+        self._signature_keys = []
+        self._buckets = {}
+        self._member_texts = {} # Texts of the responses that joined a near-duplicate group
+        self._dirty = set()
+
+    def _band_keys(self, signature):
+        rows = self.num_perm // self.bands
+        return [(band, signature[band * rows:(band + 1) * rows].tobytes()) for band in range(self.bands)]
+
+    def add_group(self, key, text, signature=None, result=None):
+        """Registers a group (e.g. one loaded from the database) and indexes its signature."""
+        self.groups[key] = {"text": text, "signature": signature, "result": result}
+        self.memberships[key] = key
+        if signature is not None and len(signature) == self.num_perm:
+            row = len(self._signature_keys)
+            if row == len(self._signatures):
+                grown = np.empty((max(1024, 2 * row), self.num_perm), dtype=np.uint32)
+                grown[:row] = self._signatures
+                self._signatures = grown
+            self._signatures[row] = signature
+            self._signature_keys.append(key)
+            for band_key in self._band_keys(signature):
+                self._buckets.setdefault(band_key, []).append(row)
+
+    def _matches_group(self, words, key):
+        return same_polarity(words, content_words(normalize(self.groups[key]["text"] or "")))
+
+    def _nearest_group(self, signature, words):
+        """
+        The group whose representative is most similar to `signature` (at least `threshold`)
+        and has the same polarity as the text's `words`.
+        """
+        candidates = set()
+        for band_key in self._band_keys(signature):
+            candidates.update(self._buckets.get(band_key, ()))
+        if not candidates:
+            return None
+        rows = np.fromiter(candidates, dtype=np.int64, count=len(candidates))
+        similarities = (self._signatures[rows] == signature).mean(axis=1)
+        for best in np.argsort(-similarities, kind="stable"):
+            if similarities[best] < self.threshold:
+                break
+            key = self._signature_keys[rows[best]]
+            if self._matches_group(words, key):
+                return key
+        return None
+
+    def assign(self, texts):
+        """
+        Returns the group key of every text (None for empty texts), creating groups for
+        texts that match none of the known ones.
+        """
+        if self.mode == "off":
+            # Every response is its own group, keyed by position.
+            keys = [f"row:{len(self.groups) + row}" if isinstance(text, str) and text.strip() else None
+                    for row, text in enumerate(texts)]
+            for key, text in zip(keys, texts):
+                if key is not None:
+                    self.groups[key] = {"text": text, "signature": None, "result": None}
+            return keys
+
+        keys = []
+        for text in texts:
+            normalized = normalize(text) if isinstance(text, str) else ""
+            if not normalized:
+                keys.append(None)
+                continue
+            text_key = content_hash(normalized)
+            group = self.memberships.get(text_key)
+            if group is None:
+                signature = None
+                if self.mode == "near":
+                    words = content_words(normalized)
+                    signature = minhash_signature(" ".join(words), self.num_perm, permutations=self._permutations)
+                    group = self._nearest_group(signature, words)
+                if group is None:
+                    self.add_group(text_key, text, signature)
+                    group = text_key
+                self.memberships[text_key] = group
+                if group != text_key:
+                    self._member_texts[text_key] = text
+                self._dirty.add(text_key)
+            keys.append(group)
+        return keys
+
+    def set_result(self, key, result):
+        self.groups[key]["result"] = result
+        self._dirty.add(key)
+
+    def result(self, key):
+        return self.groups[key]["result"] if key is not None else None
+
+    def dirty_rows(self):
+        """Rows for the `sentiment_groups` table that changed since the last save."""
+        rows = []
+        for text_key in self._dirty:
+            if text_key.startswith("row:"):
+                continue
+            group_key = self.memberships[text_key]
+            row = {
+                "text_key": text_key, "group_key": group_key, "text": self._member_texts.get(text_key), "signature": None,
+                "sentiment_label": None, "sentiment_score": None, "sentiment_justification": None,
+            }
+            if group_key == text_key:
+                group = self.groups[group_key]
+                result = group["result"] or {}
+                row.update(
+                    text=group["text"],
+                    signature=group["signature"].tobytes() if group["signature"] is not None else None,
+                    sentiment_label=result.get("label"),
+                    sentiment_score=result.get("score"),
+                    sentiment_justification=result.get("justification"),
+                )
+            rows.append(row)
+        return rows
+
+    def mark_saved(self):
+        self._dirty.clear()
+
+    def load_rows(self, rows):
+        """
+        Restores groups and memberships from `sentiment_groups` rows. Near-duplicate
+        memberships are only restored in "near" mode, and only if the member still
+        matches its group's polarity; rows saved without the member's text are skipped.
+        """
+        members = []
+        for row in rows:
+            if row.group_key == row.text_key:
+                signature = np.frombuffer(row.signature, dtype=np.uint32) if row.signature else None
+                result = None
+                if row.sentiment_label is not None:
+                    result = {
+                        "label": row.sentiment_label,
+                        "score": row.sentiment_score,
+                        "justification": row.sentiment_justification,
+                    }
+                self.add_group(row.text_key, row.text, signature, result)
+            else:
+                members.append(row)
+        if self.mode != "near":
+            return
+        for row in members:
+            if row.group_key in self.groups and row.text and self._matches_group(content_words(normalize(row.text)), row.group_key):
+                self.memberships[row.text_key] = row.group_key
@@ -0,0 +1,109 @@
+import functools
+import time
+from openai import OpenAI
+from telcoresq.config import settings
+from telcoresq.app.utils.metrics import get_metrics, tracked_call
+from telcoresq.app.utils.tokens import count_tokens, pack_by_tokens, truncate_to_tokens
+
+class OpenAIEmbeddingBackend:
+    """
+    Embeds texts with the OpenAI embeddings API.
+    Inputs are truncated to the per-input token limit and packed into token-budgeted
+    batches, which are sent concurrently.
+    """
+
+    def __init__(self, model, api_key=None, max_batch_tokens=None, max_batch_inputs=None, max_concurrency=None):
+        # Use the key from the function argument if provided, otherwise from settings
+        final_api_key = api_key or settings.OPENAI_API_KEY
+        if not final_api_key:
+            raise ValueError("OpenAI API key is not set. Please provide it in the sidebar.")
+        self.model = model
+        self.max_batch_tokens = max_batch_tokens or settings.EMBEDDING_BATCH_MAX_TOKENS
+        self.max_batch_inputs = max_batch_inputs or settings.EMBEDDING_BATCH_MAX_INPUTS
+        self.max_concurrency = max_concurrency or settings.EMBEDDING_MAX_CONCURRENCY
+        # Retries are handled by `call_with_retry` (via `tracked_call`).
+        self.client = OpenAI(api_key=final_api_key, max_retries=0)
+
+    def plan_batches(self, texts):
+        """Returns the texts to send, truncated to the input limit, and the batches as lists of positions."""
+        inputs = [truncate_to_tokens(text, settings.EMBEDDING_MAX_INPUT_TOKENS, self.model) for text in texts]
+        token_counts = [count_tokens(text, self.model) for text in inputs]
+        return inputs, pack_by_tokens(token_counts, self.max_batch_tokens, self.max_batch_inputs)
+
+    def embed_batch(self, texts):
+        """Embeds one batch of texts."""
+        response = tracked_call("embedding", self.model, self.client.embeddings.create, input=texts, model=self.model)
+        return [item.embedding for item in sorted(response.data, key=lambda item: item.index)]
+
+@functools.lru_cache(maxsize=None)
+def _load_sentence_transformer(model_name):
+    """Loads a sentence-transformers model once per process."""
+    from sentence_transformers import SentenceTransformer
+    return SentenceTransformer(model_name, device="cpu")
+
+@functools.lru_cache(maxsize=None)
+def _start_worker_pool(model_name, workers):
+    """Starts a pool of encoding processes for a model once per process."""
+    return _load_sentence_transformer(model_name).start_multi_process_pool(["cpu"] * workers)
+
+class LocalEmbeddingBackend:
+    """
+    Embeds texts on the CPU with a sentence-transformers model, without network calls.
+
+    Texts are sorted by length before batching, so each batch pads to a similar length,
+    and the model is loaded once per process. With `workers` > 1, batches are encoded
+    by a pool of worker processes.
+    """
+
+    # The model saturates the CPU on its own; batches are encoded one at a time.
+    max_concurrency = 1
+
+    def __init__(self, model, batch_size=None, chunk_size=None, workers=None):
+        self.model = model
+        self.batch_size = batch_size or settings.LOCAL_EMBEDDING_BATCH_SIZE
+        self.chunk_size = chunk_size or settings.LOCAL_EMBEDDING_CHUNK_SIZE
+        self.workers = workers or settings.LOCAL_EMBEDDING_WORKERS
+
+    def plan_batches(self, texts):
+        """
+        Orders texts by length and splits them into chunks of `chunk_size`.
+        Each chunk is cached as soon as it is encoded.
+        """
+        order = sorted(range(len(texts)), key=lambda position: len(texts[position]))
+        return texts, [order[start:start + self.chunk_size] for start in range(0, len(order), self.chunk_size)]
+
+    def embed_batch(self, texts):
+        """Embeds one chunk of texts in mini-batches of `batch_size`."""
+        started = time.perf_counter()
+        model = _load_sentence_transformer(self.model)
+        if self.workers > 1:
+            vectors = model.encode_multi_process(
+                texts, _start_worker_pool(self.model, self.workers), batch_size=self.batch_size
+            )
+        else:
+            vectors = model.encode(texts, batch_size=self.batch_size, convert_to_numpy=True, show_progress_bar=False)
+        get_metrics().record_call("embedding", f"local:{self.model}", time.perf_counter() - started)
+        return vectors.tolist()
+
+# Model name prefixes that select a backend, e.g. EMBEDDING_MODEL="local:all-MiniLM-L6-v2".
+EMBEDDING_BACKENDS = {
+    "openai": OpenAIEmbeddingBackend,
+    "local": LocalEmbeddingBackend,
+}
+
+def get_embedding_backend(model=settings.EMBEDDING_MODEL, api_key=None):
+    """
+    Returns the embedding backend for a model name. A `<backend>:` prefix selects a
+    backend from `EMBEDDING_BACKENDS`; "sentence-transformers/..." models run locally,
+    and anything else is treated as an OpenAI model.
+    """
+    prefix, _, name = model.partition(":")
+    if name and prefix in EMBEDDING_BACKENDS:
+        backend = EMBEDDING_BACKENDS[prefix]
+    elif model.startswith("sentence-transformers/"):
+        backend, name = LocalEmbeddingBackend, model
+    else:
+        backend, name = OpenAIEmbeddingBackend, model
+    if backend is OpenAIEmbeddingBackend:
+        return backend(name, api_key=api_key)
+    return backend(name)
@@ -0,0 +1,127 @@
+import functools
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+import numpy as np
+from telcoresq.config import settings
+
+# SQLite limits the number of bound parameters per statement
+_QUERY_CHUNK_SIZE = 500
+
+def normalize_text(text):
+    """
+    Normalizes a text before embedding: newlines and repeated whitespace are
+    collapsed to single spaces, as recommended by OpenAI for embedding models.
+    """
+    return " ".join(str(text).split())
+
+def make_cache_key(model, text):
+    """Returns the content-addressed cache key for a (model, text) pair."""
+    return hashlib.sha256(f"{model}\x00{normalize_text(text)}".encode("utf-8")).hexdigest()
+
+class EmbeddingCache:
+    """
+    Persistent per-text embedding cache stored in SQLite.
+
+    Vectors are stored as float32 blobs keyed by a hash of (model, normalized text).
+    Once the stored vectors exceed `max_bytes`, the least recently used entries are evicted.
+    """
+
+    def __init__(self, path=settings.EMBEDDING_CACHE_PATH, max_bytes=settings.EMBEDDING_CACHE_MAX_MB * 1024 * 1024):
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.path = path
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings ("
+            "key TEXT PRIMARY KEY, dim INTEGER NOT NULL, vector BLOB NOT NULL, "
+            "size INTEGER NOT NULL, last_used REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_embeddings_last_used ON embeddings(last_used)")
+        self._conn.commit()
+        self._size_bytes = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM embeddings").fetchone()[0]
+
+    def get_many(self, model, texts):
+        """
+        Looks up the embeddings of `texts`.
+        Returns a dict mapping each cached text to its vector (as a list of floats).
+        """
+        keys = {make_cache_key(model, text): text for text in texts}
+        found = {}
+        with self._lock:
+            key_list = list(keys)
+            for start in range(0, len(key_list), _QUERY_CHUNK_SIZE):
+                chunk = key_list[start:start + _QUERY_CHUNK_SIZE]
+                placeholders = ",".join("?" * len(chunk))
+                rows = self._conn.execute(
+                    f"SELECT key, vector FROM embeddings WHERE key IN ({placeholders})", chunk
+                ).fetchall()
+                for key, blob in rows:
+                    found[keys[key]] = np.frombuffer(blob, dtype=np.float32).tolist()
+                if rows:
+                    self._conn.executemany(
+                        "UPDATE embeddings SET last_used = ? WHERE key = ?",
+                        [(time.time(), key) for key, _ in rows],
+                    )
+            self._conn.commit()
+            self.hits += len(found)
+            self.misses += len(keys) - len(found)
+        return found
+
+    def put_many(self, model, texts, vectors):
+        """Stores the embeddings of `texts`, evicting old entries if the cache is over its size limit."""
+        now = time.time()
+        rows = []
+        for text, vector in zip(texts, vectors):
+            blob = np.asarray(vector, dtype=np.float32).tobytes()
+            rows.append((make_cache_key(model, text), len(blob) // 4, blob, len(blob), now))
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO embeddings (key, dim, vector, size, last_used) VALUES (?, ?, ?, ?, ?)",
+                rows,
+            )
+            self._conn.commit()
+            self._size_bytes += sum(row[3] for row in rows)
+            if self._size_bytes > self.max_bytes:
+                self._evict()
+
+    def _evict(self):
+        """Deletes least recently used entries until the cache fits in `max_bytes`."""
+        self._size_bytes = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM embeddings").fetchone()[0]
+        excess = self._size_bytes - self.max_bytes
+        if excess <= 0:
+            return
+        evicted = []
+        for key, size in self._conn.execute("SELECT key, size FROM embeddings ORDER BY last_used"):
+            if excess <= 0:
+                break
+            evicted.append((key,))
+            excess -= size
+            self._size_bytes -= size
+        self._conn.executemany("DELETE FROM embeddings WHERE key = ?", evicted)
+        self._conn.commit()
+
+    def stats(self):
+        """Returns hit/miss counters and the current size of the cache."""
+        lookups = self.hits + self.misses
+        with self._lock:
+            entries = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "entries": entries,
+            "size_bytes": self._size_bytes,
+        }
+
+@functools.lru_cache(maxsize=None)
+def get_embedding_cache(path=settings.EMBEDDING_CACHE_PATH):
+    """Returns the process-wide embedding cache for `path`."""
+    return EmbeddingCache(path)
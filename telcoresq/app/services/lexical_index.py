@@ -0,0 +1,168 @@
+import json
+import math
+import os
+import re
+from collections import Counter
+import numpy as np
+from telcoresq.config import settings
+
+_PUNCTUATION_PATTERN = re.compile(r'[^\w\s]')
+_TOKEN_PATTERN = re.compile(r'\w+')
+
+def tokenize(text):
+    """
+    Splits text into lowercase terms. Punctuation is removed first, the same way
+    `clean_text` does it, so queries like "TWR-0042" match cleaned responses ("twr0042").
+    """
+    if not isinstance(text, str):
+        return []
+    return _TOKEN_PATTERN.findall(_PUNCTUATION_PATTERN.sub('', text.lower()))
+
+def exact_terms(text):
+    """
+    Returns the identifier-like terms of `text` (tower ids, product and outage codes):
+    terms of at least four characters that contain a digit, such as "twr0042".
+    """
+    return {term for term in tokenize(text) if len(term) >= 4 and any(char.isdigit() for char in term)}
+
+class BM25Index:
+    """
+    In-process inverted index with Okapi BM25 scoring, keyed by response id.
+
+    Documents can be added, replaced and removed one at a time, so the index is updated
+    alongside the FAISS index instead of being rebuilt. Posting lists are converted to
+    arrays on first use and cached until a document containing the term changes.
+    """
+
+    def __init__(self, k1=1.5, b=0.75):
+        self.k1 = k1
+        self.b = b
+        self.doc_terms = {} # response id -> {term: frequency}
+        self.doc_lengths = {}
+        self.postings = {} # term -> {response id: frequency}
+        self.total_length = 0
+        self._arrays = {} # term -> (ids, frequencies, document lengths)
+
+    def __len__(self):
+        return len(self.doc_terms)
+
+    def remove(self, ids):
+        """Removes documents; unknown ids are ignored."""
+        for response_id in ids:
+            terms = self.doc_terms.pop(int(response_id), None)
+            if terms is None:
+                continue
+            self.total_length -= self.doc_lengths.pop(int(response_id))
+            for term in terms:
+                postings = self.postings[term]
+                del postings[int(response_id)]
+                if not postings:
+                    del self.postings[term]
+                self._arrays.pop(term, None)
+
+    def upsert(self, ids, texts):
+        """Adds documents, replacing any stored under the same ids."""
+        ids = [int(response_id) for response_id in ids]
+        self.remove(ids)
+        for response_id, text in zip(ids, texts):
+            tokens = tokenize(text)
+            if not tokens:
+                continue
+            terms = Counter(tokens)
+            self.doc_terms[response_id] = terms
+            self.doc_lengths[response_id] = len(tokens)
+            self.total_length += len(tokens)
+            for term, frequency in terms.items():
+                self.postings.setdefault(term, {})[response_id] = frequency
+                self._arrays.pop(term, None)
+
+    def _posting_arrays(self, term):
+        arrays = self._arrays.get(term)
+        if arrays is None:
+            postings = self.postings[term]
+            ids = np.fromiter(postings.keys(), dtype=np.int64, count=len(postings))
+            arrays = (
+                ids,
+                np.fromiter(postings.values(), dtype=np.float32, count=len(postings)),
+                np.fromiter((self.doc_lengths[response_id] for response_id in ids.tolist()), dtype=np.float32, count=len(ids)),
+            )
+            self._arrays[term] = arrays
+        return arrays
+
+    def search(self, query, k=10, allowed_ids=None):
+        """
+        Returns up to `k` `(response_id, score)` pairs for the documents that best match
+        `query`, highest score first. `allowed_ids` restricts the results to those ids.
+        """
+        terms = [term for term in set(tokenize(query)) if term in self.postings]
+        if not terms or not self.doc_terms:
+            return []
+        n_docs = len(self.doc_terms)
+        average_length = self.total_length / n_docs
+        all_ids, all_scores = [], []
+        for term in terms:
+            ids, frequencies, lengths = self._posting_arrays(term)
+            idf = math.log(1 + (n_docs - len(ids) + 0.5) / (len(ids) + 0.5))
+            norm = self.k1 * (1 - self.b + self.b * lengths / average_length)
+            all_ids.append(ids)
+            all_scores.append(idf * frequencies * (self.k1 + 1) / (frequencies + norm))
+        ids, inverse = np.unique(np.concatenate(all_ids), return_inverse=True)
+        scores = np.bincount(inverse, weights=np.concatenate(all_scores))
+        if allowed_ids is not None:
+            keep = np.isin(ids, np.asarray(allowed_ids, dtype=np.int64))
+            ids, scores = ids[keep], scores[keep]
+        if len(ids) > k:
+            top = np.argpartition(-scores, k - 1)[:k]
+            ids, scores = ids[top], scores[top]
+        order = np.argsort(-scores, kind="stable")
+        return [(int(ids[i]), float(scores[i])) for i in order]
+
+    def containing(self, ids, terms):
+        """Returns the given ids, in order, whose documents contain every one of `terms`."""
+        return [response_id for response_id in ids
+                if all(term in self.doc_terms.get(int(response_id), ()) for term in terms)]
+
+    def to_dict(self):
+        return {"k1": self.k1, "b": self.b, "documents": {str(i): terms for i, terms in self.doc_terms.items()}}
+
+    @classmethod
+    def from_dict(cls, data):
+        index = cls(k1=data.get("k1", 1.5), b=data.get("b", 0.75))
+        for response_id, terms in data["documents"].items():
+            response_id = int(response_id)
+            index.doc_terms[response_id] = Counter(terms)
+            index.doc_lengths[response_id] = sum(terms.values())
+            index.total_length += index.doc_lengths[response_id]
+            for term, frequency in terms.items():
+                index.postings.setdefault(term, {})[response_id] = frequency
+        return index
+
+def save_lexical_index(index, path):
+    """Saves a `BM25Index` as JSON, written to a temporary file first and then renamed."""
+    if index is None:
+        return
+    if os.path.dirname(path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(f"{path}.tmp", "w") as f:
+        json.dump(index.to_dict(), f)
+    os.replace(f"{path}.tmp", path)
+
+def load_lexical_index(path):
+    """Loads a `BM25Index`, or returns None if none was saved."""
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        return BM25Index.from_dict(json.load(f))
+
+def reciprocal_rank_fusion(rankings, k=None):
+    """
+    Fuses several rankings (lists of ids, best first) with reciprocal rank fusion:
+    each id scores the sum of 1 / (k + rank) over the rankings it appears in.
+    Returns `(id, score)` pairs, best first.
+    """
+    k = k if k is not None else settings.RRF_K
+    scores = {}
+    for ranking in rankings:
+        for rank, response_id in enumerate(ranking, start=1):
+            scores[response_id] = scores.get(response_id, 0.0) + 1.0 / (k + rank)
+    return sorted(scores.items(), key=lambda item: item[1], reverse=True)
@@ -0,0 +1,59 @@
+import functools
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from telcoresq.config import settings
+
+def make_cache_key(*parts):
+    """Returns a content-addressed key for an LLM call, e.g. (model, prompt name, input text)."""
+    return hashlib.sha256("\x00".join(str(part) for part in parts).encode("utf-8")).hexdigest()
+
+class LLMResultCache:
+    """
+    Persistent cache of LLM text outputs stored in SQLite, keyed by `make_cache_key`.
+    Used to skip calls whose inputs have not changed since a previous run.
+    """
+
+    def __init__(self, path=settings.LLM_CACHE_PATH):
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.path = path
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS results (key TEXT PRIMARY KEY, value TEXT NOT NULL, created REAL NOT NULL)"
+        )
+        self._conn.commit()
+
+    def get(self, key):
+        """Returns the cached output for `key`, or None."""
+        with self._lock:
+            row = self._conn.execute("SELECT value FROM results WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            return row[0]
+
+    def put(self, key, value):
+        """Stores the output for `key`."""
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO results (key, value, created) VALUES (?, ?, ?)", (key, value, time.time())
+            )
+            self._conn.commit()
+
+    def stats(self):
+        """Returns hit/miss counters."""
+        lookups = self.hits + self.misses
+        return {"hits": self.hits, "misses": self.misses, "hit_rate": self.hits / lookups if lookups else 0.0}
+
+@functools.lru_cache(maxsize=None)
+def get_llm_cache(path=settings.LLM_CACHE_PATH):
+    """Returns the process-wide LLM result cache for `path`."""
+    return LLMResultCache(path)
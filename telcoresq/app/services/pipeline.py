@@ -0,0 +1,213 @@
+import datetime
+import uuid
+import numpy as np
+from sqlalchemy import select
+from telcoresq.config import settings
+from telcoresq.app.services import database
+from telcoresq.app.services.aggregates import build_aggregates
+from telcoresq.app.services.ai_services import analyze_sentiments_grouped, extract_themes, get_embeddings, summarize_responses
+from telcoresq.app.services.data_processing import (
+    iter_file_chunks, preprocess_dataframe, make_response_ids, read_progress
+)
+from telcoresq.app.services.vector_store import SurveyVectorStore
+from telcoresq.app.utils import metrics
+
+# Stages of a batch job, in order. "ingest" streams the file through cleaning,
+# embedding and indexing chunk by chunk, so those steps share one checkpoint.
+# "aggregates" precomputes the sentiment x theme x demographic cube for the Explore page.
+JOB_STAGES = ("ingest", "sentiment", "themes", "aggregates", "summary")
+
+def ingest_stream(uploaded_file, text_column, store, embed_fn, id_column=None, chunksize=None,
+                  progress_callback=None, columns=None, index_type=None):
+    """
+    Streams an upload through cleaning, embedding and storage one chunk at a time, so
+    memory stays bounded by the chunk size rather than the file size.
+
+    Each chunk is cleaned, embedded with `embed_fn` (new or changed rows only) and
+    written to the `SurveyVectorStore`. Responses that were stored before but are not
+    in the upload are removed at the end, and the index is saved once. A new index is
+    built as Flat while chunks arrive; once the whole upload has been counted, its type is
+    chosen from `index_type` (default FAISS_INDEX_TYPE) and it is trained on every stored
+    vector (see `SurveyVectorStore.refresh_index`).
+    Raises ValueError if an id occurs more than once in the upload, before the chunk
+    holding the repeat is stored.
+    `progress_callback(rows_processed, fraction_of_file_read)` is called after every chunk.
+    For Parquet files, only `columns` (plus the text and id columns) are read and stored
+    as attributes.
+    Returns the response ids of the upload and the summed added/updated/removed/unchanged counts.
+    """
+    totals = {"added": 0, "updated": 0, "removed": 0, "unchanged": 0}
+    occurrences, unique_ids = {}, set()
+    seen_ids = []
+    rows = 0
+
+    if columns is not None:
+        columns = list(dict.fromkeys([text_column, *([id_column] if id_column else []), *columns]))
+    for chunk in iter_file_chunks(uploaded_file, chunksize, columns=columns):
+        if text_column not in chunk.columns:
+            raise ValueError(f"Column '{text_column}' not found in the uploaded file.")
+        chunk = preprocess_dataframe(chunk, [text_column])
+        ids = make_response_ids(chunk, text_column, id_column, occurrences=occurrences, seen=unique_ids)
+        attribute_columns = [column for column in chunk.columns if column != text_column]
+        stats = store.sync(
+            ids,
+            chunk[text_column].tolist(),
+            embed_fn,
+            attributes=chunk[attribute_columns].to_dict('records'),
+            remove_missing=False,
+            save=False,
+            index_type="flat",
+        )
+        for key in totals:
+            totals[key] += stats[key]
+        seen_ids.append(ids)
+        rows += len(chunk)
+        if progress_callback:
+            progress_callback(rows, read_progress(uploaded_file))
+
+    seen_ids = np.concatenate(seen_ids) if seen_ids else np.empty(0, dtype=np.int64)
+    missing = np.setdiff1d(store.stored_ids(), seen_ids)
+    store.delete(missing)
+    totals["removed"] += len(missing)
+    store.refresh_index(index_type)
+    store.save()
+    return seen_ids, totals
+
+def run_sentiment_stage(store, api_key=None, chunk_rows=None, progress_callback=None):
+    """
+    Labels every stored response that has no sentiment yet, `chunk_rows` at a time.
+    Duplicate and near-duplicate responses share one LLM call (see
+    `analyze_sentiments_grouped`), including with responses labelled by earlier runs.
+    Each chunk and its duplicate groups are written before the next one starts, so an
+    interrupted run resumes where it stopped. Rows the model could not classify are
+    left unlabelled, as the Dashboard does, so the next run tries them again; each run
+    looks at every row once. Returns the number of responses labelled.
+    """
+    chunk_rows = chunk_rows or settings.JOB_SENTIMENT_CHUNK_ROWS
+    groups = store.load_sentiment_groups()
+    processed = labelled = 0
+    last_id = None
+    while True:
+        ids, texts = store.pending_sentiments(chunk_rows, after_id=last_id)
+        if not ids:
+            return labelled
+        sentiments, _ = analyze_sentiments_grouped(texts, groups=groups, api_key=api_key)
+        store.save_sentiment_groups(groups)
+        store.update_sentiments(
+            ids,
+            [s['label'] if s else None for s in sentiments],
+            scores=[s['score'] if s else None for s in sentiments],
+            justifications=[s['justification'] if s else None for s in sentiments],
+        )
+        last_id = ids[-1]
+        processed += len(ids)
+        labelled += sum(1 for s in sentiments if s)
+        if progress_callback:
+            progress_callback(processed)
+
+def _now():
+    return datetime.datetime.now(datetime.timezone.utc).replace(tzinfo=None)
+
+def create_job(engine, source_path, text_column, id_column=None):
+    """Registers a batch job for a file and returns its id."""
+    database.create_tables(engine)
+    job_id = uuid.uuid4().hex
+    with engine.begin() as conn:
+        conn.execute(database.jobs.insert().values(
+            job_id=job_id, source_path=source_path, text_column=text_column, id_column=id_column,
+            status="pending", stage=None, error=None, results={}, created_at=_now(), updated_at=_now(),
+        ))
+    return job_id
+
+def get_job(engine, job_id):
+    """Returns a job as a dict, or None."""
+    with engine.connect() as conn:
+        row = conn.execute(select(database.jobs).where(database.jobs.c.job_id == job_id)).first()
+    return dict(row._mapping) if row else None
+
+def list_jobs(engine, status=None):
+    """Returns all jobs (optionally only those with `status`), newest first."""
+    database.create_tables(engine)
+    stmt = select(database.jobs).order_by(database.jobs.c.created_at.desc())
+    if status:
+        stmt = stmt.where(database.jobs.c.status == status)
+    with engine.connect() as conn:
+        return [dict(row._mapping) for row in conn.execute(stmt)]
+
+def _update_job(engine, job_id, **values):
+    with engine.begin() as conn:
+        conn.execute(database.jobs.update().where(database.jobs.c.job_id == job_id).values(updated_at=_now(), **values))
+
+def _checkpoint(completed):
+    """The last stage of the unbroken run of completed stages from the start, or None."""
+    stage = None
+    for name in JOB_STAGES:
+        if name not in completed:
+            break
+        stage = name
+    return stage
+
+def run_job(job_id, engine=None, store=None, api_key=None, stages=JOB_STAGES, log=print):
+    """
+    Runs a batch job: ingest (clean, embed, index) -> sentiment -> themes -> aggregates -> summary.
+
+    Each completed stage records its results in the `jobs` table, and `stage` holds the
+    last stage of the unbroken run of completed stages from the start. Running a failed,
+    interrupted or partial job again runs the stages that have not completed. Within a
+    stage, work already done is reused: embeddings come from the embedding cache,
+    sentiment resumes with the unlabelled rows, and summary chunks come from the LLM
+    result cache.
+    Stages not listed in `stages` are skipped; the job then ends as "partial" rather than
+    "finished" until they have run. Returns the final job dict.
+    """
+    engine = engine if engine is not None else database.get_engine(settings.DATABASE_URL)
+    job = get_job(engine, job_id)
+    if job is None:
+        raise ValueError(f"Job '{job_id}' not found.")
+    store = store if store is not None else SurveyVectorStore(engine)
+    results = dict(job["results"] or {})
+    done = JOB_STAGES.index(job["stage"]) + 1 if job["stage"] else 0
+    completed = set(JOB_STAGES[:done]) | {stage for stage in JOB_STAGES if stage in results}
+
+    for stage in JOB_STAGES:
+        if stage in completed or stage not in stages:
+            continue
+        _update_job(engine, job_id, status="running", error=None)
+        log(f"[{job_id}] {stage}...")
+        try:
+            with metrics.stage(stage):
+                if stage == "ingest":
+                    with open(job["source_path"], "rb") as source:
+                        response_ids, stats = ingest_stream(
+                            source, job["text_column"], store,
+                            embed_fn=lambda texts: get_embeddings(texts, api_key=api_key),
+                            id_column=job["id_column"],
+                            progress_callback=lambda rows, fraction: log(f"[{job_id}] ingest: {rows} rows ({fraction:.0%})"),
+                        )
+                    results["ingest"] = dict(stats, rows=len(response_ids))
+                elif stage == "sentiment":
+                    labelled = run_sentiment_stage(
+                        store, api_key=api_key, progress_callback=lambda rows: log(f"[{job_id}] sentiment: {rows} rows")
+                    )
+                    results["sentiment"] = {"labelled": labelled}
+                elif stage == "themes":
+                    ids, texts, vectors = store.load_corpus()
+                    themes, assignments = extract_themes(texts, vectors, api_key=api_key)
+                    store.update_themes(themes, ids, assignments)
+                    results["themes"] = {"themes": len(themes)}
+                elif stage == "aggregates":
+                    results["aggregates"] = {"cells": build_aggregates(store)}
+                elif stage == "summary":
+                    results["summary"] = summarize_responses(store.load_texts(), api_key=api_key)
+                    store.save_artifact("summary", results["summary"])
+        except Exception as e:
+            results.pop(stage, None)  # a stage that failed part-way has not completed
+            _update_job(engine, job_id, status="failed", error=str(e), results=results)
+            log(f"[{job_id}] {stage} failed: {e}")
+            raise
+        completed.add(stage)
+        _update_job(engine, job_id, stage=_checkpoint(completed), results=results)
+
+    _update_job(engine, job_id, status="finished" if completed >= set(JOB_STAGES) else "partial")
+    metrics.get_metrics().flush()
+    return get_job(engine, job_id)
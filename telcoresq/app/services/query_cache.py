@@ -0,0 +1,112 @@
+import functools
+import threading
+import time
+from collections import OrderedDict
+import numpy as np
+from telcoresq.config import settings
+from telcoresq.app.services.embedding_cache import normalize_text
+
+class SemanticQueryCache:
+    """
+    In-memory TTL/LRU cache of query results (retrieved hits and the generated answer).
+
+    A query is answered from the cache when the same normalized text was asked before,
+    or when its embedding has a cosine similarity of at least `similarity_threshold` with
+    a cached query. Entries are scoped (e.g. by filters and index version), so a cached
+    answer is only reused for the same search over the same data.
+    """
+
+    def __init__(self, max_entries=None, ttl_seconds=None, similarity_threshold=None):
+        self.max_entries = max_entries or settings.QUERY_CACHE_MAX_ENTRIES
+        self.ttl_seconds = ttl_seconds if ttl_seconds is not None else settings.QUERY_CACHE_TTL_SECONDS
+        self.similarity_threshold = (
+            similarity_threshold if similarity_threshold is not None else settings.QUERY_CACHE_SIMILARITY_THRESHOLD
+        )
+        self.exact_hits = 0
+        self.semantic_hits = 0
+        self.misses = 0
+        self.saved_seconds = 0.0
+        self._entries = OrderedDict() # (scope, normalized query) -> entry, least recently used first
+        self._lock = threading.Lock()
+
+    def _expire(self, now):
+        expired = [key for key, entry in self._entries.items() if now - entry["created"] > self.ttl_seconds]
+        for key in expired:
+            del self._entries[key]
+
+    def get(self, query, query_vector=None, scope=None):
+        """
+        Returns `(entry, match)` for a cached query, where `match` is "exact" or "semantic",
+        or `(None, None)` on a miss. `entry` holds the stored `value`, the original `query`
+        and the `seconds` it took to compute, which count as saved latency on a hit.
+        """
+        key = (scope, normalize_text(query).lower())
+        with self._lock:
+            now = time.time()
+            self._expire(now)
+            entry, match = self._entries.get(key), "exact"
+            if entry is None and query_vector is not None:
+                entry, match = self._nearest(query_vector, scope), "semantic"
+            if entry is None:
+                self.misses += 1
+                return None, None
+            self._entries.move_to_end(entry["key"])
+            if match == "exact":
+                self.exact_hits += 1
+            else:
+                self.semantic_hits += 1
+            self.saved_seconds += entry["seconds"]
+            return entry, match
+
+    def _nearest(self, query_vector, scope):
+        candidates = [entry for entry in self._entries.values() if entry["scope"] == scope and entry["vector"] is not None]
+        if not candidates:
+            return None
+        similarities = np.stack([entry["vector"] for entry in candidates]) @ _unit(query_vector)
+        best = int(np.argmax(similarities))
+        return candidates[best] if similarities[best] >= self.similarity_threshold else None
+
+    def put(self, query, value, seconds, query_vector=None, scope=None):
+        """Caches `value` for `query` within `scope`; `seconds` is the time it took to compute."""
+        key = (scope, normalize_text(query).lower())
+        with self._lock:
+            self._entries[key] = {
+                "key": key,
+                "scope": scope,
+                "query": query,
+                "vector": _unit(query_vector) if query_vector is not None else None,
+                "value": value,
+                "seconds": seconds,
+                "created": time.time(),
+            }
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        """Drops all entries, e.g. after the underlying data changed."""
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        """Returns hit/miss counters, the hit rate and the total latency saved by hits."""
+        hits = self.exact_hits + self.semantic_hits
+        lookups = hits + self.misses
+        return {
+            "exact_hits": self.exact_hits,
+            "semantic_hits": self.semantic_hits,
+            "misses": self.misses,
+            "hit_rate": hits / lookups if lookups else 0.0,
+            "saved_seconds": self.saved_seconds,
+            "entries": len(self._entries),
+        }
+
+def _unit(vector):
+    vector = np.asarray(vector, dtype=np.float32)
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
+
+@functools.lru_cache(maxsize=None)
+def get_query_cache():
+    """Returns the process-wide query cache."""
+    return SemanticQueryCache()
@@ -0,0 +1,220 @@
+import datetime
+import hashlib
+import json
+import os
+import pandas as pd
+from sqlalchemy import func, select
+from telcoresq.config import settings
+from telcoresq.app.services import database
+from telcoresq.app.components.visualizations import (
+    create_sentiment_pie_chart,
+    create_theme_frequency_bar_chart,
+    parse_themes_to_df
+)
+
+# Columns of the per-response exports (responses.csv / responses.parquet)
+RESPONSE_COLUMNS = [
+    "response_id", "text", "sentiment_label", "sentiment_score", "sentiment_justification", "theme", "attributes"
+]
+_MANIFEST = "manifest.json"
+
+def _markdown_table(df):
+    """Renders a small DataFrame as a GitHub-flavoured Markdown table."""
+    if df.empty:
+        return "_No data._"
+    cells = lambda values: "| " + " | ".join(str(value).replace("|", "\\|").replace("\n", " ") for value in values) + " |"
+    lines = [cells(df.columns), "| " + " | ".join("---" for _ in df.columns) + " |"]
+    lines += [cells(row) for row in df.itertuples(index=False)]
+    return "\n".join(lines)
+
+def sentiment_theme_counts(store):
+    """
+    Counts responses per (sentiment label, theme) with one aggregate query.
+    Unlabelled responses count as 'N/A' and responses without a theme as 'Unassigned'.
+    Returns a DataFrame with `sentiment_label`, `theme`, `count` and a `checksum` of the
+    response ids in the group, which changes when responses move between groups.
+    """
+    responses, themes = database.survey_responses, database.themes
+    stmt = select(
+        responses.c.sentiment_label,
+        themes.c.theme_name,
+        func.count().label("count"),
+        func.sum(responses.c.response_id % 1000003).label("checksum"),
+    ).select_from(
+        responses.outerjoin(themes, responses.c.theme_id == themes.c.theme_id)
+    ).group_by(responses.c.sentiment_label, themes.c.theme_name)
+    with store.engine.connect() as conn:
+        counts = pd.DataFrame(conn.execute(stmt).all(), columns=["sentiment_label", "theme", "count", "checksum"])
+    return counts.fillna({"sentiment_label": "N/A", "theme": "Unassigned"})
+
+def responses_checksum(store, chunk_rows=None):
+    """
+    Checksum of every exported response column (text, sentiment label, score and
+    justification, theme and attributes), computed chunk by chunk with pandas' vectorized
+    row hashing.
+    """
+    digest = hashlib.blake2b(digest_size=8)
+    for chunk in iter_response_chunks(store, chunk_rows):
+        digest.update(pd.util.hash_pandas_object(chunk, index=False).values.tobytes())
+    return digest.hexdigest()
+
+def report_fingerprint(store, counts=None, chunk_rows=None):
+    """
+    Identifies the state of the stored results: the index version, the per-group counts,
+    a checksum of the exported response columns (see `responses_checksum`), the themes and
+    the summary. A report with the same fingerprint can be reused as is.
+    """
+    counts = counts if counts is not None else sentiment_theme_counts(store)
+    state = {
+        "index": store.version,
+        "counts": counts.sort_values(["sentiment_label", "theme"]).values.tolist(),
+        "responses": responses_checksum(store, chunk_rows),
+        "themes": [(theme["name"], theme["frequency"]) for theme in store.load_themes()],
+        "summary": store.load_artifact("summary"),
+    }
+    return hashlib.blake2b(json.dumps(state, default=str).encode("utf-8"), digest_size=8).hexdigest()
+
+def iter_response_chunks(store, chunk_rows=None):
+    """
+    Streams every stored response with its sentiment and theme, `chunk_rows` at a time,
+    as DataFrames with `RESPONSE_COLUMNS`. Attributes are serialized as JSON strings.
+    """
+    chunk_rows = chunk_rows or settings.REPORT_CHUNK_ROWS
+    responses, themes = database.survey_responses, database.themes
+    stmt = select(
+        responses.c.response_id,
+        responses.c.processed_text,
+        responses.c.sentiment_label,
+        responses.c.sentiment_score,
+        responses.c.sentiment_justification,
+        themes.c.theme_name,
+        responses.c.attributes,
+    ).select_from(
+        responses.outerjoin(themes, responses.c.theme_id == themes.c.theme_id)
+    ).order_by(responses.c.response_id)
+    with store.engine.connect() as conn:
+        result = conn.execution_options(stream_results=True, yield_per=chunk_rows).execute(stmt)
+        for rows in result.partitions():
+            chunk = pd.DataFrame(rows, columns=RESPONSE_COLUMNS)
+            chunk["sentiment_score"] = chunk["sentiment_score"].astype("float64")
+            chunk["attributes"] = [json.dumps(attributes or {}) for attributes in chunk["attributes"]]
+            yield chunk
+
+def _write_responses(store, directory, formats, chunk_rows):
+    """Writes the per-response tables chunk by chunk, so the full table is never in memory."""
+    files = {}
+    csv_path = os.path.join(directory, "responses.csv") if "csv" in formats else None
+    parquet_writer = None
+    if "parquet" in formats:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+        schema = pa.schema([
+            ("response_id", pa.int64()),
+            ("text", pa.string()),
+            ("sentiment_label", pa.string()),
+            ("sentiment_score", pa.float64()),
+            ("sentiment_justification", pa.string()),
+            ("theme", pa.string()),
+            ("attributes", pa.string()),
+        ])
+        files["responses.parquet"] = os.path.join(directory, "responses.parquet")
+        parquet_writer = pq.ParquetWriter(files["responses.parquet"], schema, compression="zstd")
+    try:
+        for position, chunk in enumerate(iter_response_chunks(store, chunk_rows)):
+            if csv_path:
+                chunk.to_csv(csv_path, mode="w" if position == 0 else "a", header=position == 0, index=False)
+            if parquet_writer is not None:
+                parquet_writer.write_table(pa.Table.from_pandas(chunk, schema=schema, preserve_index=False))
+    finally:
+        if parquet_writer is not None:
+            parquet_writer.close()
+    if csv_path:
+        if not os.path.exists(csv_path):
+            pd.DataFrame(columns=RESPONSE_COLUMNS).to_csv(csv_path, index=False)
+        files["responses.csv"] = csv_path
+    return files
+
+def _markdown_report(counts, themes, summary, generated_at):
+    total = int(counts["count"].sum())
+    sentiment = counts.groupby("sentiment_label", as_index=False)["count"].sum().sort_values("count", ascending=False)
+    sentiment["share"] = (sentiment["count"] / total).map("{:.1%}".format) if total else ""
+    crosstab = counts.pivot_table(index="theme", columns="sentiment_label", values="count", aggfunc="sum", fill_value=0)
+    crosstab = crosstab.reset_index()
+
+    lines = [
+        "# TelcoResQ Survey Insights Report",
+        "",
+        f"Generated {generated_at:%Y-%m-%d %H:%M} UTC from {total} responses.",
+        "",
+        "## Executive Summary",
+        "",
+        summary or "_No summary has been generated yet._",
+        "",
+        "## Sentiment Distribution",
+        "",
+        _markdown_table(sentiment),
+        "",
+        "## Themes",
+        "",
+    ]
+    if themes:
+        for theme in themes:
+            lines.append(f"### {theme['name']} ({theme['frequency']} responses)")
+            lines.append("")
+            lines.append(theme["description"] or "")
+            for example in theme["examples"][:3]:
+                lines.append(f"> {example}")
+                lines.append("")
+            lines.append("")
+    else:
+        lines += ["_No themes have been extracted yet._", ""]
+    lines += ["## Sentiment by Theme", "", _markdown_table(crosstab), ""]
+    return "\n".join(lines)
+
+def build_report(store, output_dir=None, formats=("markdown", "csv", "parquet"), chunk_rows=None, force=False):
+    """
+    Builds an insights report from the results stored for a `SurveyVectorStore`, without
+    any LLM calls: sentiment labels, theme assignments and the stored executive summary.
+
+    Writes, depending on `formats`:
+    - markdown: report.md with the summary, sentiment distribution, themes and a
+      sentiment-by-theme table, plus the charts from `visualizations.py` as Plotly JSON
+    - csv / parquet: every response with its sentiment and theme, streamed in chunks
+      of `chunk_rows`
+    Reports are written to a directory named after `report_fingerprint`, so building a
+    report for unchanged results returns the existing files (unless `force` is set).
+    Returns a dict with the `directory`, the `files` ({name: path}) and whether it was `reused`.
+    """
+    output_dir = output_dir or settings.REPORTS_PATH
+    counts = sentiment_theme_counts(store)
+    directory = os.path.join(output_dir, report_fingerprint(store, counts, chunk_rows))
+    manifest_path = os.path.join(directory, _MANIFEST)
+    if not force and os.path.exists(manifest_path):
+        with open(manifest_path) as f:
+            manifest = json.load(f)
+        if set(formats) <= set(manifest["formats"]):
+            return {"directory": directory, "files": manifest["files"], "reused": True}
+
+    os.makedirs(directory, exist_ok=True)
+    files = {}
+    if "markdown" in formats:
+        themes = store.load_themes()
+        generated_at = datetime.datetime.now(datetime.timezone.utc)
+        files["report.md"] = os.path.join(directory, "report.md")
+        with open(files["report.md"], "w") as f:
+            f.write(_markdown_report(counts, themes, store.load_artifact("summary"), generated_at))
+        charts = {
+            "sentiment_chart.json": create_sentiment_pie_chart(counts, count_col="count"),
+            "theme_chart.json": create_theme_frequency_bar_chart(parse_themes_to_df(themes)),
+        }
+        for name, fig in charts.items():
+            if fig is not None:
+                files[name] = os.path.join(directory, name)
+                fig.write_json(files[name])
+    files.update(_write_responses(store, directory, formats, chunk_rows))
+
+    # Written last, so an interrupted build is never reused.
+    with open(f"{manifest_path}.tmp", "w") as f:
+        json.dump({"formats": list(formats), "files": files}, f)
+    os.replace(f"{manifest_path}.tmp", manifest_path)
+    return {"directory": directory, "files": files, "reused": False}
@@ -0,0 +1,25 @@
+import functools
+from telcoresq.config import settings
+
+@functools.lru_cache(maxsize=None)
+def _load_cross_encoder(model_name):
+    """Loads a sentence-transformers cross-encoder once per process."""
+    from sentence_transformers import CrossEncoder
+    return CrossEncoder(model_name, device="cpu")
+
+def rerank(query, hits, model=None, top_n=None):
+    """
+    Reorders search hits by the relevance a local cross-encoder assigns to each
+    (query, response text) pair. Only the first `top_n` hits are scored; the rest keep
+    their order after them. Each scored hit gets a `rerank_score`.
+    Returns the hits unchanged when no reranker model is configured.
+    """
+    model = model if model is not None else settings.RERANKER_MODEL
+    if not model or not hits:
+        return hits
+    top_n = top_n or settings.RERANK_TOP_N
+    head, tail = hits[:top_n], hits[top_n:]
+    scores = _load_cross_encoder(model).predict([(query, hit["text"]) for hit in head])
+    for hit, score in zip(head, scores):
+        hit["rerank_score"] = float(score)
+    return sorted(head, key=lambda hit: hit["rerank_score"], reverse=True) + tail
@@ -0,0 +1,86 @@
+import json
+import re
+from typing import List, Literal
+from pydantic import BaseModel, Field, ValidationError, field_validator
+from langchain_core.utils.function_calling import convert_to_openai_tool
+from langchain_openai import ChatOpenAI
+from telcoresq.app.utils.metrics import model_name, tracked_call
+
+class SentimentItem(BaseModel):
+    """Sentiment of one numbered survey response."""
+    number: int = Field(description="Number of the response in the list")
+    sentiment: Literal["positive", "negative", "neutral"]
+    score: float = Field(ge=-1, le=1, description="Sentiment from -1 (very negative) to 1 (very positive)")
+    justification: str = Field(min_length=1, description="One-sentence justification")
+
+    @field_validator("sentiment", mode="before")
+    @classmethod
+    def _lowercase(cls, value):
+        return value.strip().lower() if isinstance(value, str) else value
+
+class SentimentBatch(BaseModel):
+    """Sentiment classifications for a list of numbered survey responses."""
+    results: List[SentimentItem]
+
+class ClusterTheme(BaseModel):
+    """The theme shared by a group of similar survey responses."""
+    theme: str = Field(min_length=1, description="Short theme name")
+    description: str = Field(description="One-sentence description")
+
+class MergedTheme(BaseModel):
+    """One final theme and the clusters it covers."""
+    name: str = Field(min_length=1)
+    clusters: List[int] = Field(description="Numbers of the clusters merged into this theme")
+    description: str
+
+class ThemeMerge(BaseModel):
+    """The final list of distinct themes."""
+    themes: List[MergedTheme]
+
+class Summary(BaseModel):
+    """An executive summary of survey responses."""
+    summary: str = Field(min_length=1)
+
+_CODE_FENCE_PATTERN = re.compile(r'^\s*```(?:json)?\s*|\s*```\s*$', re.IGNORECASE)
+
+def parse_json_object(text):
+    """
+    Decodes the JSON object in a model reply, tolerating code fences and text around it.
+    Raises ValueError if there is no valid JSON object.
+    """
+    text = _CODE_FENCE_PATTERN.sub("", text or "")
+    start, end = text.find("{"), text.rfind("}")
+    if start == -1 or end < start:
+        raise ValueError("The reply does not contain a JSON object.")
+    try:
+        value = json.loads(text[start:end + 1])
+    except json.JSONDecodeError as e:
+        raise ValueError(f"The reply is not valid JSON: {e}") from e
+    if not isinstance(value, dict):
+        raise ValueError("The reply is not a JSON object.")
+    return value
+
+def request_json(llm, prompt, schema):
+    """
+    Asks `llm` for output shaped like the pydantic model `schema` and returns it as a
+    decoded dict, without validating it (callers validate, so one bad item does not
+    discard a whole batch). OpenAI chat models are called with function calling; any
+    other LangChain chat model is expected to reply with a JSON object, as the prompts ask.
+    Raises ValueError if no JSON object comes back.
+    """
+    if isinstance(llm, ChatOpenAI):
+        structured = llm.with_structured_output(
+            convert_to_openai_tool(schema), method="function_calling", include_raw=True
+        )
+        reply = tracked_call("chat", model_name(llm), structured.invoke, prompt, usage_of=lambda reply: reply["raw"])
+        if not isinstance(reply["parsed"], dict):
+            raise ValueError("The model did not return the requested function call.")
+        return reply["parsed"]
+    return parse_json_object(tracked_call("chat", model_name(llm), llm.invoke, prompt).content)
+
+def validate(schema, value):
+    """Returns `value` validated as `schema`, or None if it does not validate."""
+    try:
+        return schema.model_validate(value)
+    except ValidationError:
+        return None
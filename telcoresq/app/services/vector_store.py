@@ -1,28 +1,376 @@
 import faiss
 import numpy as np
+import pandas as pd
+import datetime
+import json
 import os
+from sqlalchemy import bindparam, select
 from telcoresq.config import settings
+from telcoresq.app.services import database
+from telcoresq.app.services.data_processing import content_hash
+from telcoresq.app.services.dedup import SentimentGroups
+from telcoresq.app.services.lexical_index import (
+    BM25Index, exact_terms, load_lexical_index, reciprocal_rank_fusion, save_lexical_index
+)
+from telcoresq.app.services.reranker import rerank
 
-def create_faiss_index(embeddings):
+INDEX_TYPES = ("auto", "flat", "ivf", "hnsw", "ivfpq")
+
+# FAISS recommends at least this many training points per IVF centroid / PQ code
+_MIN_POINTS_PER_CENTROID = 39
+_PQ_BITS = 8
+
+def _ivf_nlist(num_vectors):
+    """Number of IVF lists for a corpus: ~4*sqrt(N), bounded by the training data available."""
+    return max(1, min(int(4 * np.sqrt(num_vectors)), num_vectors // _MIN_POINTS_PER_CENTROID))
+
+def _pq_subquantizers(dimension):
+    """Largest common PQ sub-quantizer count that divides the vector dimension."""
+    for m in (64, 48, 32, 16, 8, 4, 2):
+        if dimension % m == 0:
+            return m
+    return 1
+
+def estimate_index_memory(index_type, num_vectors, dimension):
+    """Approximate resident memory of an index in bytes."""
+    flat_bytes = num_vectors * dimension * 4
+    if index_type == "hnsw":
+        # Level-0 graph holds 2*M neighbour ids per vector.
+        return flat_bytes + num_vectors * settings.FAISS_HNSW_M * 2 * 4
+    if index_type == "ivf":
+        return flat_bytes + num_vectors * 8
+    if index_type == "ivfpq":
+        return num_vectors * (_pq_subquantizers(dimension) * _PQ_BITS // 8 + 8)
+    return flat_bytes
+
+def choose_index_type(num_vectors, dimension, memory_budget_mb=None):
+    """
+    Picks an index type from the corpus size and a memory budget: exact search for
+    small corpora, then HNSW, IVF-Flat and finally IVF-PQ as memory gets tighter.
+    """
+    memory_budget = (memory_budget_mb or settings.FAISS_MEMORY_BUDGET_MB) * 1024 * 1024
+    if num_vectors <= settings.FAISS_FLAT_MAX_VECTORS:
+        return "flat"
+    for index_type in ("hnsw", "ivf"):
+        if estimate_index_memory(index_type, num_vectors, dimension) <= memory_budget:
+            return index_type
+    return "ivfpq"
+
+def _resolve_index_type(index_type, num_vectors, dimension, memory_budget_mb=None):
+    """The concrete index type to build for `index_type` (one of `INDEX_TYPES`) and a corpus size."""
+    index_type = index_type or settings.FAISS_INDEX_TYPE
+    if index_type not in INDEX_TYPES:
+        raise ValueError(f"Unknown index type '{index_type}'. Expected one of {', '.join(INDEX_TYPES)}.")
+    if index_type == "auto":
+        index_type = choose_index_type(num_vectors, dimension, memory_budget_mb)
+    if index_type == "ivfpq" and num_vectors < 2 ** _PQ_BITS * _MIN_POINTS_PER_CENTROID:
+        # Too few vectors to train the PQ codebooks; plain IVF is both smaller and more accurate here.
+        index_type = "ivf"
+    return index_type
+
+def _training_sample(vectors, min_size):
+    """Random sample of `vectors` used to train IVF/PQ quantizers."""
+    sample_size = min(len(vectors), max(min_size, settings.FAISS_TRAIN_SAMPLE_SIZE))
+    if sample_size == len(vectors):
+        return vectors
+    rng = np.random.default_rng(0)
+    return vectors[np.sort(rng.choice(len(vectors), size=sample_size, replace=False))]
+
+def _build_index(index_type, vectors):
+    """Builds and trains an empty index of `index_type` for `vectors`."""
+    num_vectors, dimension = vectors.shape
+    if index_type == "flat":
+        return faiss.IndexFlatL2(dimension)
+    if index_type == "hnsw":
+        index = faiss.IndexHNSWFlat(dimension, settings.FAISS_HNSW_M)
+        index.hnsw.efSearch = settings.FAISS_EF_SEARCH
+        return index
+
+    nlist = _ivf_nlist(num_vectors)
+    quantizer = faiss.IndexFlatL2(dimension)
+    if index_type == "ivfpq":
+        index = faiss.IndexIVFPQ(quantizer, dimension, nlist, _pq_subquantizers(dimension), _PQ_BITS)
+        min_training = max(nlist, 2 ** _PQ_BITS) * _MIN_POINTS_PER_CENTROID
+    else:
+        index = faiss.IndexIVFFlat(quantizer, dimension, nlist)
+        min_training = nlist * _MIN_POINTS_PER_CENTROID
+    index.train(_training_sample(vectors, min_training))
+    index.nprobe = min(settings.FAISS_NPROBE, nlist)
+    return index
+
+def create_faiss_index(embeddings, ids=None, index_type=None, memory_budget_mb=None, tune=True):
     """
     Creates a FAISS index from a list of embeddings.
+
+    The index is wrapped in an `IndexIDMap2`, so searches return the given `ids`
+    (row positions by default) and rows can later be added, replaced or removed.
+    `index_type` is one of `INDEX_TYPES`; "auto" picks one with `choose_index_type`.
+    Approximate indexes are trained on a sample of the embeddings and, when `tune`
+    is set, their search parameters are raised until they reach FAISS_TARGET_RECALL.
     """
-    if not embeddings:
+    if embeddings is None or len(embeddings) == 0:
         return None
-    
-    dimension = len(embeddings[0])
-    index = faiss.IndexFlatL2(dimension)
-    index.add(np.array(embeddings).astype('float32'))
+
+    vectors = np.ascontiguousarray(embeddings, dtype='float32')
+    num_vectors, dimension = vectors.shape
+    index_type = _resolve_index_type(index_type, num_vectors, dimension, memory_budget_mb)
+
+    ids = np.arange(num_vectors, dtype=np.int64) if ids is None else np.asarray(ids, dtype=np.int64)
+    index = faiss.IndexIDMap2(_build_index(index_type, vectors))
+    index.add_with_ids(vectors, ids)
+    if tune and index_type != "flat":
+        tune_search_params(index, vectors)
+    return index
+
+def _base_index(index):
+    """Unwraps ID-mapping wrappers to reach the index that holds the search parameters."""
+    index = faiss.downcast_index(index)
+    while isinstance(index, (faiss.IndexIDMap, faiss.IndexIDMap2)):
+        index = faiss.downcast_index(index.index)
     return index
 
-def save_faiss_index(index, path=settings.VECTOR_STORE_PATH):
+def set_search_params(index, nprobe=None, ef_search=None):
+    """Sets `nprobe` on IVF indexes and `efSearch` on HNSW indexes; other indexes are left as is."""
+    base = _base_index(index)
+    if nprobe is not None and isinstance(base, faiss.IndexIVF):
+        base.nprobe = min(nprobe, base.nlist)
+    if ef_search is not None and isinstance(base, faiss.IndexHNSW):
+        base.hnsw.efSearch = ef_search
+
+def evaluate_recall(index, vectors, k=10, num_queries=200, seed=0):
+    """
+    Measures recall@k of `index` against exact (flat L2) search, using a random
+    sample of `vectors` as queries.
+    """
+    vectors = np.ascontiguousarray(vectors, dtype='float32')
+    k = min(k, len(vectors))
+    rng = np.random.default_rng(seed)
+    queries = vectors[rng.choice(len(vectors), size=min(num_queries, len(vectors)), replace=False)]
+
+    _, expected = faiss.knn(queries, vectors, k)
+    _, found = index.search(queries, k)
+    if isinstance(faiss.downcast_index(index), (faiss.IndexIDMap, faiss.IndexIDMap2)):
+        # Compare positions, not external ids.
+        id_map = faiss.vector_to_array(faiss.downcast_index(index).id_map)
+        position_of = {int(i): position for position, i in enumerate(id_map)}
+        found = np.vectorize(lambda i: position_of.get(int(i), -1))(found)
+    hits = sum(len(set(e) & set(f)) for e, f in zip(expected, found))
+    return hits / (len(queries) * k)
+
+def tune_search_params(index, vectors, target_recall=None, k=10):
+    """
+    Doubles `nprobe` (IVF) or `efSearch` (HNSW) until recall@k reaches `target_recall`
+    or the parameter cannot grow any further. Returns the recall that was reached.
+    """
+    target_recall = target_recall or settings.FAISS_TARGET_RECALL
+    base = _base_index(index)
+    recall = evaluate_recall(index, vectors, k)
+    if isinstance(base, faiss.IndexIVF):
+        while recall < target_recall and base.nprobe < base.nlist:
+            set_search_params(index, nprobe=base.nprobe * 2)
+            recall = evaluate_recall(index, vectors, k)
+    elif isinstance(base, faiss.IndexHNSW):
+        while recall < target_recall and base.hnsw.efSearch < 1024:
+            set_search_params(index, ef_search=base.hnsw.efSearch * 2)
+            recall = evaluate_recall(index, vectors, k)
+    return recall
+
+def index_type_of(index):
+    """The `INDEX_TYPES` name of a built index."""
+    base = _base_index(index)
+    if isinstance(base, faiss.IndexIVFPQ):
+        return "ivfpq"
+    if isinstance(base, faiss.IndexIVF):
+        return "ivf"
+    if isinstance(base, faiss.IndexHNSW):
+        return "hnsw"
+    return "flat"
+
+def describe_index(index):
+    """Short human-readable description of an index and its search parameters."""
+    base = _base_index(index)
+    if isinstance(base, faiss.IndexIVFPQ):
+        return f"IVF-PQ (nlist={base.nlist}, nprobe={base.nprobe}, m={base.pq.M})"
+    if isinstance(base, faiss.IndexIVFFlat):
+        return f"IVF-Flat (nlist={base.nlist}, nprobe={base.nprobe})"
+    if isinstance(base, faiss.IndexHNSW):
+        return f"HNSW (efSearch={base.hnsw.efSearch})"
+    return "Flat (exact search)"
+
+def get_index_ids(index):
+    """Returns the ids stored in an ID-mapped index."""
+    return faiss.vector_to_array(faiss.downcast_index(index).id_map)
+
+def add_vectors(index, ids, vectors):
+    """Adds vectors under the given ids. The ids must not already be in the index."""
+    if len(ids):
+        index.add_with_ids(np.ascontiguousarray(vectors, dtype='float32'), np.asarray(ids, dtype=np.int64))
+    return index
+
+def remove_vectors(index, ids):
+    """
+    Removes the given ids from the index and returns the updated index.
+    Index types that do not support removal (HNSW) are rebuilt from their stored vectors,
+    in which case a new index object is returned.
+    """
+    ids = np.asarray(ids, dtype=np.int64)
+    if not len(ids):
+        return index
+    try:
+        index.remove_ids(faiss.IDSelectorBatch(ids))
+        return index
+    except RuntimeError:
+        return _rebuild_without(index, ids)
+
+def upsert_vectors(index, ids, vectors):
+    """Replaces the vectors of existing ids and adds the new ones. Returns the updated index."""
+    index = remove_vectors(index, np.intersect1d(get_index_ids(index), np.asarray(ids, dtype=np.int64)))
+    return add_vectors(index, ids, vectors)
+
+def removes_in_place(index):
+    """Whether vectors can be removed from the index without rebuilding it (all types but HNSW)."""
+    return not isinstance(_base_index(index), faiss.IndexHNSW)
+
+def compact_vectors(index, pending):
+    """
+    Applies deferred changes to an HNSW index in one rebuild. `pending` maps each id changed
+    since the last compaction to whether it is still present: its latest vector is kept,
+    or, for removed ids, every vector. Returns the (possibly new) index.
+    """
+    if not pending:
+        return index
+    return _rebuild_without(index, [response_id for response_id, present in pending.items() if not present])
+
+def _rebuild_without(index, removed_ids):
+    """
+    Rebuilds an HNSW index without `removed_ids`, keeping its search parameters. Ids added
+    more than once (see `apply_index_changes`) keep only their latest vector.
+    """
+    base = _base_index(index)
+    stored_ids = get_index_ids(index)
+    _, last_in_reverse = np.unique(stored_ids[::-1], return_index=True)
+    latest = np.zeros(len(stored_ids), dtype=bool)
+    latest[len(stored_ids) - 1 - last_in_reverse] = True
+    keep = latest & ~np.isin(stored_ids, np.asarray(removed_ids, dtype=np.int64))
+    vectors = base.reconstruct_n(0, base.ntotal)[keep]
+    rebuilt = faiss.IndexHNSWFlat(base.d, base.hnsw.nb_neighbors(1))
+    rebuilt.hnsw.efSearch = base.hnsw.efSearch
+    rebuilt = faiss.IndexIDMap2(rebuilt)
+    rebuilt.add_with_ids(vectors, stored_ids[keep])
+    return rebuilt
+
+def _manifest_path(path):
+    return f"{path}.manifest.json"
+
+def _lexical_path(path):
+    return f"{path}.bm25.json"
+
+def load_index_manifest(path=settings.VECTOR_STORE_PATH):
+    """
+    Loads the {response_id: content_hash} manifest stored next to the index.
+    Returns None if the manifest was saved with a different index file than the one
+    at `path` (a save that was interrupted between the two renames).
+    """
+    if not os.path.exists(_manifest_path(path)):
+        return {}
+    with open(_manifest_path(path)) as f:
+        saved = json.load(f)
+    if "responses" in saved:
+        if tuple(saved["index_version"]) != index_version(path):
+            return None
+        saved = saved["responses"]
+    # Manifests saved before the index version was recorded are plain {response_id: hash} dicts.
+    return {int(response_id): digest for response_id, digest in saved.items()}
+
+def apply_index_changes(index, manifest, ids, texts, embed_fn, index_type=None, on_change=None, remove_missing=True,
+                        pending=None):
+    """
+    Applies a set of rows to an in-memory index and its {response_id: content_hash} manifest.
+
+    Rows whose id is new or whose text changed are embedded with `embed_fn(texts)`
+    (which returns one vector or None per text) and upserted. With `remove_missing`,
+    ids in the manifest that are not among the given rows are removed; pass False when
+    the rows are only one chunk of a larger upload.
+    `on_change(upserted_ids, vectors, removed_ids)` is called before the index is changed.
+    With a `pending` dict, indexes that cannot remove vectors in place (HNSW) are not
+    rebuilt: new vectors are appended next to the old ones and the changed ids are recorded
+    in `pending` for one later `compact_vectors`. The manifest is updated in place.
+    Returns the (possibly new) index and a dict of counts.
+    """
+    hashes = [content_hash(text) for text in texts]
+    changed = [row for row, (response_id, digest) in enumerate(zip(ids, hashes)) if manifest.get(int(response_id)) != digest]
+    removed = set(manifest) - {int(response_id) for response_id in ids} if remove_missing else set()
+
+    vectors = embed_fn([texts[row] for row in changed]) if changed else []
+    embedded = [(row, vector) for row, vector in zip(changed, vectors) if vector is not None]
+    embedded_ids = np.array([ids[row] for row, _ in embedded], dtype=np.int64)
+    # Rows whose text became empty are dropped from the index.
+    removed |= {int(ids[row]) for row, vector in zip(changed, vectors) if vector is None and int(ids[row]) in manifest}
+
+    stats = {
+        "added": sum(1 for row, _ in embedded if int(ids[row]) not in manifest),
+        "updated": sum(1 for row, _ in embedded if int(ids[row]) in manifest),
+        "removed": len(removed),
+        "unchanged": len(ids) - len(changed),
+    }
+
+    if on_change is not None:
+        on_change(embedded_ids, [vector for _, vector in embedded], sorted(removed))
+
+    if index is None:
+        if not embedded:
+            return None, stats
+        index = create_faiss_index([vector for _, vector in embedded], ids=embedded_ids, index_type=index_type)
+    elif pending is not None and not removes_in_place(index):
+        for response_id in removed:
+            pending[response_id] = False
+        for response_id in embedded_ids.tolist():
+            if response_id in manifest or response_id in pending:
+                pending[response_id] = True
+        index = add_vectors(index, embedded_ids, [vector for _, vector in embedded])
+    else:
+        index = remove_vectors(index, np.fromiter(removed, dtype=np.int64, count=len(removed)))
+        if embedded:
+            index = upsert_vectors(index, embedded_ids, [vector for _, vector in embedded])
+
+    for response_id in removed:
+        manifest.pop(response_id, None)
+    for row, _ in embedded:
+        manifest[int(ids[row])] = hashes[row]
+    return index, stats
+
+def _load_index_and_manifest(path):
+    """
+    Loads an index and its manifest, discarding indexes saved before ids were tracked.
+    The manifest is None if it does not belong to the index file (see `load_index_manifest`).
+    """
+    index = load_faiss_index(path)
+    if index is None or not isinstance(faiss.downcast_index(index), faiss.IndexIDMap2):
+        # Indexes saved before ids were tracked have to be rebuilt once.
+        return None, {}
+    return index, load_index_manifest(path)
+
+def save_faiss_index(index, path=settings.VECTOR_STORE_PATH, manifest=None):
     """
-    Saves a FAISS index to a file.
+    Saves a FAISS index to a file, together with its id manifest if one is given.
+    Files are written to a temporary path first and then renamed, so readers never
+    see a partially written index. The manifest records the version (see `index_version`)
+    of the index file it was saved with, which renaming keeps, so an index and manifest
+    from different saves are detected on load.
     """
     if index is None:
         return
     os.makedirs(os.path.dirname(path), exist_ok=True)
-    faiss.write_index(index, path)
+    faiss.write_index(index, f"{path}.tmp")
+    if manifest is not None:
+        with open(f"{_manifest_path(path)}.tmp", "w") as f:
+            json.dump({
+                "index_version": index_version(f"{path}.tmp"),
+                "responses": {str(response_id): digest for response_id, digest in manifest.items()},
+            }, f)
+    os.replace(f"{path}.tmp", path)
+    if manifest is not None:
+        os.replace(f"{_manifest_path(path)}.tmp", _manifest_path(path))
     print(f"FAISS index saved to {path}")
 
 def load_faiss_index(path=settings.VECTOR_STORE_PATH):
@@ -31,4 +379,472 @@ def load_faiss_index(path=settings.VECTOR_STORE_PATH):
     """
     if not os.path.exists(path):
         return None
-    return faiss.read_index(path) 
\ No newline at end of file
+    return faiss.read_index(path)
+
+def index_version(path=settings.VECTOR_STORE_PATH):
+    """
+    Returns a token that changes whenever the index saved at `path` is rewritten
+    (its modification time and size), or None if there is no index yet.
+    """
+    if not os.path.exists(path):
+        return None
+    stat = os.stat(path)
+    return (stat.st_mtime_ns, stat.st_size)
+
+class SurveyVectorStore:
+    """
+    Vector store that keeps the FAISS index together with its documents.
+
+    Response texts, metadata and vectors are stored in the `survey_responses` and
+    `embeddings` tables, keyed by the same response ids as the index, so search hits
+    resolve to documents in any session without the original DataFrame.
+    A BM25 index over the same responses is kept in step with the FAISS index for
+    lexical and hybrid search. The vectors belong to `embedding_model` (default
+    EMBEDDING_MODEL): when it changes, the stored vectors and the index are dropped, and the
+    next sync embeds every response again.
+    """
+
+    # Fields stored as columns of `survey_responses`; any other filter key is looked up in `attributes`.
+    COLUMN_FIELDS = ("sentiment_label",)
+
+    def __init__(self, engine=None, index_path=settings.VECTOR_STORE_PATH, embedding_model=None):
+        self.engine = engine if engine is not None else database.get_engine(settings.DATABASE_URL)
+        database.create_tables(self.engine)
+        self.index_path = index_path
+        self.embedding_model = embedding_model or settings.EMBEDDING_MODEL
+        stored_model = self.load_artifact("embedding_model")
+        if stored_model is not None and stored_model != self.embedding_model:
+            print(f"The embedding model changed from {stored_model} to {self.embedding_model}; dropping the stored vectors.")
+            self._drop_vectors()
+        if stored_model != self.embedding_model:
+            self.save_artifact("embedding_model", self.embedding_model)
+        # Ids whose HNSW vectors changed since the last compaction (see `compact_vectors`).
+        self.pending = {}
+        self.index, self.manifest = _load_index_and_manifest(index_path)
+        self.version = index_version(index_path)
+        self.lexical = load_lexical_index(_lexical_path(index_path))
+        if self.manifest is None:
+            # The index and its manifest come from different saves; the database has the rows of both.
+            self.rebuild_index()
+        elif self.lexical is None:
+            # Stores saved before lexical search was added get their BM25 index built once.
+            self.lexical = BM25Index()
+            if self.manifest:
+                self.lexical.upsert(*self._indexed_texts())
+
+    def sync(self, ids, texts, embed_fn, attributes=None, index_type=None, remove_missing=True, save=True):
+        """
+        Stores the given rows and updates the index incrementally (see `apply_index_changes`).
+        `attributes` is an optional list of per-row metadata dicts; without it, the stored
+        attributes of existing rows are kept. When syncing an upload
+        chunk by chunk, pass `remove_missing=False, save=False` and call `delete` and `save`
+        once at the end. On an HNSW index, replaced and removed vectors are dropped in a
+        single rebuild at the next `save` or search (see `compact`).
+        Returns a dict of added/updated/removed/unchanged counts.
+        """
+        ids = [int(response_id) for response_id in ids]
+        responses = [{"response_id": response_id, "processed_text": text or ""} for response_id, text in zip(ids, texts)]
+        if attributes is not None:
+            for response, row_attributes in zip(responses, attributes):
+                response["attributes"] = {key: str(value) for key, value in row_attributes.items()}
+
+        text_of = dict(zip(ids, texts))
+
+        def persist(upserted_ids, vectors, removed_ids):
+            with self.engine.begin() as conn:
+                self._delete_rows(conn, removed_ids)
+                database.upsert_rows(conn, database.survey_responses, responses, ["response_id"])
+                database.bulk_upsert_embeddings(conn, upserted_ids, vectors)
+            self.lexical.remove(removed_ids)
+            self.lexical.upsert(upserted_ids, [text_of[int(response_id)] for response_id in upserted_ids])
+
+        self.index, stats = apply_index_changes(
+            self.index, self.manifest, ids, texts, embed_fn,
+            index_type=index_type, on_change=persist, remove_missing=remove_missing, pending=self.pending
+        )
+        if save:
+            self.refresh_index(index_type)
+            self.save()
+        return stats
+
+    def _drop_vectors(self):
+        """Deletes every stored vector and the saved index and manifest (not the BM25 index)."""
+        with self.engine.begin() as conn:
+            conn.execute(database.embeddings.delete())
+        for path in (self.index_path, _manifest_path(self.index_path)):
+            if os.path.exists(path):
+                os.remove(path)
+
+    def _delete_rows(self, conn, ids):
+        batch_size = settings.DB_BULK_BATCH_SIZE
+        for start in range(0, len(ids), batch_size):
+            batch = [int(response_id) for response_id in ids[start:start + batch_size]]
+            conn.execute(database.embeddings.delete().where(database.embeddings.c.response_id.in_(batch)))
+            conn.execute(database.survey_responses.delete().where(database.survey_responses.c.response_id.in_(batch)))
+
+    def delete(self, ids):
+        """Removes responses from the database and the index."""
+        ids = list(ids)
+        if not ids:
+            return
+        with self.engine.begin() as conn:
+            self._delete_rows(conn, ids)
+        if self.index is not None and not removes_in_place(self.index):
+            self.pending.update({int(response_id): False for response_id in ids})
+        elif self.index is not None:
+            self.index = remove_vectors(self.index, np.asarray(ids, dtype=np.int64))
+        self.lexical.remove(ids)
+        for response_id in ids:
+            self.manifest.pop(int(response_id), None)
+
+    def stored_ids(self):
+        """Returns the ids of all stored responses."""
+        with self.engine.connect() as conn:
+            return np.array(conn.execute(select(database.survey_responses.c.response_id)).scalars().all(), dtype=np.int64)
+
+    def compact(self):
+        """Applies the changes deferred on an HNSW index, rebuilding it once (see `compact_vectors`)."""
+        if self.pending:
+            self.index = compact_vectors(self.index, self.pending)
+            self.pending = {}
+
+    def save(self):
+        """Saves the index, its manifest and the BM25 index."""
+        self.compact()
+        save_lexical_index(self.lexical, _lexical_path(self.index_path))
+        save_faiss_index(self.index, self.index_path, manifest=self.manifest)
+        self.version = index_version(self.index_path)
+
+    def rebuild_index(self, index_type=None):
+        """
+        Rebuilds the FAISS index, its manifest and the BM25 index from the data stored
+        in the database, e.g. to switch index type or to recover a lost index file.
+        """
+        ids, matrix = database.load_embedding_matrix(self.engine)
+        self.lexical = BM25Index()
+        self.pending = {}
+        if not len(ids):
+            self.index, self.manifest = None, {}
+            return None
+        text_ids, texts = self._indexed_texts()
+        self.lexical.upsert(text_ids, texts)
+        self.index = create_faiss_index(matrix, ids=ids, index_type=index_type)
+        self.manifest = {response_id: content_hash(text) for response_id, text in zip(text_ids, texts)}
+        self.save()
+        return self.index
+
+    def refresh_index(self, index_type=None):
+        """
+        Retrains the vector index from the stored embeddings when it no longer suits the
+        corpus it has grown (or shrunk) into: when `index_type` ("auto" by default, see
+        `choose_index_type`) now resolves to a different type, e.g. a Flat index that grew
+        past FAISS_FLAT_MAX_VECTORS, or when an IVF index has grown enough to need at least
+        twice as many lists as it was trained with. Returns True if the index was rebuilt.
+        The manifest and BM25 index are unaffected; call `save` afterwards.
+        """
+        self.compact()
+        if self.index is None or self.index.ntotal == 0:
+            return False
+        wanted = _resolve_index_type(index_type, self.index.ntotal, self.index.d)
+        base = _base_index(self.index)
+        outgrown = isinstance(base, faiss.IndexIVF) and _ivf_nlist(self.index.ntotal) >= 2 * base.nlist
+        if wanted == index_type_of(self.index) and not outgrown:
+            return False
+        ids, matrix = database.load_embedding_matrix(self.engine)
+        print(f"Rebuilding the {describe_index(self.index)} index of {self.index.ntotal} vectors as {wanted}.")
+        self.index = create_faiss_index(matrix, ids=ids, index_type=wanted)
+        return True
+
+    def _indexed_texts(self):
+        """Returns `(ids, texts)` of the responses that have an embedding."""
+        table = database.survey_responses
+        stmt = select(table.c.response_id, table.c.processed_text).where(table.c.response_id.in_(
+            select(database.embeddings.c.response_id)
+        ))
+        with self.engine.connect() as conn:
+            rows = conn.execute(stmt).all()
+        return [row.response_id for row in rows], [row.processed_text for row in rows]
+
+    def load_corpus(self):
+        """
+        Loads every embedded response as `(ids, texts, matrix)`, aligned by row,
+        for corpus-wide analysis such as theme clustering.
+        """
+        ids, matrix = database.load_embedding_matrix(self.engine)
+        text_of = dict(zip(*self._indexed_texts()))
+        return ids, [text_of[int(response_id)] for response_id in ids], matrix
+
+    def load_texts(self):
+        """Returns the text of every stored response, streamed from the database."""
+        table = database.survey_responses
+        with self.engine.connect() as conn:
+            result = conn.execution_options(stream_results=True, yield_per=settings.DB_BULK_BATCH_SIZE).execute(
+                select(table.c.processed_text).order_by(table.c.response_id)
+            )
+            return [text for text in result.scalars() if text]
+
+    def update_themes(self, themes, ids, assignments):
+        """Replaces the stored themes and records the theme id of every response."""
+        table = database.survey_responses
+        stmt = table.update().where(table.c.response_id == bindparam("b_response_id")).values(
+            theme_id=bindparam("theme_id")
+        )
+        with self.engine.begin() as conn:
+            conn.execute(table.update().where(table.c.theme_id.is_not(None)).values(theme_id=None))
+            conn.execute(database.themes.delete())
+            if themes:
+                conn.execute(database.themes.insert(), [
+                    {
+                        "theme_id": theme["theme_id"],
+                        "theme_name": theme["name"],
+                        "description": theme["description"],
+                        "frequency": theme["frequency"],
+                        "examples": json.dumps(theme["examples"]),
+                    }
+                    for theme in themes
+                ])
+            rows = [
+                {"b_response_id": int(response_id), "theme_id": theme_id}
+                for response_id, theme_id in zip(ids, assignments) if theme_id is not None
+            ]
+            database.execute_batches(conn, stmt, rows)
+
+    def update_sentiments(self, ids, labels, scores=None, justifications=None):
+        """Stores sentiment labels (and optionally scores and justifications) for the given response ids."""
+        scores = scores if scores is not None else [None] * len(ids)
+        justifications = justifications if justifications is not None else [None] * len(ids)
+        rows = [
+            {
+                "b_response_id": int(response_id),
+                "sentiment_label": label,
+                "sentiment_score": score,
+                "sentiment_justification": justification,
+            }
+            for response_id, label, score, justification in zip(ids, labels, scores, justifications)
+        ]
+        if not rows:
+            return
+        table = database.survey_responses
+        stmt = table.update().where(table.c.response_id == bindparam("b_response_id")).values(
+            sentiment_label=bindparam("sentiment_label"),
+            sentiment_score=bindparam("sentiment_score"),
+            sentiment_justification=bindparam("sentiment_justification"),
+        )
+        with self.engine.begin() as conn:
+            database.execute_batches(conn, stmt, rows)
+
+    def pending_sentiments(self, limit, after_id=None):
+        """
+        Returns `(ids, texts)` of up to `limit` responses that have no sentiment label yet,
+        in id order, starting after `after_id` if given.
+        """
+        table = database.survey_responses
+        stmt = select(table.c.response_id, table.c.processed_text).where(table.c.sentiment_label.is_(None))
+        if after_id is not None:
+            stmt = stmt.where(table.c.response_id > int(after_id))
+        stmt = stmt.order_by(table.c.response_id).limit(limit)
+        with self.engine.connect() as conn:
+            rows = conn.execute(stmt).all()
+        return [row.response_id for row in rows], [row.processed_text for row in rows]
+
+    def load_responses(self, columns=("response_id", "processed_text", "sentiment_label", "theme_id")):
+        """Loads the given columns of every stored response into a DataFrame."""
+        table = database.survey_responses
+        with self.engine.connect() as conn:
+            return pd.read_sql(select(*[table.c[column] for column in columns]), conn)
+
+    def load_themes(self):
+        """Loads the stored themes, in the format returned by `extract_themes`."""
+        table = database.themes
+        with self.engine.connect() as conn:
+            rows = conn.execute(select(table).order_by(table.c.frequency.desc())).all()
+        return [
+            {
+                "theme_id": row.theme_id,
+                "name": row.theme_name,
+                "description": row.description,
+                "frequency": row.frequency,
+                "examples": json.loads(row.examples) if row.examples else [],
+            }
+            for row in rows
+        ]
+
+    def load_sentiment_groups(self, mode=None):
+        """Returns the stored duplicate groups and their sentiment results as `SentimentGroups`."""
+        groups = SentimentGroups(mode=mode)
+        if groups.mode != "off":
+            with self.engine.connect() as conn:
+                groups.load_rows(conn.execute(select(database.sentiment_groups)))
+        return groups
+
+    def save_sentiment_groups(self, groups):
+        """Stores the group memberships and results that changed since `groups` was loaded or last saved."""
+        with self.engine.begin() as conn:
+            database.upsert_rows(conn, database.sentiment_groups, groups.dirty_rows(), ["text_key"])
+        groups.mark_saved()
+
+    def save_artifact(self, name, value):
+        """Stores a derived result, such as the executive summary, under `name`."""
+        with self.engine.begin() as conn:
+            database.upsert_rows(conn, database.artifacts, [{
+                "name": name,
+                "value": value,
+                "updated_at": datetime.datetime.now(datetime.timezone.utc).replace(tzinfo=None),
+            }], ["name"])
+
+    def load_artifact(self, name):
+        """Returns the stored value of an artifact, or None."""
+        table = database.artifacts
+        with self.engine.connect() as conn:
+            return conn.execute(select(table.c.value).where(table.c.name == name)).scalar()
+
+    def _filter_clause(self, field, value):
+        table = database.survey_responses
+        column = table.c[field] if field in self.COLUMN_FIELDS else table.c.attributes[field].as_string()
+        if isinstance(value, (list, tuple, set)):
+            return column.in_([str(v) for v in value])
+        return column == str(value)
+
+    def matching_ids(self, filters):
+        """Returns the ids of responses matching every `field: value` filter (a list value matches any of its items)."""
+        table = database.survey_responses
+        stmt = select(table.c.response_id)
+        for field, value in filters.items():
+            stmt = stmt.where(self._filter_clause(field, value))
+        with self.engine.connect() as conn:
+            return np.array(conn.execute(stmt).scalars().all(), dtype=np.int64)
+
+    def distinct_values(self, field):
+        """Returns the distinct values of a filterable field, for building filter widgets."""
+        table = database.survey_responses
+        column = table.c[field] if field in self.COLUMN_FIELDS else table.c.attributes[field].as_string()
+        with self.engine.connect() as conn:
+            return sorted(value for value in conn.execute(select(column).distinct()).scalars() if value is not None)
+
+    def _search_params(self, selector):
+        """Search parameters restricted to `selector`, carrying over the index's nprobe/efSearch."""
+        base = _base_index(self.index)
+        if isinstance(base, faiss.IndexIVF):
+            return faiss.SearchParametersIVF(sel=selector, nprobe=base.nprobe)
+        if isinstance(base, faiss.IndexHNSW):
+            return faiss.SearchParametersHNSW(sel=selector, efSearch=base.hnsw.efSearch)
+        return faiss.SearchParameters(sel=selector)
+
+    def search(self, query_vector, k=3, filters=None):
+        """
+        Finds the `k` responses nearest to `query_vector`, optionally restricted to
+        responses matching `filters` (e.g. `{"sentiment_label": "Negative", "PESEX": "2"}`).
+        Returns a list of dicts with the response id, text, distance, sentiment and attributes.
+        """
+        return self.search_batch([query_vector], k=k, filters=filters)[0]
+
+    def search_batch(self, query_vectors, k=3, filters=None):
+        """
+        Runs `search` for many query vectors at once: a single FAISS search over the
+        query matrix and a single database lookup for all hits.
+        Returns one list of documents per query vector, in order.
+        """
+        self.compact()
+        if self.index is None or self.index.ntotal == 0 or not len(query_vectors):
+            return [[] for _ in query_vectors]
+        queries = np.ascontiguousarray(query_vectors, dtype='float32')
+        if filters:
+            allowed = self.matching_ids(filters)
+            if not len(allowed):
+                return [[] for _ in query_vectors]
+            distances, ids = self.index.search(queries, k, params=self._search_params(faiss.IDSelectorBatch(allowed)))
+        else:
+            distances, ids = self.index.search(queries, k)
+        hits = [
+            [(int(response_id), float(distance)) for response_id, distance in zip(row_ids, row_distances) if response_id != -1]
+            for row_ids, row_distances in zip(ids, distances)
+        ]
+        documents = {
+            document["response_id"]: document
+            for document in self.get_documents([(response_id, None) for response_id in {hit[0] for row in hits for hit in row}])
+        }
+        return [
+            [dict(documents[response_id], distance=distance) for response_id, distance in row if response_id in documents]
+            for row in hits
+        ]
+
+    def lexical_search(self, query, k=3, filters=None):
+        """
+        Finds the `k` responses that best match the terms of `query` (BM25), optionally
+        restricted to responses matching `filters`. Returns documents like `search`, with
+        the BM25 `score` and no distance.
+        """
+        allowed = self.matching_ids(filters) if filters else None
+        matches = self.lexical.search(query, k=k, allowed_ids=allowed)
+        # `get_documents` skips ids without a stored row, so scores are matched by id, not position.
+        scores = dict(matches)
+        documents = self.get_documents([(response_id, None) for response_id, _ in matches])
+        for document in documents:
+            document["score"] = scores[document["response_id"]]
+        return documents
+
+    def hybrid_search(self, query, query_vector, k=3, filters=None, candidates=None, reranker=None):
+        """
+        Combines vector search with BM25 search, so exact terms such as tower ids,
+        carrier names and outage codes are found even when the embedding misses them.
+
+        The top `candidates` of each search are fused with reciprocal rank fusion. Plain
+        fusion lets responses that merely share common words outrank the one that contains
+        an id from the query, so when the query has identifier-like terms (see `exact_terms`),
+        the candidates containing all of them come first, in fused order. With a
+        `reranker` (a cross-encoder model name, see `reranker.rerank`) the fused candidates
+        are then reordered by relevance to `query`. Returns the best `k` documents like
+        `search`, with the fused `score`; `distance` is None for lexical-only matches.
+        """
+        return self.hybrid_search_batch([query], [query_vector], k, filters, candidates, reranker)[0]
+
+    def hybrid_search_batch(self, queries, query_vectors, k=3, filters=None, candidates=None, reranker=None):
+        """
+        Runs `hybrid_search` for many queries, with one batched vector search for all of them.
+        Returns one list of documents per query, in order.
+        """
+        candidates = max(candidates or settings.HYBRID_CANDIDATES, k)
+        dense_results = self.search_batch(query_vectors, k=candidates, filters=filters)
+        allowed = self.matching_ids(filters) if filters else None
+        results = []
+        for query, dense in zip(queries, dense_results):
+            lexical = self.lexical.search(query, k=candidates, allowed_ids=allowed)
+            fused = reciprocal_rank_fusion([
+                [hit["response_id"] for hit in dense], [response_id for response_id, _ in lexical]
+            ])
+            terms = exact_terms(query)
+            if terms:
+                exact = set(self.lexical.containing([response_id for response_id, _ in lexical], terms))
+                fused.sort(key=lambda item: item[0] not in exact)  # stable: fused order within each group
+            documents = {hit["response_id"]: hit for hit in dense}
+            lexical_only = [(response_id, None) for response_id, _ in lexical if response_id not in documents]
+            documents.update({document["response_id"]: document for document in self.get_documents(lexical_only)})
+            hits = [dict(documents[response_id], score=score) for response_id, score in fused if response_id in documents]
+            if reranker:
+                hits = rerank(query, hits, model=reranker)
+            results.append(hits[:k])
+        return results
+
+    def get_documents(self, hits):
+        """Resolves `(response_id, distance)` pairs to documents, keeping their order."""
+        if not hits:
+            return []
+        table = database.survey_responses
+        stmt = select(table.c.response_id, table.c.processed_text, table.c.sentiment_label, table.c.attributes).where(
+            table.c.response_id.in_([response_id for response_id, _ in hits])
+        )
+        with self.engine.connect() as conn:
+            rows = {row.response_id: row for row in conn.execute(stmt)}
+        documents = []
+        for response_id, distance in hits:
+            row = rows.get(response_id)
+            if row is None:
+                continue
+            documents.append({
+                "response_id": response_id,
+                "text": row.processed_text,
+                "distance": distance,
+                "sentiment_label": row.sentiment_label,
+                "attributes": row.attributes or {},
+            })
+        return documents
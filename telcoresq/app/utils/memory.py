@@ -0,0 +1,27 @@
+import sys
+import numpy as np
+import pandas as pd
+
+def memory_usage(value):
+    """Approximate memory held by `value` in bytes, counting DataFrame and array contents."""
+    if isinstance(value, (pd.DataFrame, pd.Series, pd.Index)):
+        usage = value.memory_usage(deep=True)
+        return int(usage.sum() if isinstance(usage, pd.Series) else usage)
+    if isinstance(value, np.ndarray):
+        return int(value.nbytes)
+    if isinstance(value, dict):
+        return sys.getsizeof(value) + sum(memory_usage(key) + memory_usage(item) for key, item in value.items())
+    if isinstance(value, (list, tuple, set)):
+        return sys.getsizeof(value) + sum(memory_usage(item) for item in value)
+    return sys.getsizeof(value)
+
+def session_memory(state):
+    """Memory held by each entry of a session state mapping, largest first, as {key: bytes}."""
+    usage = {key: memory_usage(state[key]) for key in list(state.keys())}
+    return dict(sorted(usage.items(), key=lambda item: -item[1]))
+
+def format_bytes(size):
+    for unit in ("B", "KB", "MB", "GB"):
+        if size < 1024 or unit == "GB":
+            return f"{size:.0f} {unit}" if unit == "B" else f"{size:.1f} {unit}"
+        size /= 1024
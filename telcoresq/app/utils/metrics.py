@@ -0,0 +1,178 @@
+import atexit
+import contextlib
+import contextvars
+import functools
+import json
+import os
+import threading
+import time
+from collections import deque
+import pandas as pd
+from telcoresq.config import settings
+from telcoresq.app.utils.retry import call_with_retry
+
+_current_stage = contextvars.ContextVar("metrics_stage", default="other")
+
+@contextlib.contextmanager
+def stage(name):
+    """Attributes the calls made inside the block (and in threads started via `run_in_context`) to a pipeline stage."""
+    token = _current_stage.set(name)
+    try:
+        yield
+    finally:
+        _current_stage.reset(token)
+
+def current_stage():
+    return _current_stage.get()
+
+def run_in_context(executor, fn, *args):
+    """Submits `fn` to `executor` with the caller's stage, so worker threads are attributed correctly."""
+    return executor.submit(contextvars.copy_context().run, fn, *args)
+
+def estimate_cost(model, input_tokens, output_tokens=0):
+    """Estimated cost in USD from the per-million-token prices in `settings.MODEL_PRICES`."""
+    prices = settings.MODEL_PRICES.get(model)
+    if prices is None:
+        # Dated snapshots ("gpt-4o-2024-08-06") are priced like their base model.
+        prices = next((price for name, price in sorted(settings.MODEL_PRICES.items(), key=lambda item: -len(item[0]))
+                       if model.startswith(name)), (0.0, 0.0))
+    return (input_tokens * prices[0] + output_tokens * prices[1]) / 1_000_000
+
+_TOTAL_FIELDS = (
+    "calls", "errors", "retries", "input_tokens", "output_tokens", "cost_usd", "seconds", "cache_hits", "cache_misses"
+)
+
+class MetricsRecorder:
+    """
+    Records every embedding and chat call (latency, tokens, retries, errors and estimated
+    cost) and cache lookups, aggregated per (stage, kind, model).
+
+    Recording is a lock and a few additions per call. Raw events are buffered and
+    appended to a JSON Lines file at `path` in batches and at exit. The p95 latency is
+    taken over the last `latency_samples` calls of each (stage, kind, model), so memory
+    stays bounded in long-running sessions.
+    """
+
+    def __init__(self, path=None, flush_every=500, latency_samples=None):
+        self.path = path if path is not None else settings.METRICS_PATH
+        self.flush_every = flush_every
+        self.latency_samples = latency_samples or settings.METRICS_LATENCY_SAMPLES
+        self._lock = threading.Lock()
+        self._totals = {}
+        self._durations = {}
+        self._buffer = []
+
+    def _totals_for(self, key):
+        totals = self._totals.get(key)
+        if totals is None:
+            totals = self._totals[key] = dict.fromkeys(_TOTAL_FIELDS, 0)
+        return totals
+
+    def record_call(self, kind, model, seconds, input_tokens=0, output_tokens=0, retries=0, error=None):
+        """Records one API or model call of `kind` ("chat", "embedding", ...)."""
+        cost = estimate_cost(model, input_tokens, output_tokens)
+        key = (current_stage(), kind, model)
+        with self._lock:
+            totals = self._totals_for(key)
+            totals["calls"] += 1
+            totals["errors"] += error is not None
+            totals["retries"] += retries
+            totals["input_tokens"] += input_tokens
+            totals["output_tokens"] += output_tokens
+            totals["cost_usd"] += cost
+            totals["seconds"] += seconds
+            durations = self._durations.get(key)
+            if durations is None:
+                durations = self._durations[key] = deque(maxlen=self.latency_samples)
+            durations.append(seconds)
+            self._buffer.append({
+                "time": time.time(), "stage": key[0], "kind": kind, "model": model, "seconds": round(seconds, 4),
+                "input_tokens": input_tokens, "output_tokens": output_tokens, "retries": retries,
+                "cost_usd": cost, "error": None if error is None else f"{type(error).__name__}: {error}",
+            })
+            flush = len(self._buffer) >= self.flush_every
+        if flush:
+            self.flush()
+
+    def record_cache(self, kind, model, hits=0, misses=0):
+        """Records cache lookups of `kind` ("embedding", "llm", "query") in the current stage."""
+        if not hits and not misses:
+            return
+        key = (current_stage(), kind, model)
+        with self._lock:
+            totals = self._totals_for(key)
+            totals["cache_hits"] += hits
+            totals["cache_misses"] += misses
+
+    def summary(self):
+        """Returns the aggregates as a DataFrame with one row per stage, kind and model."""
+        with self._lock:
+            rows = []
+            for (stage_name, kind, model), totals in self._totals.items():
+                durations = list(self._durations.get((stage_name, kind, model), ()))
+                rows.append({
+                    "stage": stage_name, "kind": kind, "model": model, **totals,
+                    "mean_seconds": totals["seconds"] / totals["calls"] if totals["calls"] else 0.0,
+                    "p95_seconds": float(pd.Series(durations).quantile(0.95)) if durations else 0.0,
+                })
+        columns = ["stage", "kind", "model", *_TOTAL_FIELDS, "mean_seconds", "p95_seconds"]
+        return pd.DataFrame(rows, columns=columns).sort_values(["stage", "kind", "model"], ignore_index=True)
+
+    def flush(self):
+        """Appends the buffered events to the metrics file."""
+        with self._lock:
+            events, self._buffer = self._buffer, []
+        if not events or not self.path:
+            return
+        if os.path.dirname(self.path):
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        with open(self.path, "a") as f:
+            f.writelines(json.dumps(event) + "\n" for event in events)
+
+    def reset(self):
+        """Clears the aggregates (buffered events are written first)."""
+        self.flush()
+        with self._lock:
+            self._totals.clear()
+            self._durations.clear()
+
+@functools.lru_cache(maxsize=None)
+def get_metrics():
+    """Returns the process-wide metrics recorder."""
+    recorder = MetricsRecorder()
+    atexit.register(recorder.flush)
+    return recorder
+
+def model_name(llm):
+    """Name to record for a chat model: its model name, or the class name for other LangChain models."""
+    return getattr(llm, "model_name", None) or type(llm).__name__
+
+def _usage(result):
+    """Token usage of a LangChain message or an OpenAI response, as (input, output), or None."""
+    usage = getattr(result, "usage_metadata", None)
+    if usage:
+        return usage.get("input_tokens", 0), usage.get("output_tokens", 0)
+    usage = getattr(result, "usage", None)
+    if usage is not None:
+        return getattr(usage, "prompt_tokens", 0), getattr(usage, "completion_tokens", 0) or 0
+    usage = (getattr(result, "response_metadata", None) or {}).get("token_usage")
+    if usage:
+        return usage.get("prompt_tokens", 0), usage.get("completion_tokens", 0)
+    return None
+
+def tracked_call(kind, model, fn, *args, usage_of=None, **kwargs):
+    """
+    Calls `fn` through `call_with_retry` and records the call: latency, retries, errors
+    and the token usage reported in the result (`usage_of(result)` can extract it from
+    wrapped results). Exceptions are recorded and re-raised.
+    """
+    retries = []
+    started = time.perf_counter()
+    try:
+        result = call_with_retry(fn, *args, on_retry=retries.append, **kwargs)
+    except Exception as e:
+        get_metrics().record_call(kind, model, time.perf_counter() - started, retries=len(retries), error=e)
+        raise
+    usage = _usage(usage_of(result) if usage_of else result) or (0, 0)
+    get_metrics().record_call(kind, model, time.perf_counter() - started, usage[0], usage[1], retries=len(retries))
+    return result
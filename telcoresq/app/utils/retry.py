@@ -0,0 +1,27 @@
+import random
+import time
+import openai
+from telcoresq.config import settings
+
+def is_retryable_error(error):
+    """Whether an API error is transient (rate limit, timeout or dropped connection)."""
+    if isinstance(error, (openai.RateLimitError, openai.APITimeoutError, openai.APIConnectionError)):
+        return True
+    return getattr(error, "status_code", None) == 429
+
+def call_with_retry(fn, *args, max_retries=None, base_delay=None, on_retry=None, **kwargs):
+    """
+    Calls `fn`, retrying transient API errors with exponential backoff and jitter.
+    `on_retry(error)` is called before each retry.
+    """
+    max_retries = settings.LLM_MAX_RETRIES if max_retries is None else max_retries
+    base_delay = settings.LLM_RETRY_BASE_DELAY if base_delay is None else base_delay
+    for attempt in range(max_retries + 1):
+        try:
+            return fn(*args, **kwargs)
+        except Exception as e:
+            if attempt >= max_retries or not is_retryable_error(e):
+                raise
+            if on_retry is not None:
+                on_retry(e)
+            time.sleep(base_delay * (2 ** attempt) + random.uniform(0, base_delay))
@@ -0,0 +1,61 @@
+import functools
+
+try:
+    import tiktoken
+except ImportError:  # pragma: no cover - tiktoken ships with langchain-openai
+    tiktoken = None
+
+# Rough characters-per-token ratio used when no tokenizer is available
+_CHARS_PER_TOKEN = 4
+
+@functools.lru_cache(maxsize=None)
+def _get_encoding(model):
+    """Returns the tiktoken encoding for `model`, or None if it cannot be loaded."""
+    if tiktoken is None:
+        return None
+    try:
+        return tiktoken.encoding_for_model(model)
+    except KeyError:
+        return tiktoken.get_encoding("cl100k_base")
+    except Exception:
+        # The encoding files are downloaded on first use, which fails offline.
+        return None
+
+def count_tokens(text, model="cl100k_base"):
+    """
+    Counts the tokens in `text` for `model`.
+    Falls back to a character-based estimate if no tokenizer is available.
+    """
+    encoding = _get_encoding(model)
+    if encoding is None:
+        return len(text) // _CHARS_PER_TOKEN + 1
+    return len(encoding.encode(text, disallowed_special=()))
+
+def truncate_to_tokens(text, max_tokens, model="cl100k_base"):
+    """Truncates `text` to at most `max_tokens` tokens."""
+    encoding = _get_encoding(model)
+    if encoding is None:
+        return text[:max_tokens * _CHARS_PER_TOKEN]
+    tokens = encoding.encode(text, disallowed_special=())
+    if len(tokens) <= max_tokens:
+        return text
+    return encoding.decode(tokens[:max_tokens])
+
+def pack_by_tokens(token_counts, max_tokens, max_items=None):
+    """
+    Groups consecutive items into batches whose token total stays within `max_tokens`
+    and whose length stays within `max_items`.
+    Returns a list of batches, each a list of item positions. An item larger than
+    `max_tokens` on its own gets a batch to itself.
+    """
+    batches = []
+    batch, batch_tokens = [], 0
+    for position, tokens in enumerate(token_counts):
+        if batch and (batch_tokens + tokens > max_tokens or (max_items and len(batch) >= max_items)):
+            batches.append(batch)
+            batch, batch_tokens = [], 0
+        batch.append(position)
+        batch_tokens += tokens
+    if batch:
+        batches.append(batch)
+    return batches
@@ -0,0 +1,79 @@
+"""
+Headless batch processing for large survey files.
+
+    python -m telcoresq.cli run data/raw/survey.csv --text-column response
+    python -m telcoresq.cli resume <job_id>
+    python -m telcoresq.cli status [<job_id>]
+
+Results are written to the database and vector index configured in settings, so the
+Streamlit app can load them from the Dashboard once the job has finished.
+"""
+import argparse
+import os
+import sys
+from telcoresq.config import settings
+from telcoresq.app.services import database
+from telcoresq.app.services.pipeline import JOB_STAGES, create_job, get_job, list_jobs, run_job
+from telcoresq.app.utils.metrics import get_metrics
+
+def _print_job(job):
+    print(f"{job['job_id']}  {job['status']:<8}  last stage: {job['stage'] or '-'}  {job['source_path']}")
+    if job['error']:
+        print(f"    error: {job['error']}")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="telcoresq", description="Run TelcoResQ processing jobs without the UI.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = subparsers.add_parser("run", help="Process a CSV, JSON, JSON Lines or Parquet file.")
+    run_parser.add_argument("file", help="Path to the survey file.")
+    run_parser.add_argument("--text-column", required=True, help="Column holding the free-text responses.")
+    run_parser.add_argument("--id-column", help="Column holding stable response ids (optional).")
+    run_parser.add_argument(
+        "--stages", nargs="+", choices=JOB_STAGES, default=list(JOB_STAGES),
+        help="Stages to run (default: all)."
+    )
+
+    resume_parser = subparsers.add_parser("resume", help="Continue a failed, interrupted or partial job.")
+    resume_parser.add_argument("job_id")
+    resume_parser.add_argument("--stages", nargs="+", choices=JOB_STAGES, default=list(JOB_STAGES))
+
+    status_parser = subparsers.add_parser("status", help="Show one job, or list all jobs.")
+    status_parser.add_argument("job_id", nargs="?")
+
+    args = parser.parse_args(argv)
+    engine = database.get_engine(settings.DATABASE_URL)
+    database.create_tables(engine)
+
+    if args.command == "status":
+        jobs = [get_job(engine, args.job_id)] if args.job_id else list_jobs(engine)
+        if args.job_id and jobs[0] is None:
+            print(f"Job '{args.job_id}' not found.", file=sys.stderr)
+            return 1
+        for job in jobs:
+            _print_job(job)
+        return 0
+
+    if args.command == "run":
+        if not os.path.exists(args.file):
+            print(f"File '{args.file}' not found.", file=sys.stderr)
+            return 1
+        job_id = create_job(engine, os.path.abspath(args.file), args.text_column, args.id_column)
+        print(f"Created job {job_id}")
+    else:
+        job_id = args.job_id
+
+    try:
+        job = run_job(job_id, engine=engine, stages=args.stages)
+    except Exception as e:
+        print(f"Job {job_id} failed: {e}. Run `python -m telcoresq.cli resume {job_id}` to continue.", file=sys.stderr)
+        return 1
+    _print_job(job)
+    summary = get_metrics().summary()
+    if not summary.empty:
+        print(summary[["stage", "kind", "model", "calls", "errors", "retries", "input_tokens", "output_tokens",
+                       "cost_usd", "seconds", "cache_hits"]].to_string(index=False))
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,36 +1,65 @@
 # Prompts for TelcoResQ
 
-# Example prompt for theme extraction
-THEME_EXTRACTION_PROMPT = """
-Analyze the following survey responses about telecom network resilience and identify the main themes.
-For each theme, provide a brief description and a representative quote from the responses.
+# Example prompt for summary generation
+SUMMARY_GENERATION_PROMPT = """
+Summarize the key insights from the following survey responses regarding telecom network resilience.
+The summary should be about 100 words and highlight the most critical issues and suggestions.
 
 Survey responses:
 ---
 {responses}
 ---
 
-Themes:
+Reply with a JSON object of the form {{"summary": "<summary>"}}.
 """
 
-# Example prompt for sentiment analysis
-SENTIMENT_ANALYSIS_PROMPT = """
-Classify the sentiment of the following survey response as positive, negative, or neutral.
-Provide a one-sentence justification for your classification.
+# Prompt for classifying many responses in a single call
+BATCH_SENTIMENT_ANALYSIS_PROMPT = """
+Classify the sentiment of each of the following numbered survey responses as positive, negative, or neutral.
+Also give a sentiment score from -1 (very negative) to 1 (very positive) and a one-sentence justification.
 
-Survey response:
+Survey responses:
 ---
-{response}
+{responses}
 ---
 
-Sentiment:
-Justification:
+Reply with a JSON object with one entry per response, in the same order:
+{{"results": [{{"number": <number>, "sentiment": "<positive|negative|neutral>", "score": <score>, "justification": "<justification>"}}]}}
 """
 
-# Example prompt for summary generation
-SUMMARY_GENERATION_PROMPT = """
-Summarize the key insights from the following survey responses regarding telecom network resilience.
-The summary should be about 100 words and highlight the most critical issues and suggestions.
+# Prompt for naming the theme of one cluster of similar responses
+CLUSTER_THEME_PROMPT = """
+The following survey responses about telecom network resilience were grouped together because they are similar.
+Name the single theme they share and describe it in one sentence.
+
+Survey responses:
+---
+{responses}
+---
+
+Reply with a JSON object of the form {{"theme": "<short theme name>", "description": "<one-sentence description>"}}.
+"""
+
+# Prompt for merging the cluster themes into a final list
+THEME_MERGE_PROMPT = """
+The following candidate themes were extracted from clusters of survey responses about telecom network resilience.
+Each line gives the cluster number, the number of responses in the cluster, the theme name and its description.
+Merge candidates that describe the same theme and return the final list of distinct themes.
+Every cluster number must appear in exactly one final theme.
+
+Candidate themes:
+---
+{themes}
+---
+
+Reply with a JSON object listing the final themes:
+{{"themes": [{{"name": "<theme name>", "clusters": [<cluster numbers>], "description": "<one-sentence description>"}}]}}
+"""
+
+# Prompt for summarizing one chunk of responses (map step)
+CHUNK_SUMMARY_PROMPT = """
+Summarize the key issues, experiences and suggestions in the following survey responses regarding telecom network resilience.
+Use a short bullet list and mention how common each point is.
 
 Survey responses:
 ---
@@ -39,3 +68,42 @@ Survey responses:
 
 Summary:
 """
+
+# Prompt for combining partial summaries into a shorter partial summary (intermediate reduce step)
+SUMMARY_COMBINE_PROMPT = """
+The following are summaries of different groups of survey responses regarding telecom network resilience.
+Combine them into a single short bullet list of the key issues and suggestions, keeping track of how common each point is.
+
+Partial summaries:
+---
+{summaries}
+---
+
+Combined summary:
+"""
+
+# Prompt for the final executive summary (final reduce step)
+SUMMARY_REDUCE_PROMPT = """
+The following are summaries of different groups of survey responses regarding telecom network resilience.
+Write an executive summary of about 100 words that highlights the most critical issues and suggestions across all groups.
+
+Partial summaries:
+---
+{summaries}
+---
+
+Reply with a JSON object of the form {{"summary": "<summary>"}}.
+"""
+
+# Prompt for answering a question from retrieved responses (Query page)
+QUERY_ANSWER_PROMPT = """
+Answer the following query based on the provided context of survey responses.
+If the context does not contain the answer, say so.
+
+Query: {query}
+
+Context:
+{context}
+
+Answer:
+"""
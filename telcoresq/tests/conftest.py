@@ -0,0 +1,23 @@
+import os
+import zlib
+import numpy as np
+import pytest
+
+# Tests must not append to the app's metrics file or wait between retries.
+os.environ["METRICS_PATH"] = ""
+os.environ["LLM_RETRY_BASE_DELAY"] = "0"
+
+@pytest.fixture
+def embed():
+    """Stand-in for an embedding model: a fixed random 8-dimensional vector per text."""
+    def embed_texts(texts):
+        return [np.random.default_rng(zlib.crc32(text.encode())).normal(size=8).astype(np.float32) for text in texts]
+    return embed_texts
+
+@pytest.fixture
+def store(tmp_path):
+    """An empty `SurveyVectorStore` with its database and index under `tmp_path`."""
+    from telcoresq.app.services import database
+    from telcoresq.app.services.vector_store import SurveyVectorStore
+    engine = database.get_engine(f"sqlite:///{tmp_path / 'telcoresq.db'}")
+    return SurveyVectorStore(engine=engine, index_path=str(tmp_path / "index" / "faiss_index"))
@@ -0,0 +1,55 @@
+import numpy as np
+import pandas as pd
+from telcoresq.app.services.aggregates import build_aggregates, filter_mask, load_aggregates, rollup
+
+_RESPONSES = [
+    # text, attributes, sentiment, score
+    ("slow repairs", {"PRTAGE": "23", "PESEX": "1"}, "Negative", -0.5),
+    ("no signal", {"PRTAGE": "31", "PESEX": "2.0"}, "Negative", -0.9),
+    ("fast internet", {"PRTAGE": "24", "PESEX": "2"}, "Positive", 0.8),
+    ("fine i guess", {"PRTAGE": "70", "PESEX": "1"}, "Neutral", 0.0),
+    ("billing mixup", {"PESEX": "nan"}, "Negative", -0.4),
+    ("great support", {"PRTAGE": "33", "PESEX": "1"}, "Positive", None),
+]
+
+def _cube(store, embed):
+    ids = list(range(1, len(_RESPONSES) + 1))
+    store.sync(ids, [text for text, _, _, _ in _RESPONSES], embed,
+               attributes=[attributes for _, attributes, _, _ in _RESPONSES])
+    store.update_sentiments(ids, [label for _, _, label, _ in _RESPONSES], scores=[score for *_, score in _RESPONSES])
+    build_aggregates(store, dimensions=["PRTAGE", "PESEX"])
+    return load_aggregates(store)
+
+def test_aggregates_bands_and_labels_the_dimensions(store, embed):
+    cells = _cube(store, embed)
+
+    assert cells["responses"].sum() == len(_RESPONSES)
+    assert list(cells["PRTAGE"].cat.categories) == ["15-24", "25-34", "65-74", "N/A"]
+    assert list(cells["PESEX"].cat.categories) == ["Male", "Female", "N/A"]  # "2.0" and "2" are one code
+    assert set(cells["theme"]) == {"Unassigned"}
+
+def test_rollup_matches_a_groupby_of_the_responses(store, embed):
+    cells = _cube(store, embed)
+
+    by_sex = rollup(cells, "PESEX")
+
+    assert by_sex["PESEX"].tolist() == ["Male", "Female", "N/A"]
+    assert by_sex["responses"].tolist() == [3, 2, 1]
+    # Unscored responses are counted but left out of the mean.
+    assert np.allclose(by_sex["mean_score"], [-0.25, -0.05, -0.4])
+
+    by_sentiment_and_age = rollup(cells, ["sentiment_label", "PRTAGE"]).set_index(["sentiment_label", "PRTAGE"])
+    expected = pd.Series({("Negative", "15-24"): 1, ("Negative", "25-34"): 1, ("Negative", "N/A"): 1,
+                          ("Neutral", "65-74"): 1, ("Positive", "15-24"): 1, ("Positive", "25-34"): 1})
+    assert by_sentiment_and_age["responses"].to_dict() == expected.to_dict()
+    assert np.isnan(by_sentiment_and_age.loc[("Positive", "25-34"), "mean_score"])
+
+def test_filter_mask_selects_the_cells_of_every_filter(store, embed):
+    cells = _cube(store, embed)
+
+    mask = filter_mask(cells, {"sentiment_label": ["Negative", "Mixed"], "PESEX": ["Male", "Female"], "PRTAGE": []})
+    by_sex = rollup(cells, "PESEX", mask=mask)
+
+    assert by_sex["PESEX"].tolist() == ["Male", "Female"] and by_sex["responses"].tolist() == [1, 1]
+    assert filter_mask(cells, {"PESEX": ["Unknown"]}).sum() == 0
+    assert filter_mask(cells, {}).all()
@@ -0,0 +1,297 @@
+import json
+from typing import Optional
+import numpy as np
+import pytest
+from langchain_core.language_models.fake_chat_models import FakeListChatModel, GenericFakeChatModel
+from langchain_core.messages import AIMessage
+from telcoresq.config import prompts, settings
+from telcoresq.app.services import ai_services
+from telcoresq.app.services.ai_services import (
+    analyze_sentiments, answer_queries, extract_themes, get_embeddings, iter_embeddings, stream_answer_from_context,
+    stream_answer_query, summarize_responses
+)
+from telcoresq.app.services.embedding_cache import EmbeddingCache
+from telcoresq.app.services.llm_cache import LLMResultCache
+from telcoresq.app.services.query_cache import SemanticQueryCache
+from telcoresq.app.utils.tokens import count_tokens
+
+def _fake_llm(*replies):
+    # FakeListChatModel starts over after its last reply; the extra reply keeps `llm.i`
+    # equal to the number of calls made.
+    return FakeListChatModel(responses=[*replies, "(unused)"])
+
+def _sentiment_reply(*items):
+    return json.dumps({"results": [
+        {"number": number, "sentiment": sentiment, "score": score, "justification": f"Response {number} is {sentiment}."}
+        for number, sentiment, score in items
+    ]})
+
+class _FakeBackend:
+    """Embeds each text as [its length, number of words] in batches of two, and can fail on one text."""
+    max_concurrency = 1
+
+    def __init__(self, fail_on=None):
+        self.fail_on = fail_on
+        self.embedded = []
+
+    def plan_batches(self, texts):
+        return texts, [list(range(start, min(start + 2, len(texts)))) for start in range(0, len(texts), 2)]
+
+    def embed_batch(self, texts):
+        if self.fail_on in texts:
+            raise ConnectionError("Rate limited.")
+        self.embedded.extend(texts)
+        return [[float(len(text)), float(len(text.split()))] for text in texts]
+
+def test_get_embeddings_returns_one_vector_per_text_in_input_order(tmp_path, monkeypatch):
+    backend = _FakeBackend()
+    monkeypatch.setattr(ai_services, "get_embedding_backend", lambda model, api_key=None: backend)
+    texts = ["slow repairs", "", "no signal at all", "slow  repairs", None, "outage"]
+
+    vectors = get_embeddings(texts, cache=EmbeddingCache(str(tmp_path / "cache.sqlite")))
+
+    assert vectors == [[12.0, 2.0], None, [16.0, 4.0], [12.0, 2.0], None, [6.0, 1.0]]
+    assert backend.embedded == ["slow repairs", "no signal at all", "outage"]  # duplicates embedded once
+
+def test_iter_embeddings_resumes_from_the_batches_cached_before_a_failure(tmp_path):
+    cache = EmbeddingCache(str(tmp_path / "cache.sqlite"))
+    texts = ["a one", "b two", "c three", "d four", "e five"]
+    with pytest.raises(ConnectionError):
+        for _ in iter_embeddings(texts, cache=cache, backend=_FakeBackend(fail_on="c three")):
+            pass
+
+    retry = _FakeBackend()
+    results = list(iter_embeddings(texts, cache=cache, backend=retry))
+
+    assert retry.embedded == ["c three", "d four"]  # the batches that finished before are not sent again
+    assert sorted(position for positions, _ in results for position in positions) == [0, 1, 2, 3, 4]
+
+def test_analyze_sentiments_packs_responses_into_batches_in_row_order():
+    llm = _fake_llm(
+        _sentiment_reply((1, "positive", 0.8), (2, "negative", -0.6)),
+        _sentiment_reply((1, "neutral", 0.0), (2, "positive", 0.4)),
+        _sentiment_reply((1, "negative", -0.9)),
+    )
+    texts = ["great coverage", "dropped calls", "", "it works", "fast repairs", "outage for days"]
+
+    results = analyze_sentiments(texts, llm=llm, batch_size=2, max_concurrency=1)
+
+    assert llm.i == 3  # five non-empty responses in batches of two
+    assert [result and result["label"] for result in results] == [
+        "Positive", "Negative", None, "Neutral", "Positive", "Negative"
+    ]
+    assert results[5]["score"] == -0.9
+
+def test_analyze_sentiments_validates_each_item_and_asks_again_for_invalid_ones():
+    llm = _fake_llm(
+        # Fenced reply; the second item has a score outside [-1, 1] and the third number is not in the batch.
+        "```json\n" + _sentiment_reply((1, "Positive", 0.5), (2, "negative", -5), (7, "neutral", 0.0)) + "\n```",
+        _sentiment_reply((1, "negative", -0.5)),
+    )
+
+    results = analyze_sentiments(["good", "bad"], llm=llm, batch_size=2, max_concurrency=1)
+
+    assert llm.i == 2
+    assert results[0] == {"label": "Positive", "score": 0.5, "justification": "Response 1 is Positive."}
+    assert results[1]["label"] == "Negative"
+
+def test_analyze_sentiments_returns_none_when_the_model_never_replies_validly():
+    llm = _fake_llm(*["I cannot classify these responses."] * 2 * (settings.STRUCTURED_OUTPUT_RETRIES + 1))
+
+    results = analyze_sentiments(["good", "bad", "ok"], llm=llm, batch_size=2, max_concurrency=1)
+
+    assert results == [None, None, None]
+    # Two batches in every round: the first one and each retry.
+    assert llm.i == 2 * (settings.STRUCTURED_OUTPUT_RETRIES + 1)
+
+def _clustered_embeddings():
+    rng = np.random.default_rng(0)
+    return [rng.normal(0, 0.01, 4) + centre for centre in ([5, 0, 0, 0],) * 3 + ([0, 5, 0, 0],) * 2]
+
+def test_extract_themes_names_clusters_and_merges_them():
+    texts = ["outage a", "outage b", "outage c", "billing a", "billing b"]
+    llm = _fake_llm(
+        json.dumps({"theme": "Outages", "description": "Service went down."}),
+        json.dumps({"theme": "Billing", "description": "Charges were wrong."}),
+        json.dumps({"themes": [
+            {"name": "Outages", "clusters": [1], "description": "Service went down."},
+            {"name": "Billing", "clusters": [2], "description": "Charges were wrong."},
+        ]}),
+    )
+
+    themes, assignments = extract_themes(texts, _clustered_embeddings(), n_clusters=2, llm=llm, max_concurrency=1)
+
+    assert llm.i == 3
+    by_name = {theme["name"]: theme for theme in themes}
+    assert by_name["Outages"]["frequency"] == 3 and by_name["Billing"]["frequency"] == 2
+    assert themes[0]["name"] == "Outages"  # sorted by frequency
+    outage_id, billing_id = by_name["Outages"]["theme_id"], by_name["Billing"]["theme_id"]
+    assert assignments == [outage_id] * 3 + [billing_id] * 2
+
+def test_extract_themes_keeps_cluster_themes_when_replies_are_invalid():
+    texts = ["outage a", "outage b", "outage c", "billing a", "billing b", None]
+    llm = _fake_llm(*["not json"] * 2 * (settings.STRUCTURED_OUTPUT_RETRIES + 1), "not json")
+
+    themes, assignments = extract_themes(
+        texts, _clustered_embeddings() + [None], n_clusters=2, llm=llm, max_concurrency=1
+    )
+
+    # Every cluster is asked for in each round, then the merge is asked once.
+    assert llm.i == 2 * (settings.STRUCTURED_OUTPUT_RETRIES + 1) + 1
+    assert sorted(theme["name"] for theme in themes) == ["Cluster 1", "Cluster 2"]
+    assert sorted(theme["frequency"] for theme in themes) == [2, 3]
+    assert assignments[-1] is None and None not in assignments[:-1]
+
+class _StreamingModel(GenericFakeChatModel):
+    """Streams its reply word by word, counting the chunks produced, and can fail part-way."""
+    fail_after: Optional[int] = None
+    streamed: int = 0
+
+    def _stream(self, *args, **kwargs):
+        for chunk in super()._stream(*args, **kwargs):
+            if self.streamed == self.fail_after:
+                raise ConnectionError("The connection was closed mid-stream.")
+            self.streamed += 1
+            yield chunk
+
+_ANSWER = "Outages hit rural areas hardest."
+
+def _streaming_model(fail_after=None):
+    return _StreamingModel(messages=iter([AIMessage(content=_ANSWER)] * 2), fail_after=fail_after)
+
+class _FakeStore:
+    index, index_path, version = object(), "memory", 1
+
+    def __init__(self, hits):
+        self.hits = hits
+        self.searches = 0
+        self.batches = 0
+
+    def search(self, query_vector, k=3, filters=None):
+        self.searches += 1
+        return self.hits[:k]
+
+    def search_batch(self, query_vectors, k=3, filters=None):
+        self.batches += 1
+        return [self.search(query_vector, k, filters) for query_vector in query_vectors]
+
+def test_stream_answer_from_context_yields_chunks_as_the_model_produces_them():
+    llm = _streaming_model()
+    chunks = stream_answer_from_context("Where were outages worst?", ["Rural towns lost service."], llm=llm)
+
+    first = next(chunks)
+    assert first == "Outages" and llm.streamed == 1  # nothing is read ahead of the consumer
+    rest = list(chunks)
+    assert len(rest) > 1 and first + "".join(rest) == _ANSWER
+
+def test_stream_answer_from_context_ends_with_an_error_message_on_a_mid_stream_failure():
+    chunks = list(stream_answer_from_context("Where were outages worst?", ["Rural towns lost service."],
+                                             llm=_streaming_model(fail_after=3)))
+
+    assert chunks == ["Outages", " ", "hit", ai_services._ANSWER_ERROR]
+
+def test_stream_answer_query_assembles_and_caches_the_streamed_answer(monkeypatch):
+    monkeypatch.setattr(ai_services, "get_embeddings", lambda texts, **kwargs: [np.ones(4, dtype=np.float32)] * len(texts))
+    store = _FakeStore([{"response_id": 1, "text": "Rural towns lost service.", "distance": 0.1}])
+    cache, llm = SemanticQueryCache(), _streaming_model()
+
+    result, chunks = stream_answer_query("Where were outages worst?", store, llm=llm, cache=cache, search_mode="dense")
+    assert result["answer"] is None and result["hits"] == store.hits
+    parts = list(chunks)
+    assert len(parts) > 1 and result["answer"] == "".join(parts) == _ANSWER
+    assert result["retrieval_seconds"] <= result["first_token_seconds"] <= result["seconds"]
+
+    cached, cached_chunks = stream_answer_query("Where were outages worst?", store, llm=llm, cache=cache, search_mode="dense")
+    assert "".join(cached_chunks) == _ANSWER and cached["match"] == "exact"
+    assert store.searches == 1 and llm.streamed == len(parts)
+
+def test_answers_that_fail_part_way_are_not_cached(monkeypatch):
+    monkeypatch.setattr(ai_services, "get_embeddings", lambda texts, **kwargs: [np.ones(4, dtype=np.float32)] * len(texts))
+    store = _FakeStore([{"response_id": 1, "text": "Rural towns lost service.", "distance": 0.1}])
+    cache = SemanticQueryCache()
+
+    result, chunks = stream_answer_query("Where were outages worst?", store, llm=_streaming_model(fail_after=3),
+                                         cache=cache, search_mode="dense")
+    assert "".join(chunks) == "Outages hit" + ai_services._ANSWER_ERROR
+    assert isinstance(result["error"], ConnectionError)
+
+    answers = answer_queries(["Where were outages worst?"], store, llm=_streaming_model(fail_after=3), cache=cache,
+                             search_mode="dense", max_concurrency=1)
+    assert answers["answer"][0] == "Outages hit" + ai_services._ANSWER_ERROR and answers["cache"][0] == "miss"
+    assert cache.stats()["entries"] == 0
+
+def test_answer_queries_embeds_and_searches_all_questions_in_one_batch(monkeypatch):
+    embedded = []
+
+    def fake_embeddings(texts, **kwargs):
+        embedded.append(list(texts))
+        return [np.eye(4, dtype=np.float32)[position] for position, _ in enumerate(texts)]
+
+    monkeypatch.setattr(ai_services, "get_embeddings", fake_embeddings)
+    store = _FakeStore([{"response_id": 1, "text": "Rural towns lost service.", "distance": 0.1}])
+    cache, llm = SemanticQueryCache(), FakeListChatModel(responses=[_ANSWER])
+    questions = ["Where were outages worst?", "What about billing?", "Was support helpful?"]
+
+    answers = answer_queries(questions, store, llm=llm, cache=cache, search_mode="dense", max_concurrency=2)
+
+    assert embedded == [questions] and store.batches == 1 and store.searches == 3
+    assert answers["question"].tolist() == questions
+    assert answers["answer"].tolist() == [_ANSWER] * 3 and answers["cache"].tolist() == ["miss"] * 3
+    assert answers["response_ids"].tolist() == [[1]] * 3
+
+    again = answer_queries(questions, store, llm=llm, cache=cache, search_mode="dense", max_concurrency=2)
+
+    assert again["cache"].tolist() == ["exact"] * 3 and again["answer"].tolist() == [_ANSWER] * 3
+    assert store.batches == 1 and len(embedded) == 2  # cached questions are embedded but not searched again
+
+class _SummaryModel(FakeListChatModel):
+    """Records its prompts; replies to final summary prompts with JSON and to the others with `reply`."""
+    responses: list = []
+    reply: str = "Outages were common."
+    prompts: list = []
+
+    def _call(self, messages, stop=None, run_manager=None, **kwargs):
+        prompt = messages[-1].content
+        self.prompts.append(prompt)
+        if "JSON object" in prompt:
+            return json.dumps({"summary": "Outages dominate the responses."})
+        return self.reply
+
+def test_summarize_responses_keeps_every_prompt_within_the_token_budget(tmp_path):
+    budget = 60
+    llm = _SummaryModel(reply=" ".join(["outage"] * 200))  # every partial summary is far over the budget
+    texts = [f"response {i}: " + " ".join(["signal"] * 20) for i in range(12)]
+
+    summary = summarize_responses(texts, llm=llm, max_chunk_tokens=budget, max_concurrency=1,
+                                  cache=LLMResultCache(str(tmp_path / "llm.sqlite")))
+
+    assert summary == "Outages dominate the responses."
+    overhead = {template: count_tokens(template.format(summaries=""), settings.LLM_MODEL)
+                for template in (prompts.SUMMARY_COMBINE_PROMPT, prompts.SUMMARY_REDUCE_PROMPT)}
+    reduce_prompts = [prompt for prompt in llm.prompts if "Partial summaries" in prompt]
+    assert reduce_prompts and "JSON object" in reduce_prompts[-1]
+    for prompt in reduce_prompts:
+        template = prompts.SUMMARY_REDUCE_PROMPT if "JSON object" in prompt else prompts.SUMMARY_COMBINE_PROMPT
+        assert count_tokens(prompt, settings.LLM_MODEL) - overhead[template] <= budget
+
+def test_summarize_responses_only_recomputes_the_chunks_that_changed(tmp_path):
+    cache = LLMResultCache(str(tmp_path / "llm.sqlite"))
+    texts = [f"response {i}: the signal drops every evening near tower {i}." for i in range(40)]
+
+    def chunk_prompts(llm):
+        return [prompt for prompt in llm.prompts if "Partial summaries" not in prompt]
+
+    first = _SummaryModel()
+    summary = summarize_responses(texts, llm=first, max_chunk_tokens=80, max_concurrency=1, cache=cache)
+    assert len(chunk_prompts(first)) > 3
+
+    rerun = _SummaryModel()
+    assert summarize_responses(texts, llm=rerun, max_chunk_tokens=80, max_concurrency=1, cache=cache) == summary
+    assert rerun.prompts == []
+
+    added = _SummaryModel()
+    new_rows = ["response 40: billing is confusing.", "response 41: support never called back."]
+    summarize_responses(texts + new_rows, llm=added, max_chunk_tokens=80, max_concurrency=1, cache=cache)
+    # Only the last chunk takes the new rows; its summary is unchanged, so the reduce levels are reused too.
+    assert len(chunk_prompts(added)) == len(added.prompts) == 1
+    assert all(row in added.prompts[0] for row in new_rows)
@@ -0,0 +1,59 @@
+import numpy as np
+import pandas as pd
+import pyarrow.parquet as pq
+import pytest
+from convert_dat import convert_dat, load_layout
+
+_LAYOUT = "name,start,end,type\nHRHHID,1,6,str\nPRTAGE,7,9,int\nPESEX,10,11,category\nHEFAMINC,12,14,int\nGTCBSA,15,20,int\n"
+
+_RECORDS = [
+    "A12345 45 1 12  3750",
+    "B00002 82 2 -1 41180",
+    "       17 1    35620",
+    "C9",  # a short line padded with spaces, as in the Census files
+    "D00004  9 2  7 99999",
+]
+
+def _write_dat(path, records, terminator):
+    # The last record has no line terminator.
+    path.write_bytes(terminator.join(record.ljust(20).encode() for record in records))
+
+@pytest.mark.parametrize("terminator", [b"\n", b"\r\n"])
+def test_convert_dat_matches_read_fwf(tmp_path, terminator):
+    (tmp_path / "layout.csv").write_text(_LAYOUT)
+    _write_dat(tmp_path / "survey.dat", _RECORDS, terminator)
+    layout = load_layout(str(tmp_path / "layout.csv"))
+
+    rows, invalid = convert_dat(str(tmp_path / "survey.dat"), layout, str(tmp_path / "survey.parquet"),
+                                chunk_rows=2, workers=1)
+
+    expected = pd.read_fwf(tmp_path / "survey.dat", colspecs=[(start, end) for _, start, end, _ in layout],
+                           names=[name for name, _, _, _ in layout], dtype={"HRHHID": str}, header=None)
+    converted = pd.read_parquet(tmp_path / "survey.parquet")
+    assert rows == len(_RECORDS) and invalid == {}
+    assert pq.ParquetFile(tmp_path / "survey.parquet").num_row_groups == 3
+    assert converted["HRHHID"].fillna("").tolist() == expected["HRHHID"].fillna("").tolist()
+    assert converted["HRHHID"].isna().tolist() == [False, False, True, False, False]
+    for name in ["PRTAGE", "PESEX", "HEFAMINC", "GTCBSA"]:
+        assert np.array_equal(converted[name].astype("Float64").to_numpy(dtype=float, na_value=np.nan),
+                              expected[name].to_numpy(dtype=float), equal_nan=True), name
+    assert str(converted["PESEX"].dtype) == "Int8" and str(converted["GTCBSA"].dtype) == "Int32"
+
+def test_convert_dat_counts_fields_that_are_not_numbers(tmp_path):
+    (tmp_path / "layout.csv").write_text(_LAYOUT)
+    _write_dat(tmp_path / "survey.dat", ["A12345 4X 1 12  3750", "B00002 82 2 -1 41180"], b"\n")
+
+    _, invalid = convert_dat(str(tmp_path / "survey.dat"), load_layout(str(tmp_path / "layout.csv")),
+                             str(tmp_path / "survey.parquet"), workers=1)
+
+    assert invalid == {"PRTAGE": 1}
+    assert pd.read_parquet(tmp_path / "survey.parquet")["PRTAGE"].isna().tolist() == [True, False]
+
+def test_convert_dat_rejects_records_of_mixed_length(tmp_path):
+    (tmp_path / "layout.csv").write_text(_LAYOUT)
+    (tmp_path / "survey.dat").write_bytes(b"A12345 45 1 12  3750\nB00002 82 2 -1 411\nC00003 45 1 12  375000\n")
+
+    with pytest.raises(ValueError, match="Record 2 does not end at byte 21"):
+        convert_dat(str(tmp_path / "survey.dat"), load_layout(str(tmp_path / "layout.csv")),
+                    str(tmp_path / "survey.parquet"), workers=1)
+    assert not (tmp_path / "survey.parquet").exists()
@@ -0,0 +1,30 @@
+import io
+import json
+import pytest
+from telcoresq.app.services import data_processing
+from telcoresq.app.services.data_processing import iter_file_chunks
+
+def _upload(name, text):
+    upload = io.BytesIO(text.encode())
+    upload.name = name
+    return upload
+
+def test_iter_file_chunks_streams_json_arrays():
+    upload = _upload("survey.json", json.dumps([{"response": f"r{i}"} for i in range(5)]))
+    assert [len(chunk) for chunk in iter_file_chunks(upload, chunksize=2)] == [2, 2, 1]
+
+def test_iter_file_chunks_loads_other_json_whole():
+    upload = _upload("survey.json", json.dumps({"response": {"0": "a", "1": "b"}}))
+    assert sum(len(chunk) for chunk in iter_file_chunks(upload, chunksize=1)) == 1
+
+def test_iter_file_chunks_does_not_restart_after_yielding_chunks(monkeypatch):
+    def failing_array(fp):
+        yield from json.load(fp)[:3]
+        raise ValueError("Unexpected end of JSON array.")
+    monkeypatch.setattr(data_processing, "_iter_json_array", failing_array)
+    upload = _upload("survey.json", json.dumps([{"response": f"r{i}"} for i in range(5)]))
+
+    chunks = iter_file_chunks(upload, chunksize=2)
+    assert len(next(chunks)) == 2
+    with pytest.raises(ValueError):
+        next(chunks)
@@ -0,0 +1,63 @@
+import numpy as np
+import pytest
+import sqlalchemy
+from telcoresq.app.services import database
+
+@pytest.fixture
+def engine(tmp_path):
+    engine = database.get_engine(f"sqlite:///{tmp_path / 'telcoresq.db'}")
+    database.create_tables(engine)
+    return engine
+
+@pytest.mark.parametrize("dtype, tolerance", [("float32", 0), ("float16", 1e-3)])
+def test_embeddings_round_trip_through_the_database(engine, dtype, tolerance):
+    vectors = np.random.default_rng(0).normal(size=(250, 8)).astype(np.float32)
+    ids = np.arange(250)[::-1] * 7  # stored out of id order
+    with engine.begin() as conn:
+        database.bulk_upsert_embeddings(conn, ids, vectors, dtype=dtype, batch_size=100)
+        database.bulk_upsert_embeddings(conn, ids[:1], vectors[1:2], dtype=dtype)  # replaces a row
+
+    loaded_ids, matrix = database.load_embedding_matrix(engine, batch_size=64)
+
+    expected = vectors[::-1].copy()
+    expected[-1] = vectors[1]
+    assert loaded_ids.tolist() == sorted(ids.tolist())
+    assert matrix.dtype == np.float32 and np.allclose(matrix, expected, atol=tolerance, rtol=tolerance)
+
+def test_load_embedding_matrix_decodes_each_blob_with_its_own_dtype(engine):
+    vectors = np.arange(12, dtype=np.float32).reshape(4, 3)
+    with engine.begin() as conn:
+        database.bulk_upsert_embeddings(conn, [1, 2], vectors[:2], dtype="float32")
+        database.bulk_upsert_embeddings(conn, [3, 4], vectors[2:], dtype="float16")
+
+    ids, matrix = database.load_embedding_matrix(engine, batch_size=3)  # batches mix both dtypes
+
+    assert ids.tolist() == [1, 2, 3, 4]
+    assert matrix.dtype == np.float32 and np.array_equal(matrix, vectors)
+
+def test_load_embedding_matrix_rejects_vectors_of_different_dimensions(engine):
+    with engine.begin() as conn:
+        database.bulk_upsert_embeddings(conn, [1], np.ones((1, 3)))
+        database.bulk_upsert_embeddings(conn, [2], np.ones((1, 4)))
+
+    with pytest.raises(ValueError, match="one model"):
+        database.load_embedding_matrix(engine)
+
+def test_create_tables_adds_indexes_missing_from_older_tables(engine):
+    with engine.begin() as conn:
+        conn.exec_driver_sql("DROP INDEX ix_survey_responses_sentiment_label")
+        conn.exec_driver_sql("DROP INDEX ix_jobs_status_created_at")
+
+    database.create_tables(engine)
+
+    inspector = sqlalchemy.inspect(engine)
+    assert "ix_survey_responses_sentiment_label" in {index["name"] for index in inspector.get_indexes("survey_responses")}
+    assert "ix_jobs_status_created_at" in {index["name"] for index in inspector.get_indexes("jobs")}
+
+def test_get_engine_shares_one_engine_per_url_in_wal_mode(tmp_path):
+    url = f"sqlite:///{tmp_path / 'telcoresq.db'}"
+    engine = database.get_engine(url)
+
+    assert database.get_engine(url) is engine
+    with engine.connect() as conn:
+        assert conn.exec_driver_sql("PRAGMA journal_mode").scalar() == "wal"
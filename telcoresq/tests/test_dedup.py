@@ -0,0 +1,48 @@
+from types import SimpleNamespace
+import pytest
+from telcoresq.config import settings
+from telcoresq.app.services.dedup import SentimentGroups
+
+def test_exact_matching_is_the_default():
+    assert settings.SENTIMENT_DEDUP == "exact"
+    groups = SentimentGroups()
+    keys = groups.assign(["Service went down!", "service  went down", "Service went down during the storm", ""])
+    assert keys[0] == keys[1] != keys[2] and keys[3] is None
+
+@pytest.mark.parametrize("text, opposite", [
+    ("I am very satisfied with the network during outages", "I am not very satisfied with the network during outages"),
+    ("The connection was stable during the whole storm", "The connection was unstable during the whole storm"),
+    ("My mobile service has been reliable this year", "My mobile service has not been reliable this year"),
+    ("very satisfied", "not very satisfied"),
+    ("stable", "unstable"),
+])
+def test_near_matching_never_groups_opposite_statements(text, opposite):
+    # A low threshold, so the pairs are kept apart by the polarity check, not by their similarity.
+    groups = SentimentGroups(mode="near", threshold=0.5)
+    first, second = groups.assign([text, opposite])
+    assert first != second
+
+def test_near_matching_groups_paraphrases_that_differ_in_stop_words():
+    groups = SentimentGroups(mode="near")
+    first, second = groups.assign(["service went down during storm", "the service went down during the storm"])
+    assert first == second
+
+def test_loading_skips_memberships_that_no_longer_match():
+    rows = [
+        SimpleNamespace(text_key="a", group_key="a", text="The connection was stable", signature=None,
+                        sentiment_label="Positive", sentiment_score=0.6, sentiment_justification="Stable."),
+        # Saved by an older version: a near match of the opposite statement, and one without text.
+        SimpleNamespace(text_key="b", group_key="a", text="The connection was unstable", signature=None,
+                        sentiment_label=None, sentiment_score=None, sentiment_justification=None),
+        SimpleNamespace(text_key="c", group_key="a", text=None, signature=None,
+                        sentiment_label=None, sentiment_score=None, sentiment_justification=None),
+        SimpleNamespace(text_key="d", group_key="a", text="the connection was stable!", signature=None,
+                        sentiment_label=None, sentiment_score=None, sentiment_justification=None),
+    ]
+    near = SentimentGroups(mode="near")
+    near.load_rows(rows)
+    assert near.memberships == {"a": "a", "d": "a"}
+
+    exact = SentimentGroups(mode="exact")
+    exact.load_rows(rows)
+    assert exact.memberships == {"a": "a"}
@@ -0,0 +1,42 @@
+import numpy as np
+import pytest
+from telcoresq.app.services import embedding_backends
+from telcoresq.app.services.embedding_backends import LocalEmbeddingBackend, OpenAIEmbeddingBackend, get_embedding_backend
+
+@pytest.mark.parametrize("model, backend, name", [
+    ("local:all-MiniLM-L6-v2", LocalEmbeddingBackend, "all-MiniLM-L6-v2"),
+    ("sentence-transformers/all-MiniLM-L6-v2", LocalEmbeddingBackend, "sentence-transformers/all-MiniLM-L6-v2"),
+    ("openai:text-embedding-3-small", OpenAIEmbeddingBackend, "text-embedding-3-small"),
+    ("text-embedding-3-small", OpenAIEmbeddingBackend, "text-embedding-3-small"),
+])
+def test_get_embedding_backend_selects_the_backend_by_model_name(model, backend, name):
+    selected = get_embedding_backend(model, api_key="sk-test")
+
+    assert type(selected) is backend and selected.model == name
+
+def test_local_backend_batches_texts_of_similar_length_together():
+    texts = ["a much longer response", "ok", "medium text", "no", "short one"]
+
+    inputs, batches = LocalEmbeddingBackend("all-MiniLM-L6-v2", chunk_size=2).plan_batches(texts)
+
+    assert inputs == texts
+    assert [[texts[position] for position in batch] for batch in batches] == [
+        ["ok", "no"], ["short one", "medium text"], ["a much longer response"]
+    ]
+
+class _FakeSentenceTransformer:
+    def __init__(self):
+        self.calls = []
+
+    def encode(self, texts, batch_size, convert_to_numpy, show_progress_bar):
+        self.calls.append((list(texts), batch_size))
+        return np.array([[len(text), 1.0] for text in texts], dtype=np.float32)
+
+def test_local_backend_encodes_a_chunk_with_the_loaded_model(monkeypatch):
+    model = _FakeSentenceTransformer()
+    monkeypatch.setattr(embedding_backends, "_load_sentence_transformer", lambda name: model)
+
+    vectors = LocalEmbeddingBackend("all-MiniLM-L6-v2", batch_size=16, workers=1).embed_batch(["ok", "outage"])
+
+    assert vectors == [[2.0, 1.0], [6.0, 1.0]]
+    assert model.calls == [(["ok", "outage"], 16)]
@@ -0,0 +1,25 @@
+import itertools
+from telcoresq.app.services import embedding_cache
+from telcoresq.app.services.embedding_cache import EmbeddingCache
+
+def test_cache_counts_hits_and_misses_and_matches_normalized_text(tmp_path):
+    cache = EmbeddingCache(str(tmp_path / "cache.sqlite"))
+    cache.put_many("model-a", ["no signal"], [[1.0, 2.0]])
+
+    found = cache.get_many("model-a", ["no  signal\n", "slow repairs"])
+    assert found == {"no  signal\n": [1.0, 2.0]}
+    assert cache.get_many("model-b", ["no signal"]) == {}  # keyed by model too
+    assert {key: cache.stats()[key] for key in ("hits", "misses", "entries")} == {"hits": 1, "misses": 2, "entries": 1}
+
+def test_cache_evicts_the_least_recently_used_entries_over_its_size_limit(tmp_path, monkeypatch):
+    clock = itertools.count()
+    monkeypatch.setattr(embedding_cache.time, "time", lambda: float(next(clock)))
+    cache = EmbeddingCache(str(tmp_path / "cache.sqlite"), max_bytes=3 * 4 * 4)  # three 4-dimensional vectors
+    for text in ["a", "b", "c"]:
+        cache.put_many("model", [text], [[0.0] * 4])
+    cache.get_many("model", ["a"])  # "b" is now the least recently used
+
+    cache.put_many("model", ["d"], [[0.0] * 4])
+
+    assert sorted(cache.get_many("model", ["a", "b", "c", "d"])) == ["a", "c", "d"]
+    assert cache.stats()["size_bytes"] == 3 * 4 * 4
@@ -0,0 +1,10 @@
+from telcoresq.app.utils.metrics import MetricsRecorder
+
+def test_p95_latency_is_taken_over_the_most_recent_calls():
+    recorder = MetricsRecorder(path="", latency_samples=10)
+    for seconds in [100.0] * 50 + [1.0] * 10:
+        recorder.record_call("chat", "gpt-4", seconds)
+
+    row = recorder.summary().iloc[0]
+    assert row["calls"] == 60 and row["p95_seconds"] == 1.0
+    assert row["mean_seconds"] == (50 * 100.0 + 10 * 1.0) / 60  # totals still cover every call
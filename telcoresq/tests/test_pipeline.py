@@ -0,0 +1,60 @@
+import pandas as pd
+import pytest
+from telcoresq.config import settings
+from telcoresq.app.services import ai_services, pipeline
+from telcoresq.app.services.pipeline import create_job, ingest_stream, run_job, run_sentiment_stage
+from telcoresq.app.services.vector_store import index_type_of
+
+def _write_csv(path, rows, **columns):
+    pd.DataFrame({"response": [f"response {i}" for i in range(rows)], **columns}).to_csv(path, index=False)
+    return path
+
+def test_ingest_stream_chooses_the_index_type_for_the_whole_upload(store, embed, tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "FAISS_FLAT_MAX_VECTORS", 1000)
+    path = _write_csv(tmp_path / "survey.csv", 5000)
+
+    with open(path) as f:
+        ids, totals = ingest_stream(f, "response", store, embed, chunksize=1000)
+
+    assert totals["added"] == 5000 and store.index.ntotal == 5000
+    assert index_type_of(store.index) == "hnsw"
+
+def test_ingest_stream_rejects_ids_repeated_in_a_later_chunk(store, embed, tmp_path):
+    path = _write_csv(tmp_path / "survey.csv", 10, id=[1, 2, 3, 4, 5, 6, 7, 8, 9, 2])
+
+    with open(path) as f, pytest.raises(ValueError, match="unique"):
+        ingest_stream(f, "response", store, embed, id_column="id", chunksize=4)
+    assert sorted(store.stored_ids().tolist()) == [1, 2, 3, 4, 5, 6, 7, 8]  # the first two chunks only
+
+def test_skipped_stages_keep_the_job_unfinished_until_they_run(store, embed, tmp_path, monkeypatch):
+    ran = []
+    monkeypatch.setattr(pipeline, "get_embeddings", lambda texts, **kwargs: embed(texts))
+    monkeypatch.setattr(pipeline, "run_sentiment_stage", lambda *args, **kwargs: ran.append("sentiment") or 0)
+    monkeypatch.setattr(pipeline, "extract_themes", lambda *args, **kwargs: ran.append("themes") or ([], []))
+    monkeypatch.setattr(pipeline, "build_aggregates", lambda *args, **kwargs: ran.append("aggregates") or 0)
+    monkeypatch.setattr(pipeline, "summarize_responses", lambda *args, **kwargs: ran.append("summary") or "Summary.")
+    job_id = create_job(store.engine, str(_write_csv(tmp_path / "survey.csv", 10)), "response")
+
+    job = run_job(job_id, engine=store.engine, store=store, stages=["ingest", "themes"], log=lambda message: None)
+    assert ran == ["themes"]
+    assert job["status"] == "partial" and job["stage"] == "ingest"  # sentiment has not run yet
+
+    job = run_job(job_id, engine=store.engine, store=store, log=lambda message: None)
+    assert ran == ["themes", "sentiment", "aggregates", "summary"]
+    assert job["status"] == "finished" and job["stage"] == "summary"
+
+def test_responses_the_model_could_not_classify_stay_pending(store, embed, monkeypatch):
+    store.sync([1, 2, 3, 4, 5], ["good service", "bad service", "slow repairs", "fast repairs", "no signal"], embed)
+    failing = {"bad service", "no signal"}
+
+    def analyze(texts, **kwargs):
+        return [None if text in failing else {"label": "Positive", "score": 0.5, "justification": "Fine."}
+                for text in texts]
+    monkeypatch.setattr(ai_services, "analyze_sentiments", analyze)
+
+    assert run_sentiment_stage(store, chunk_rows=2) == 3  # each row is tried once per run
+    assert store.pending_sentiments(10) == ([2, 5], ["bad service", "no signal"])
+
+    failing.clear()
+    assert run_sentiment_stage(store, chunk_rows=2) == 2
+    assert store.pending_sentiments(10) == ([], [])
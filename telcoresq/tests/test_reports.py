@@ -0,0 +1,34 @@
+import pandas as pd
+from telcoresq.app.services import database
+from telcoresq.app.services.reports import build_report
+
+def _labelled_store(store, embed):
+    store.sync([1, 2], ["slow repairs", "no signal"], embed, attributes=[{"region": "north"}, {"region": "south"}])
+    store.update_sentiments([1, 2], ["Negative", "Negative"], scores=[-0.5, -0.8], justifications=["Slow.", "Outage."])
+    return store
+
+def test_build_report_reuses_the_report_of_unchanged_results(store, embed, tmp_path):
+    _labelled_store(store, embed)
+
+    first = build_report(store, output_dir=tmp_path, formats=("markdown", "csv"))
+    second = build_report(store, output_dir=tmp_path, formats=("csv",))
+
+    assert not first["reused"] and second["reused"] and second["directory"] == first["directory"]
+    exported = pd.read_csv(first["files"]["responses.csv"])
+    assert exported["sentiment_justification"].tolist() == ["Slow.", "Outage."]
+
+def test_build_report_is_rebuilt_when_scores_justifications_or_attributes_change(store, embed, tmp_path):
+    _labelled_store(store, embed)
+    directories = {build_report(store, output_dir=tmp_path, formats=("csv",))["directory"]}
+
+    # None of these changes the per-group counts.
+    store.update_sentiments([1, 2], ["Negative", "Negative"], scores=[-0.5, -0.8], justifications=["Slow.", "Dropped."])
+    directories.add(build_report(store, output_dir=tmp_path, formats=("csv",))["directory"])
+    store.update_sentiments([1, 2], ["Negative", "Negative"], scores=[-0.6, -0.8], justifications=["Slow.", "Dropped."])
+    directories.add(build_report(store, output_dir=tmp_path, formats=("csv",))["directory"])
+    with store.engine.begin() as conn:
+        conn.execute(database.survey_responses.update().where(database.survey_responses.c.response_id == 1)
+                     .values(attributes={"region": "east"}))
+    report = build_report(store, output_dir=tmp_path, formats=("csv",))
+
+    assert not report["reused"] and len(directories | {report["directory"]}) == 4
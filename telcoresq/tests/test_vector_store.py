@@ -0,0 +1,137 @@
+import faiss
+import numpy as np
+import pytest
+from telcoresq.config import settings
+from telcoresq.app.services import database, vector_store
+from telcoresq.app.services.vector_store import (
+    SurveyVectorStore, _base_index, choose_index_type, create_faiss_index, estimate_index_memory, evaluate_recall,
+    get_index_ids, index_type_of, load_index_manifest
+)
+
+def _rows(start, stop):
+    return list(range(start, stop)), [f"response {i}" for i in range(start, stop)]
+
+def test_choose_index_type_trades_accuracy_for_memory_as_the_budget_tightens(monkeypatch):
+    monkeypatch.setattr(settings, "FAISS_FLAT_MAX_VECTORS", 10_000)
+    megabytes = lambda index_type: estimate_index_memory(index_type, 1_000_000, 384) / 1024 / 1024
+
+    assert choose_index_type(5_000, 384) == "flat"
+    assert choose_index_type(1_000_000, 384, memory_budget_mb=megabytes("hnsw")) == "hnsw"
+    assert choose_index_type(1_000_000, 384, memory_budget_mb=megabytes("ivf")) == "ivf"
+    assert choose_index_type(1_000_000, 384, memory_budget_mb=megabytes("ivf") - 1) == "ivfpq"
+
+@pytest.mark.parametrize("index_type", ["flat", "hnsw", "ivf", "ivfpq"])
+def test_create_faiss_index_keeps_ids_and_reaches_the_target_recall(index_type):
+    vectors = np.random.default_rng(0).normal(size=(12_000, 16)).astype(np.float32)
+    ids = np.arange(12_000, dtype=np.int64) * 10
+
+    index = create_faiss_index(vectors, ids=ids, index_type=index_type)
+
+    assert index_type_of(index) == index_type
+    assert index.search(vectors[5:6], 1)[1][0][0] == 50
+    if index_type != "ivfpq":  # PQ codes are lossy; its recall depends on the data
+        assert evaluate_recall(index, vectors) >= settings.FAISS_TARGET_RECALL
+
+def test_create_faiss_index_falls_back_to_ivf_when_pq_cannot_be_trained():
+    vectors = np.random.default_rng(0).normal(size=(2_000, 16)).astype(np.float32)
+    assert index_type_of(create_faiss_index(vectors, index_type="ivfpq")) == "ivf"
+    with pytest.raises(ValueError, match="Unknown index type"):
+        create_faiss_index(vectors, index_type="annoy")
+
+def test_sync_switches_index_type_when_the_corpus_outgrows_flat_search(store, embed, monkeypatch):
+    monkeypatch.setattr(settings, "FAISS_FLAT_MAX_VECTORS", 100)
+    store.sync(*_rows(0, 80), embed)
+    assert index_type_of(store.index) == "flat"
+
+    store.sync(*_rows(80, 300), embed, remove_missing=False)
+    assert index_type_of(store.index) == "hnsw"
+    assert sorted(store.manifest) == list(range(300)) and store.index.ntotal == 300
+
+def test_sync_retrains_ivf_indexes_that_outgrew_their_lists(store, embed):
+    store.sync(*_rows(0, 1000), embed, index_type="ivf")
+    trained_lists = _base_index(store.index).nlist
+    store.sync(*_rows(1000, 1200), embed, index_type="ivf", remove_missing=False)
+    assert store.refresh_index("ivf") is False  # a little growth keeps the trained lists
+
+    store.sync(*_rows(1200, 5000), embed, index_type="ivf", remove_missing=False)
+    assert index_type_of(store.index) == "ivf" and store.index.ntotal == 5000
+    assert _base_index(store.index).nlist >= 2 * trained_lists
+
+def test_an_index_saved_without_its_manifest_is_rebuilt_from_the_database(store, embed):
+    store.sync(*_rows(0, 50), embed)
+    # A save interrupted between its two renames: a newer index file next to the old manifest.
+    store.sync(*_rows(50, 80), embed, remove_missing=False, save=False)
+    faiss.write_index(store.index, store.index_path)
+    assert load_index_manifest(store.index_path) is None
+
+    reopened = SurveyVectorStore(engine=store.engine, index_path=store.index_path)
+    assert sorted(reopened.manifest) == list(range(80)) and reopened.index.ntotal == 80
+    assert load_index_manifest(store.index_path) == reopened.manifest
+
+def test_lexical_search_keeps_each_score_with_its_document(store, embed):
+    store.sync([1, 2, 3], ["tower 7 outage", "tower 7 outage again and again", "billing"], embed)
+    best, second = store.lexical_search("tower outage", k=3)
+    assert best["score"] != second["score"]
+    # A BM25 match whose row is gone from the database is skipped without shifting the other scores.
+    with store.engine.begin() as conn:
+        conn.execute(database.survey_responses.delete().where(database.survey_responses.c.response_id == best["response_id"]))
+    assert store.lexical_search("tower outage", k=3) == [second]
+
+def _recall_at_1(search, queries):
+    return sum(search(query)[0]["response_id"] == target for query, target in queries.items()) / len(queries)
+
+def test_hybrid_search_ranks_exact_id_matches_as_high_as_bm25(store, embed):
+    complaints = ["the outage at the tower lasted hours", "tower outage again and the signal dropped",
+                  "no signal near the tower during the outage", "billing was wrong after the outage"]
+    texts, queries = [], {}
+    for row in range(300):
+        text = complaints[row % len(complaints)]
+        if row % 5 == 0:
+            text = f"{text} at tower TWR-{row:06d}"
+            queries[f"What happened at tower TWR-{row:06d}?"] = row
+        texts.append(text)
+    store.sync(list(range(300)), texts, embed)
+    vectors = dict(zip(queries, embed(list(queries))))
+
+    bm25 = _recall_at_1(lambda query: store.lexical_search(query, k=1), queries)
+    hybrid = _recall_at_1(lambda query: store.hybrid_search(query, vectors[query], k=1), queries)
+    assert bm25 == 1.0 and hybrid >= bm25
+
+def test_sync_without_attributes_keeps_the_stored_ones(store, embed):
+    store.sync([1, 2], ["slow repairs", "no signal"], embed, attributes=[{"region": "north"}, {"region": "south"}])
+    store.sync([1, 2], ["slow repairs after the storm", "no signal"], embed)
+
+    assert store.matching_ids({"region": "north"}).tolist() == [1]
+    assert [document["attributes"] for document in store.get_documents([(1, None), (2, None)])] == [
+        {"region": "north"}, {"region": "south"}
+    ]
+
+def test_hnsw_changes_are_compacted_once_per_upload(store, embed, monkeypatch):
+    store.sync(*_rows(0, 200), embed, index_type="hnsw")
+    rebuilds = []
+    rebuild_without = vector_store._rebuild_without
+    monkeypatch.setattr(vector_store, "_rebuild_without", lambda *args: rebuilds.append(args) or rebuild_without(*args))
+
+    for start in range(0, 200, 50):  # one upload, chunk by chunk, changing a row in every chunk
+        ids, texts = _rows(start, start + 50)
+        texts[0] = f"{texts[0]} changed"
+        store.sync(ids, texts, embed, remove_missing=False, save=False)
+    store.delete([199])
+    assert not rebuilds
+    store.save()
+
+    assert len(rebuilds) == 1 and index_type_of(store.index) == "hnsw"
+    assert sorted(get_index_ids(store.index).tolist()) == list(range(199))
+    changed = embed(["response 50 changed"])[0]
+    assert store.search(changed, k=1)[0]["response_id"] == 50
+
+def test_vectors_of_another_embedding_model_are_dropped_and_embedded_again(store, embed):
+    store.sync(*_rows(0, 20), embed)
+
+    reopened = SurveyVectorStore(engine=store.engine, index_path=store.index_path, embedding_model="local:other-model")
+    assert reopened.index is None and reopened.manifest == {}
+    assert len(database.load_embedding_matrix(store.engine)[0]) == 0
+
+    stats = reopened.sync(*_rows(0, 20), embed)
+    assert stats["added"] == 20 and reopened.index.ntotal == 20
+    assert reopened.load_artifact("embedding_model") == "local:other-model"